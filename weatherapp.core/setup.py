@@ -12,7 +12,7 @@ setup(
                         RegEx, error handling, logging, packaging, stdin/out, and testing""",
     packages=find_packages(),
     entry_points={
-        'console_scripts': 'wfapp=weatherapp.core.app:main'
+        'console_scripts': 'wfapp=weatherapp.core.client:main'
     },
     install_requires=[
         'requests',
@@ -3,24 +3,109 @@
     Command: command class
     WeatherProvider: provider class, child of Command
     Formatter: print-out class
+    parse_fallback: scraper decorator, parses full page if block fails
 """
 
-from urllib.request import urlopen, Request
 from urllib.parse import quote, unquote
 from urllib import parse
-from bs4 import BeautifulSoup
+from urllib.error import URLError
+from concurrent.futures import ThreadPoolExecutor
 from html import escape, unescape
 
-import os
+import sys
 import abc
-import pathlib
 import hashlib
 import time
 import argparse
-import configparser
 import logging
+import json
+import re
+import importlib.util
+import functools
+import threading
 
 from config import config
+from managers.transport import get_transport, background
+from managers.cache import get_cache
+from managers.catalog import get_catalog, make_key
+from managers.search import TrigramIndex
+
+_refresh_executor = None  # threads refreshing expired pages
+_refreshing = set()  # URLs being refreshed
+_refreshing_lock = threading.Lock()
+_browse_executor = None  # threads loading locations during browsing
+
+# force_reload value of background loads: page is loaded now, but
+# by conditional request, and whole, so it is cached
+REVALIDATE = 'revalidate'
+
+# errors of scraper which did not find data on the page
+SCRAPE_ERRORS = (AttributeError, IndexError, KeyError, TypeError, ValueError)
+
+# provider page addresses and suffixes of their caching time options
+ENDPOINTS = (('URL', ''), ('URL_hourly', '_hourly'),
+             ('URL_next_day', '_next_day'), ('URL_locations', '_locations'))
+
+# parser for page blocks, lxml is faster if installed
+if importlib.util.find_spec('lxml') is not None:
+    FAST_PARSER = 'lxml'
+else:
+    FAST_PARSER = 'html.parser'
+
+
+def parse_fallback(func):
+    """ Runs provider scraper on partially parsed page
+        Page is parsed only in blocks declared in provider 'parse_only'.
+        If scraping fails there, it is repeated on fully parsed page
+    """
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        self.parse_block = func.__name__
+        try:
+            return func(self, *args, **kwargs)
+        except SCRAPE_ERRORS:
+            if self.full_parse or func.__name__ not in self.parse_only:
+                raise
+            self.logger.debug(f'{func.__name__}: block not found, '
+                              'parsing full page')
+            self.full_parse = True
+            return func(self, *args, **kwargs)
+        finally:
+            self.parse_block = None
+            self.full_parse = False
+    return wrapper
+
+
+def get_browse_executor():
+    """ Returns thread pool loading locations while user browses them
+        :rtype: ThreadPoolExecutor
+    """
+
+    global _browse_executor
+
+    with _refreshing_lock:
+        if _browse_executor is None:
+            _browse_executor = ThreadPoolExecutor(
+                max_workers=config.BROWSE_WORKERS)
+
+    return _browse_executor
+
+
+def get_refresh_executor():
+    """ Returns thread pool for background refresh of cached pages
+        Python waits for its threads at exit, so refresh is finished
+        after output is shown
+        :rtype: ThreadPoolExecutor
+    """
+
+    global _refresh_executor
+
+    with _refreshing_lock:
+        if _refresh_executor is None:
+            _refresh_executor = ThreadPoolExecutor(max_workers=2)
+
+    return _refresh_executor
 
 
 class Manager(abc.ABC):
@@ -71,7 +156,23 @@ class Command(abc.ABC):
 
 
 class WeatherProvider(Command):
-    """ WeatherProvider abstract class """
+    """ WeatherProvider abstract class
+        attributes:
+        location_levels: # names of location levels, e.g. 'country'
+        parse_only:  # {scraper name: (tag name, attrs)} of page block
+                     # the scraper needs, other blocks are not parsed
+        end_markers: # {scraper name: [(tag name, attrs regex)]} of blocks
+                     # to load when streaming, the rest of page is dropped
+        parser_version: # version of scrapers, increase it when they are
+                        # changed, so results cached before are not used
+    """
+
+    location_levels = ['continent', 'country', 'region', 'city']
+    parse_only = {}
+    end_markers = {}
+    parser_version = 1
+    parse_block = None  # scraper running now
+    full_parse = False  # parse full page even if block is declared
 
     def __init__(self, app):
         """ Initialize Provider
@@ -80,20 +181,44 @@ class WeatherProvider(Command):
 
         super().__init__(app)
 
+        self.documents = {}  # pages loaded in this run by URL
+        self.soups = {}  # parsed pages by page and parser
+        self.truncated = set()  # URLs of pages cut after end markers
+        self.page_times = {}  # (load time, validators) of pages by URL
+        self.stale_pages = set()  # URLs of expired pages shown from cache
         self.initiate()  # set Provider vars from config
 
+    @property
+    def stale(self):
+        """ True if expired page from cache is shown in this run """
+
+        return bool(self.stale_pages)
+
     def initiate(self):
         """ Sets instance variables from config """
 
         for item in config.WEATHER_PROVIDERS[self.title]:
             self.__setattr__(item, config.WEATHER_PROVIDERS[self.title][item])
 
+        self.link_pages()
+
+        self.logger = self._get_logger(self.title, self.app.args.verbosity)
+
+    def link_pages(self):
+        """ Sets hourly and next day pages of providers
+            showing all weather info on one page
+        """
+
         # RP5 and Sinoptik have same URLs for hourly and next day weather info
         if self.title in ('RP5', 'Sinoptik'):
             self.URL_hourly = self.URL
             self.URL_next_day = self.URL
 
-        self.logger = self._get_logger(self.title, self.app.args.verbosity)
+    @property
+    def transport(self):
+        """ HTTP transport shared by providers """
+
+        return get_transport()
 
     @staticmethod
     def _get_logger(title, verbose_lvl):
@@ -117,79 +242,511 @@ class WeatherProvider(Command):
         fmt = logging.Formatter(
             '%(asctime)s %(name)s %(levelname)s %(message)s')
         console.setFormatter(fmt)
-        logger.addHandler(console)
+        if not logger.handlers:  # provider may be created many times
+            logger.addHandler(console)
 
         return logger
 
-    def get_raw_page(self, URL, force_reload=False):
+    @property
+    def streaming(self):
+        """ True if pages should be loaded only up to end markers """
+
+        return bool(self.app.args.stream or config.WEATHER_PROVIDERS['App']
+                    .get('Streaming', config.STREAMING))
+
+    def get_raw_page(self, URL, force_reload=False, end_markers=None):
         """ Loads a page from given URL
             :param URL: web page address
             :param force_reload: load from web if True or from cache instead
+            :param end_markers: blocks to load, the rest of page is dropped
             :return PAGE: loaded web page
             :rtype: string
         """
 
-        if not self.valid_cache(URL) or force_reload:
+        entry = self.cache.load(URL)  # page, its time and validators
+        self.stale_pages.discard(URL)
 
-            HEAD = {'User-Agent':
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:63.0) Gecko/201'}
-            INFO_REQUEST = Request(URL, headers=HEAD)
-            PAGE = urlopen(INFO_REQUEST).read()
+        if force_reload or not self.fresh_entry(entry):
 
-            self.save_cache(PAGE, URL)
+            if not force_reload and self.stale_entry(entry):
+                # show old page now, next run will get the new one
+                PAGE = entry.page
+                self.stale_pages.add(URL)
+                self.refresh_in_background(URL)
+            else:
+                try:
+                    PAGE = self.fetch_page_once(URL, force_reload,
+                                                end_markers, entry)
+                except URLError as err:  # provider is down
+                    if not self.stale_if_error or entry is None:
+                        raise
+                    self.logger.warning(f'{URL} is not loaded ({err}), '
+                                        'old page from cache is used')
+                    PAGE = entry.page
+                    self.stale_pages.add(URL)
 
         else:
-            PAGE = self.load_cache(URL)
+            PAGE = entry.page
+            validators = entry.validators
+            if 'Digest' not in validators:  # page cached by older version
+                validators = dict(validators, Digest=self.get_digest(PAGE))
+            self.page_times[URL] = (entry.time, validators)
 
-        PAGE = str(PAGE, encoding='utf-8')
+        # cut page may end in the middle of a character
+        errors = 'ignore' if URL in self.truncated else 'strict'
+        PAGE = str(PAGE, encoding='utf-8', errors=errors)
 
         return PAGE
 
-    def get_cache_file_path(self, URL):
-        """ Gets cache file full path
-            :param URL:  web page address
-            :return: cache file path
-            :rtype: pathlib.Path
+    def fetch_page(self, URL, force_reload=False, end_markers=None,
+                   entry=None):
+        """ Loads a page from web and saves it to cache
+            Cached page is revalidated by conditional request
+            :param URL: web page address
+            :param force_reload: load full page, do not revalidate,
+                                 cached page is revalidated if REVALIDATE
+            :param end_markers: blocks to load, the rest of page is dropped
+            :param entry: cached page, looked up if not given
+            :return: loaded web page
+            :rtype: bytes
+        """
+
+        reload_full = force_reload and force_reload != REVALIDATE
+
+        if entry is None and not reload_full:
+            entry = self.cache.load(URL)
+
+        # ask server to send page only if it was changed
+        headers = {} if reload_full else self.get_validators(entry)
+        response = self.transport.request(URL, headers,
+                                          end_markers=end_markers)
+
+        if response.status == 304:  # not modified, cache is still good
+            validators = self.refresh_cache(entry, response.headers, URL)
+            if validators is None:  # page was pruned in the meantime
+                self.logger.info(f'{URL} was removed from cache, '
+                                 'loading it again')
+                return self.fetch_page(URL, True, end_markers)
+            PAGE = entry.page
+        elif response.truncated:  # part of page is not for cache
+            validators = self.parse_validators(response.headers)
+            PAGE = response.body
+            validators['Digest'] = self.get_digest(PAGE)
+            self.truncated.add(URL)
+            self.logger.info(f'{URL} cut after needed blocks: '
+                             f'{response.wire_size} bytes received')
+        else:
+            PAGE = response.body
+            self.logger.info(f'{URL} loaded: {response.wire_size} bytes '
+                             f'received, page is {len(PAGE)} bytes')
+            validators = self.save_cache(PAGE, URL, response.headers,
+                                         entry)
+
+        self.page_times[URL] = (time.time(), validators)
+
+        return PAGE
+
+    def fetch_page_once(self, URL, force_reload=False, end_markers=None,
+                        entry=None):
+        """ Loads a page from web, one process at a time
+            Processes sharing cache take a lease of the page URL,
+            the others wait for it and take the page from cache.
+            Expired page is shown if waiting takes too long
+            :param URL: web page address
+            :param force_reload: load full page, do not revalidate,
+                                 cached page is revalidated if REVALIDATE
+            :param end_markers: blocks to load, the rest of page is dropped
+            :param entry: cached page
+            :return: loaded web page
+            :rtype: bytes
+        """
+
+        options = config.WEATHER_PROVIDERS['App']
+        reload_full = force_reload and force_reload != REVALIDATE
+
+        with self.cache.lease(URL, options.get('Lease_time',
+                                               config.LEASE_TIME)) as lease:
+            if lease.acquire(options.get('Lease_wait', config.LEASE_WAIT)):
+                if lease.waited and not reload_full:
+                    # page may be just loaded by other process
+                    entry = self.cache.load(URL)
+                    if self.fresh_entry(entry):
+                        self.page_times[URL] = (entry.time, entry.validators)
+                        return entry.page
+                return self.fetch_page(URL, force_reload, end_markers, entry)
+
+        if entry is not None:  # other process is still loading the page
+            self.logger.warning(f'{URL} is being loaded by other process, '
+                                'old page from cache is used')
+            self.stale_pages.add(URL)
+            return entry.page
+
+        return self.fetch_page(URL, force_reload, end_markers, entry)
+
+    def refresh_in_background(self, URL):
+        """ Reloads cached page in background thread
+            Each URL is refreshed by one thread at a time
+            :param URL: web page address
+            :return: refresh future or None if page is being refreshed
+            :rtype: concurrent.futures.Future
+        """
+
+        with _refreshing_lock:
+            if URL in _refreshing:
+                return None
+            _refreshing.add(URL)
+
+        def refresh():
+            try:
+                with self.cache.lease(URL) as lease, background():
+                    # skip if other process is refreshing the page
+                    if lease.acquire():
+                        self.fetch_page(URL)
+            except Exception as err:
+                self.logger.warning(f'{URL} is not refreshed: {err}')
+            finally:
+                with _refreshing_lock:
+                    _refreshing.discard(URL)
+
+        return get_refresh_executor().submit(refresh)
+
+    @property
+    def stale_time(self):
+        """ Time after caching time when old page may be shown, seconds """
+
+        return config.WEATHER_PROVIDERS['App'].get(
+            'Stale_time', config.STALE_TIME) * 60
+
+    @property
+    def stale_if_error(self):
+        """ True if old page may be shown when provider is down """
+
+        return bool(config.WEATHER_PROVIDERS['App'].get(
+            'Stale_if_error', config.STALE_IF_ERROR))
+
+    def load_page(self, URL, force_reload=False, scrapers=()):
+        """ Loads a page to self.raw_page
+            Each URL is loaded once per run, next calls take the same page
+            :param URL: web page address
+            :param force_reload: load from web if True or from cache instead,
+                                 REVALIDATE to revalidate whole page
+            :param scrapers: scrapers to run on the page, when streaming
+                             page is loaded up to their end markers
+            :return: loaded web page
+            :rtype: string
+        """
+
+        end_markers = None
+
+        # streaming is possible only if all scrapers have markers,
+        # pages loaded for cache are not cut
+        if self.streaming and force_reload != REVALIDATE and scrapers and \
+                all(item in self.end_markers for item in scrapers):
+            end_markers = [marker for item in scrapers
+                           for marker in self.end_markers[item]]
+
+        if URL not in self.documents:
+            self.documents[URL] = \
+                self.get_raw_page(URL, force_reload, end_markers)
+        self.raw_page = self.documents[URL]
+
+        return self.raw_page
+
+    def scrape(self, URL, scraper, force_reload=False, scrapers=()):
+        """ Loads page and runs scraper on it
+            If scraper fails on a page cut after end markers,
+            full page is loaded and scraped again
+            :param URL: web page address
+            :param scraper: scraper name, e.g. 'get_info'
+            :param force_reload: load from web if True or from cache instead,
+                                 REVALIDATE to revalidate whole page
+            :param scrapers: all scrapers to run on the page
+            :return: weather info
+            :rtype: dict
+        """
+
+        if not force_reload:
+            weather_info = self.load_result(URL, scraper)
+            if weather_info is not None:  # page is not even loaded
+                return weather_info
+
+        self.load_page(URL, force_reload, scrapers or [scraper])
+
+        # reloaded page is often the same, then so is the result
+        weather_info = self.reuse_result(URL, scraper)
+        if weather_info is not None:
+            self.save_result(URL, scraper, weather_info)
+            return weather_info
+
+        try:
+            weather_info = getattr(self, scraper)()
+        except SCRAPE_ERRORS:
+            if URL not in self.truncated:
+                raise
+            self.logger.debug(f'{scraper}: cut page is not enough, '
+                              'loading full page')
+            self.truncated.discard(URL)
+            del self.documents[URL]
+            self.load_page(URL, force_reload)
+            weather_info = getattr(self, scraper)()
+
+        self.save_result(URL, scraper, weather_info)
+
+        return weather_info
+
+    def get_result_key(self, URL, scraper):
+        """ Gets cache key of scraper result
+            :param URL: address of scraped page
+            :param scraper: scraper name, e.g. 'get_info'
+            :rtype: string
+        """
+
+        return f'result:{self.title}:{scraper}:{self.parser_version}:{URL}'
+
+    def load_result(self, URL, scraper):
+        """ Loads scraper result from cache
+            Result expires together with the page it was taken from
+            :param URL: address of scraped page
+            :param scraper: scraper name, e.g. 'get_info'
+            :return: weather info or None if there is no valid result
+            :rtype: dict
+        """
+
+        entry = self.cache.load(self.get_result_key(URL, scraper))
+
+        if not self.fresh_entry(entry, URL):
+            return None
+
+        self.logger.debug(f'{scraper}: result for {URL} taken from cache')
+
+        return json.loads(str(entry.page, encoding='utf-8'))
+
+    def reuse_result(self, URL, scraper):
+        """ Takes previous scraper result if the page is not changed
+            Page digest is compared with digest of the page
+            the result was taken from
+            :param URL: address of loaded page
+            :param scraper: scraper name, e.g. 'get_info'
+            :return: weather info or None if page is changed
+            :rtype: dict
         """
 
-        filename = hashlib.md5(URL.encode('utf-8')).hexdigest() + '.wbc'
-        path = pathlib.Path(config.WEATHER_PROVIDERS['App']['Cache_path'])
-        cache_file_path = path.joinpath(filename)
+        if URL in self.stale_pages or URL not in self.page_times:
+            return None
+
+        digest = self.page_times[URL][1].get('Digest')
+        entry = self.cache.load(self.get_result_key(URL, scraper))
+
+        if digest is None or entry is None or \
+                entry.validators.get('Digest') != digest:
+            return None
+
+        self.logger.debug(f'{scraper}: {URL} is not changed, '
+                          'previous result is used')
+
+        return json.loads(str(entry.page, encoding='utf-8'))
+
+    def save_result(self, URL, scraper, weather_info):
+        """ Saves scraper result to cache with time of its page
+            Results of expired pages shown while refreshed are not saved
+            :param URL: address of scraped page
+            :param scraper: scraper name, e.g. 'get_info'
+            :param weather_info: scraper result
+        """
+
+        if URL in self.stale_pages or URL not in self.page_times:
+            return
+
+        page_time, validators = self.page_times[URL]
+        data = json.dumps(weather_info, ensure_ascii=False).encode('utf-8')
+
+        self.cache.save(self.get_result_key(URL, scraper), data, validators,
+                        page_time)
+
+    def get_soup(self, features='html.parser'):
+        """ Parses self.raw_page with BeautifulSoup
+            Each page is parsed once, get_info, get_hourly and get_next_day
+            of the same page share the parsed tree.
+            If running scraper declared its block in 'parse_only',
+            only that block is parsed, with lxml if it is installed
+            :param features: parser to use for full page
+            :return: parsed page
+            :rtype: BeautifulSoup
+        """
+
+        from bs4 import BeautifulSoup, SoupStrainer  # loaded on first parse
+
+        block = None if self.full_parse else self.parse_block
+        spec = self.parse_only.get(block)
+
+        if spec is None:  # full page
+            key = (self.raw_page, features, None)
+            if key not in self.soups:
+                self.soups[key] = BeautifulSoup(self.raw_page, features)
+        else:
+            key = (self.raw_page, FAST_PARSER, block)
+            if key not in self.soups:
+                self.soups[key] = BeautifulSoup(
+                    self.raw_page, FAST_PARSER, parse_only=SoupStrainer(*spec))
+
+        return self.soups[key]
 
-        return cache_file_path
+    @property
+    def cache(self):
+        """ Cache backend shared by providers """
 
-    def save_cache(self, data, URL):
-        """ Saves data to cache file in cache directory
-            located in application directory
+        return get_cache()
+
+    def save_cache(self, data, URL, headers=None, entry=None):
+        """ Saves data to cache
             :param data: loaded web page
             :param URL: web url of loaded page
+            :param headers: response headers with page validators
+            :param entry: page cached before, to count its changes
+            :return: validators and digest of the page
+            :rtype: dict
         """
 
-        cache_file = self.get_cache_file_path(URL)
+        validators = self.parse_validators(headers)
+        validators['Digest'] = self.get_digest(data)
+        self.track_changes(URL, validators, entry)
 
-        if cache_file.parent.exists():
-            with open(cache_file, 'wb') as f:
-                f.write(data)
-        else:
-            os.mkdir(cache_file.parent)
-            with open(cache_file, 'wb') as f:
-                f.write(data)
+        self.cache.save(URL, data, validators)
+
+        return validators
+
+    @staticmethod
+    def get_digest(data):
+        """ Gets digest of page content
+            :param data: web page
+            :return: SHA-1 hex digest
+            :rtype: string
+        """
+
+        return hashlib.sha1(data).hexdigest()
+
+    @staticmethod
+    def parse_validators(headers):
+        """ Takes page validators from response headers
+            :param headers: response headers
+            :return: ETag, Last-Modified and max-age of Cache-Control
+            :rtype: dict
+        """
+
+        validators = {}
+
+        if headers is None:
+            return validators
+
+        for key in ('ETag', 'Last-Modified'):
+            if headers.get(key):
+                validators[key] = headers.get(key)
+        max_age = re.search(r'max-age=(\d+)',
+                            headers.get('Cache-Control') or '')
+        if max_age is not None:
+            validators['Max-age'] = int(max_age.group(1))
+
+        return validators
+
+    def load_validators(self, URL):
+        """ Loads validators of cached page
+            :param URL: url of saved in cache web page
+            :return: ETag, Last-Modified and Max-age if there are any
+            :rtype: dict
+        """
+
+        entry = self.cache.load(URL)
+
+        return {} if entry is None else entry.validators
+
+    @staticmethod
+    def get_validators(entry):
+        """ Gets headers for conditional request of cached page
+            :param entry: cached page
+            :return: If-None-Match and If-Modified-Since headers
+            :rtype: dict
+        """
+
+        headers = {}
+
+        if entry is None:
+            return headers
+
+        if 'ETag' in entry.validators:
+            headers['If-None-Match'] = entry.validators['ETag']
+        if 'Last-Modified' in entry.validators:
+            headers['If-Modified-Since'] = entry.validators['Last-Modified']
+
+        return headers
+
+    def refresh_cache(self, entry, headers, URL=None):
+        """ Marks cached page as just loaded
+            Used when server answers that page was not modified
+            :param entry: cached page
+            :param headers: response headers with new validators
+            :param URL: web page address, entry URL if None
+            :return: validators of the page,
+                     None if page is not in cache anymore
+            :rtype: dict
+        """
+
+        # 304 response may have only some of validators, keep the others
+        validators = dict(entry.validators)
+        validators.update(self.parse_validators(headers))
+        if 'Digest' not in validators:  # page cached by older version
+            validators['Digest'] = self.get_digest(entry.page)
+        self.track_changes(URL or entry.URL, validators, entry)
+
+        if not self.cache.touch(entry.URL, validators):
+            return None
+
+        return validators
+
+    @property
+    def adaptive_ttl(self):
+        """ True if caching time is adapted to page changes """
+
+        return bool(config.WEATHER_PROVIDERS['App'].get(
+            'Adaptive_TTL', config.ADAPTIVE_TTL))
+
+    def track_changes(self, URL, validators, entry):
+        """ Counts checks and changes of the page, adapts caching time
+            Adaptive caching time grows while page is the same
+            and is halved when page is changed, within TTL_min and TTL_max
+            :param URL: web page address
+            :param validators: validators of loaded page, updated in place
+            :param entry: page cached before or None
+        """
+
+        previous = {} if entry is None else entry.validators
+        changed = entry is not None and \
+            previous.get('Digest') != validators.get('Digest')
+
+        validators['Checks'] = previous.get('Checks', 0) + 1
+        validators['Changes'] = previous.get('Changes', 0) + int(changed)
+
+        if not self.adaptive_ttl:
+            return
+
+        options = config.WEATHER_PROVIDERS['App']
+        ttl_min = options.get('TTL_min', config.TTL_MIN) * 60
+        ttl_max = options.get('TTL_max', config.TTL_MAX) * 60
+        ttl = previous.get('TTL', self.get_endpoint_caching_time(URL))
+
+        if entry is not None:
+            ttl = ttl / 2 if changed else ttl * 1.5
+        validators['TTL'] = int(min(max(ttl, ttl_min), ttl_max))
 
     def get_cache_time(self, URL):
-        """ Gets cache file creating time
+        """ Gets time page was cached
             :param URL: loaded web page url
             :return: cache creating time
             :rtype: time
         """
 
-        cache_file = self.get_cache_file_path(URL)
-
-        if cache_file.exists():
-            cache_time = cache_file.stat().st_mtime
-        else:
-            cache_time = 0
+        entry = self.cache.load(URL)
 
-        return cache_time
+        return 0 if entry is None else entry.time
 
     def load_cache(self, URL):
         """ Loads cache for given URL
@@ -198,12 +755,9 @@ class WeatherProvider(Command):
             :rtype: bytes
         """
 
-        cache_file = self.get_cache_file_path(URL)
+        entry = self.cache.load(URL)
 
-        with open(cache_file, 'rb') as f:
-            PAGE = f.read()
-
-        return PAGE
+        return None if entry is None else entry.page
 
     def valid_cache(self, URL):
         """ Validates cache
@@ -211,19 +765,94 @@ class WeatherProvider(Command):
             :rtype: boolean
         """
 
-        cache_file = self.get_cache_file_path(URL)
+        return self.fresh_entry(self.cache.load(URL))
 
-        if cache_file.exists():
-            cache_time = cache_file.stat().st_mtime
-            if time.time() < self.get_cache_time(URL) + self.Caching_time * 60:
-                cache_valid = True
-            else:
-                cache_valid = False
+    def fresh_entry(self, entry, URL=None):
+        """ Checks if cached page is not expired
+            :param entry: cached page or None
+            :param URL: address of the page, entry URL if None
+            :rtype: boolean
+        """
 
-        else:
-            cache_valid = False
+        if entry is None:
+            return False
 
-        return cache_valid
+        return time.time() < entry.time + self.get_caching_time(entry, URL)
+
+    def get_endpoint_caching_time(self, URL):
+        """ Gets configured caching time of provider page
+            URL, URL_hourly, URL_next_day and URL_locations pages
+            may have own caching time, e.g. Caching_time_next_day,
+            other pages use Caching_time
+            :param URL: web page address
+            :return: caching time, seconds
+            :rtype: int
+        """
+
+        minutes = None
+
+        for attribute, suffix in ENDPOINTS:
+            if URL == getattr(self, attribute, None):
+                minutes = getattr(self, 'Caching_time' + suffix, None)
+                break
+
+        if minutes is None:
+            minutes = self.Caching_time
+
+        return minutes * 60
+
+    def get_caching_time(self, entry, URL=None):
+        """ Gets time cached page is valid
+            Adaptive caching time replaces configured one if it is on.
+            Server may allow to keep page longer than caching time
+            :param entry: cached page
+            :param URL: address of the page, entry URL if None
+            :return: caching time, seconds
+            :rtype: int
+        """
+
+        caching_time = self.get_endpoint_caching_time(URL or entry.URL)
+        if self.adaptive_ttl and 'TTL' in entry.validators:
+            caching_time = entry.validators['TTL']
+        max_age = entry.validators.get('Max-age', 0)
+
+        return max(caching_time, max_age)
+
+    def get_cache_report(self):
+        """ Gets caching time and changes of provider pages
+            :return: (page attribute, caching time in seconds,
+                     checks, changes) of each cached page
+            :rtype: list
+        """
+
+        report = []
+        URLs = set()
+
+        for attribute, suffix in ENDPOINTS:
+            URL = getattr(self, attribute, None)
+            if URL is None or URL in URLs:  # same page for some endpoints
+                continue
+            URLs.add(URL)
+            entry = self.cache.load(URL)
+            if entry is not None:
+                report.append((attribute, self.get_caching_time(entry),
+                               entry.validators.get('Checks', 0),
+                               entry.validators.get('Changes', 0)))
+
+        return report
+
+    def stale_entry(self, entry):
+        """ Checks if expired page may be shown while it is refreshed
+            :param entry: cached page or None
+            :return: True if page expired less than stale time ago
+            :rtype: boolean
+        """
+
+        if not self.stale_time or entry is None:
+            return False
+
+        return time.time() < entry.time + \
+            self.get_caching_time(entry) + self.stale_time
 
     def get_instance_variables(self):
         """ Returns instance variables
@@ -233,7 +862,9 @@ class WeatherProvider(Command):
         inst_variables = {}
 
         for item in self.__dict__:
-            if item in ['raw_page', 'app']:  # exceptions
+            if item in ['raw_page', 'app', 'documents', 'soups',
+                        'parse_block', 'full_parse',
+                        'truncated', 'stale', 'page_times']:  # exceptions
                 pass
             else:
                 inst_variables[item] = self.__getattribute__(item)
@@ -281,15 +912,146 @@ class WeatherProvider(Command):
         """
         pass
 
-    @abc.abstractmethod
-    def browse_location(self, level=0, URL_location=None):
-        """ Browse locations of weather provider
+    def get_locations(self, level=0, URL_location=None):
+        """ Gets locations of given level
+            :param level: location level, index in location_levels
+            :param URL_location: page of locations, URL_locations by default
+            :return: location names with their pages
+            :rtype: dict
+
+            Should be overriden
+        """
+
+        return {}
+
+    def browse_location(self, level=0, URL_location=None,
+                        locations_list=None):
+        """ Browse recursively locations of weather provider
+            Starts from the first of location_levels,
+            each next call with new URL and level + 1.
+            While user reads the list, locations of listed locations
+            are loaded in background, so the next list is shown at once
             :param level: location level. Increases from '0' - continents to
-                                                                    '4' - city
+                                                                    '3' - city
             :param URL_location: web page to browse location if needed
-            Should be overriden
+            :param locations_list: locations of URL_location if loaded
+            :return: URLs and Location
+            :rtype: dict
+        """
+
+        if locations_list is None:
+            locations_list = self.get_locations(level, URL_location)
+        last_level = len(self.location_levels) - 1
+
+        for item in locations_list:  # print out locations
+            self.app.stdout.write(f"{item}\n")
+
+        prefetched = {}
+        if level < last_level:
+            prefetched = self.prefetch_locations(level + 1, locations_list)
+
+        choice = input(f"\nEnter {self.location_levels[level]} name:\n")
+
+        if choice not in locations_list:
+            choice = self.suggest_location(choice, list(locations_list))
+
+        chosen = prefetched.pop(choice, None)
+        for job in prefetched.values():  # not needed anymore
+            job.cancel()
+
+        if choice not in locations_list:
+            self.logger.error(
+                'Wrong name entered. ' +
+                'Please, restart application and try again')
+            sys.exit()
+
+        # call this function again with new locations
+        if level < last_level:
+            return self.browse_location(level+1, locations_list[choice],
+                                        self.take_prefetched(chosen))
+
+        # end of browsing
+        return self.make_location_set(choice, locations_list[choice])
+
+    def get_location_ancestry(self):
+        """ Gets names of current location and its upper locations
+            Names are taken from catalog of locations
+            :return: location names
+            :rtype: set
         """
 
+        if not self.Location:
+            return set()
+
+        for location in get_catalog().find(self.Location, self.title):
+            if location.key == make_key(self.Location):
+                return set(location.path.split(' / ')) | {location.name}
+
+        return {self.Location}
+
+    def prefetch_locations(self, level, locations_list):
+        """ Loads locations of listed locations in background
+            Upper locations of current location are loaded first,
+            then listed ones in order, up to Browse_prefetch pages
+            :param level: level of locations to load
+            :param locations_list: listed locations with their pages
+            :return: jobs of get_locations by location name
+            :rtype: dict
+        """
+
+        limit = int(config.WEATHER_PROVIDERS['App'].get(
+            'Browse_prefetch', config.BROWSE_PREFETCH))
+        if limit <= 0:
+            return {}
+
+        ancestry = self.get_location_ancestry()
+        names = sorted(locations_list, key=lambda name: name not in ancestry)
+        executor = get_browse_executor()
+
+        def load(URL):
+            with background():  # user's own requests go first
+                return self.get_locations(level, URL)
+
+        return {name: executor.submit(load, locations_list[name])
+                for name in names[:limit]}
+
+    def take_prefetched(self, job):
+        """ Takes locations loaded in background
+            :param job: job of get_locations or None
+            :return: locations or None if they are not loaded
+            :rtype: dict
+        """
+
+        if job is None or job.cancelled():
+            return None
+
+        try:
+            return job.result()
+        except Exception as err:  # load them again
+            self.logger.debug(f"Prefetch of locations failed: {err}")
+            return None
+
+    def suggest_location(self, choice, names):
+        """ Suggests locations with names similar to wrong one
+            :param choice: entered name
+            :param names: names of listed locations
+            :return: chosen name or None
+            :rtype: string
+        """
+
+        found = TrigramIndex(names).search(choice, limit=5)
+        if not found:
+            return None
+
+        self.app.stdout.write('Did you mean:\n')
+        for number, (score, name_number) in enumerate(found):
+            self.app.stdout.write(f"{number} - {names[name_number]}\n")
+
+        try:
+            return names[found[int(input('Enter number:\n'))][1]]
+        except (ValueError, IndexError):
+            return None
+
     @abc.abstractmethod
     def set_location(self, location_set):
         """ Sets to the config location
@@ -297,6 +1059,83 @@ class WeatherProvider(Command):
             Should be overriden
         """
 
+    def make_location_set(self, location, URL):
+        """ Makes location set from location page
+            :param location: location name
+            :param URL: current weather page of the location
+            :return: URLs and Location for set_location
+            :rtype: dict
+        """
+
+        return {'URL': URL, 'Location': location}
+
+    def resolve_location(self, location, URL=None):
+        """ Finds pages of location without browsing
+            :param location: location name
+            :param URL: current weather page of the location, if known
+            :return: location set for set_location or None if not found
+            :rtype: dict
+        """
+
+        if URL is not None:
+            return self.make_location_set(location, URL)
+
+        if location == self.Location:
+            return self.make_location_set(location, self.URL)
+
+        URL = get_catalog().get(location, self.title)
+        if URL is not None:
+            return self.make_location_set(location, URL)
+
+        return None
+
+    def find_location(self):
+        """ Finds location by name in catalog of locations
+            Name may be the beginning of location name in any case,
+            similar names are searched if there is no such location.
+            If several locations are found, user chooses one of them
+            :return: location set or None to browse locations
+            :rtype: dict
+        """
+
+        catalog = get_catalog()
+        if not catalog.exists():
+            return None
+
+        name = input('Enter location name or press Enter to browse:\n')
+        if not name.strip():
+            return None
+
+        locations = catalog.find(name, self.title, limit=20) or \
+            [location for score, location
+             in catalog.search(name, self.title, limit=10)]
+        if not locations:
+            self.app.stdout.write('Location is not found in catalog\n')
+            return None
+
+        exact = [location for location in locations
+                 if location.key == make_key(name)]
+        if len(exact) == 1 or len(locations) == 1:
+            location = (exact or locations)[0]
+        else:
+            for number, location in enumerate(locations):
+                self.app.stdout.write(
+                    f"{number} - {location.name} ({location.path})\n")
+            try:
+                location = locations[int(input('Enter number:\n'))]
+            except (ValueError, IndexError):
+                return None
+
+        return self.make_location_set(location.name, location.URL)
+
+    def use_location(self, location_set):
+        """ Switches provider to other location, config is not changed
+            :param location_set: URLs and Location
+        """
+
+        self.set_location(location_set)
+        self.link_pages()
+
     def config_location(self):
         """ Configurate location
             Runs browse_location recursively and saves to config
@@ -307,8 +1146,8 @@ class WeatherProvider(Command):
         self.app.stdout.write(f"{self.Location}\n")
         self.app.stdout.write('\n')
 
-        # choose new location
-        location_set = self.browse_location()
+        # find new location by name or choose it
+        location_set = self.find_location() or self.browse_location()
         self.set_location(location_set)
 
         # save location to the config
@@ -316,8 +1155,10 @@ class WeatherProvider(Command):
                                     self.get_instance_variables(),
                                     config.WEATHER_PROVIDERS)
 
-    def get_cli_args(self):
-        """ Parse Provider arguments """
+    def get_cli_args(self, argv=None):
+        """ Parse Provider arguments
+            :param argv: Provider arguments, App remaining args by default
+        """
 
         parser = argparse.ArgumentParser()
         parser.add_argument("-next", help="Next day forecast",
@@ -331,10 +1172,30 @@ class WeatherProvider(Command):
                             action='store_false')  # Provider option
         parser.add_argument("-refresh", help="Force reloading pages",
                             action="store_true")  # Provider option
-        self.args = parser.parse_args(self.app.remaining_args)
+        if argv is None:
+            argv = self.app.remaining_args
+        self.args = parser.parse_args(argv)
+
+    def get_jobs(self):
+        """ Gets pages to load and scrapers to run on them
+            Should be run after get_cli_args()
+            :return: (URL, scraper name) for each scraper
+            :rtype: list
+        """
+
+        if self.args.next:
+            return [(self.URL_next_day, 'get_next_day')]
+
+        jobs = [(self.URL, 'get_info')]
+        if self.args.forec:
+            # RP5 and Sinoptik have it on the same page, no reloading
+            jobs.append((self.URL_hourly, 'get_hourly'))
 
-    def run(self):
+        return jobs
+
+    def run(self, argv=None):
         """ Runs Provider
+            :param argv: Provider arguments, App remaining args by default
             :return: weather information and title for output
             :rtype: tuple
         """
@@ -342,22 +1203,22 @@ class WeatherProvider(Command):
         weather_info = {}
         title = self.title
         city = self.Location
-        self.get_cli_args()
+        self.get_cli_args(argv)
         refresh = self.args.refresh
 
         if self.args.next:
-            self.raw_page = self.get_raw_page(self.URL_next_day, refresh)
-            info_next_day = self.get_next_day()
-            weather_info.update(info_next_day)
             title = title + ", прогноз на завтра, " + city
-
-        if not self.args.next:
-            self.raw_page = self.get_raw_page(self.URL, refresh)
-            weather_info.update(self.get_info())
+        else:
             title = title + ", поточна погода, " + city
-            if self.args.forec:
-                self.raw_page = self.get_raw_page(self.URL_hourly, refresh)
-                weather_info.update(self.get_hourly())
+
+        jobs = self.get_jobs()
+
+        for URL, scraper in jobs:
+            scrapers = [item for page, item in jobs if page == URL]
+            weather_info.update(self.scrape(URL, scraper, refresh, scrapers))
+
+        if self.stale:
+            title = title + config.STALE_MARK
 
         return weather_info, title
 
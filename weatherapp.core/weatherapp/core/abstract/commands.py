@@ -1,9 +1,25 @@
 """ Application commands
     ConfigureApp: set provider to show, caching time and way of app output
     Configure: set Provider options
+    Prefetch: load pages of shown providers into cache
+    BuildCatalog: index locations of providers to find them by name
+    Search: find locations in catalog by similar names
+    Daemon: keep application loaded and run it for clients
+    Serve: answer HTTP requests with weather info as JSON
+    Schedule: keep pages of providers fresh in background
 """
 
-from abstract.abstract import Command
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import os
+import threading
+import time
+
+from abstract.abstract import Command, REVALIDATE
+from managers.catalog import get_catalog
+from managers import daemon
+from managers.service import WeatherService
+from managers.scheduler import Scheduler
 import config.config as config
 
 
@@ -148,3 +164,400 @@ class Configure(Command):
 
         provider = self.app.providers.get(provider_title)
         provider(self.app).config_location()
+
+
+class Prefetch(Command):
+    """ Loads pages of shown providers into cache
+        Pages are chosen by providers options, as for the next run:
+        URL and URL_hourly for current weather and next hours forecast,
+        URL_next_day for next day forecast.
+        Scraper results are saved too, so the next run
+        takes everything from cache.
+        Cached pages are revalidated, unchanged ones are not loaded again
+    """
+
+    name = 'Prefetch'
+
+    def get_titles(self):
+        """ Gets providers to prefetch
+            Provider given in CLI or all providers with 'Show' option
+            :return: providers titles
+            :rtype: list
+        """
+
+        if self.app.remaining_args and \
+                self.app.remaining_args[0] in self.app.providers.get_list():
+            return [self.app.remaining_args[0]]
+
+        return [title for title in self.app.providers.get_list()
+                if config.PROVIDERS_CONF.get(title, {}).get('Show')]
+
+    def prefetch(self, title):
+        """ Reloads pages of provider one after another
+            :param title: provider title
+            :return: (URL, load time in seconds, error or None)
+                     of each page
+            :rtype: list
+        """
+
+        provider = self.app.providers.get(title)(self.app)
+        provider.get_cli_args(self.app.get_option_args(title))
+        jobs = provider.get_jobs()
+        report = []
+
+        for URL in dict.fromkeys(URL for URL, scraper in jobs):
+            scrapers = [item for page, item in jobs if page == URL]
+            start_time = time.perf_counter()
+            error = None
+            try:
+                for scraper in scrapers:
+                    provider.scrape(URL, scraper, REVALIDATE, scrapers)
+            except Exception as err:  # other pages are still loaded
+                error = err
+            report.append((URL, time.perf_counter() - start_time, error))
+
+        return report
+
+    def run(self):
+        """ Prefetches providers concurrently
+            Number of providers loaded at the same time
+            is limited by workers option
+        """
+
+        titles = self.get_titles()
+        start_time = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.app.get_workers()) as pool:
+            reports = list(pool.map(self.prefetch, titles))
+
+        for title, report in zip(titles, reports):
+            for URL, load_time, error in report:
+                if error is None:
+                    self.app.stdout.write(
+                        f"{title} {URL}: {load_time:.2f} с\n")
+                else:
+                    self.app.stdout.write(
+                        f"{title} {URL}: помилка ({error})\n")
+
+        self.app.stdout.write(
+            f"Всього: {time.perf_counter() - start_time:.2f} с\n")
+
+
+class BuildCatalog(Command):
+    """ Builds catalog of provider locations
+        Location pages are crawled level by level, pages of one level
+        are loaded at the same time. Progress is saved to checkpoint
+        file next to catalog, so interrupted build is continued
+        on the next run and failed pages are loaded again.
+    """
+
+    name = 'BuildCatalog'
+
+    def get_titles(self):
+        """ Gets providers to crawl
+            Provider given in CLI or all providers
+            :return: providers titles
+            :rtype: list
+        """
+
+        if self.app.remaining_args and \
+                self.app.remaining_args[0] in self.app.providers.get_list():
+            return [self.app.remaining_args[0]]
+
+        return list(self.app.providers.get_list())
+
+    @staticmethod
+    def get_checkpoint_path(catalog):
+        """ Gets checkpoint file path
+            :param catalog: catalog being built
+            :rtype: string
+        """
+
+        return str(catalog.path) + '.checkpoint'
+
+    def load_checkpoint(self, catalog):
+        """ Loads state of interrupted build
+            :param catalog: catalog being built
+            :return: crawl state of each provider
+            :rtype: dict
+        """
+
+        try:
+            with open(self.get_checkpoint_path(catalog), 'r',
+                      encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_checkpoint(self, catalog, states):
+        """ Saves state of build
+            :param catalog: catalog being built
+            :param states: crawl state of each provider
+        """
+
+        path = self.get_checkpoint_path(catalog)
+        catalog.path.parent.mkdir(parents=True, exist_ok=True)
+
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(states, f, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+
+    def crawl(self, title, state, checkpoint):
+        """ Crawls locations of provider
+            State has pages to load as [level, URL, path] in 'pending',
+            pages being loaded in 'running', pages with errors
+            in 'failed' and found [name, URL, path] in 'locations'
+            :param title: provider title
+            :param state: crawl state, continued if not empty
+            :param checkpoint: function saving state
+        """
+
+        provider = self.app.providers.get(title)(self.app)
+        last_level = len(provider.location_levels) - 1
+
+        if not state:
+            state.update({'pending': [[0, provider.URL_locations, []]],
+                          'locations': []})
+
+        # pages of interrupted and failed loads are loaded again
+        state['pending'] += state.pop('running', []) + \
+            state.pop('failed', [])
+        state['running'], state['failed'] = [], []
+        loaded = 0
+
+        with ThreadPoolExecutor(max_workers=self.app.get_workers()) as pool:
+            while state['pending']:
+                jobs = {pool.submit(provider.get_locations, level, URL):
+                        [level, URL, path]
+                        for level, URL, path in state['pending']}
+                state['pending'], state['running'] = [], list(jobs.values())
+
+                for job in as_completed(jobs):
+                    level, URL, path = page = jobs[job]
+                    state['running'].remove(page)
+                    try:
+                        locations = job.result()
+                    except Exception as err:  # page is loaded next time
+                        provider.logger.error(f"{title} {URL}: {err}")
+                        state['failed'].append(page)
+                        continue
+
+                    for name, location_URL in locations.items():
+                        if level < last_level:
+                            state['pending'].append(
+                                [level + 1, location_URL, path + [name]])
+                        else:
+                            state['locations'].append(
+                                [name, location_URL, ' / '.join(path)])
+
+                    loaded += 1
+                    if loaded % config.CATALOG_CHECKPOINT == 0:
+                        checkpoint()
+
+        state['done'] = not state['failed']
+        checkpoint()
+
+    def run(self):
+        """ Crawls providers one by one and writes catalog
+            Locations of other providers are kept in catalog
+        """
+
+        catalog = get_catalog()
+        titles = self.get_titles()
+        states = self.load_checkpoint(catalog)
+
+        for title in titles:
+            state = states.setdefault(title, {})
+            if not state.get('done'):
+                self.crawl(title, state,
+                           lambda: self.save_checkpoint(catalog, states))
+
+        locations = [(location.name, location.provider, location.URL,
+                      location.path) for location in catalog.load()
+                     if location.provider not in titles]
+        for title in titles:
+            locations += [(name, title, URL, path) for name, URL, path
+                          in states[title]['locations']]
+        catalog.save(locations)
+
+        for title in titles:
+            self.app.stdout.write(
+                f"{title}: {len(states[title]['locations'])} locations, "
+                f"{len(states[title]['failed'])} pages failed\n")
+
+        if all(state.get('done') for state in states.values()):
+            os.remove(self.get_checkpoint_path(catalog))
+        else:
+            self.app.stdout.write(
+                'Run BuildCatalog again to load failed pages\n')
+
+
+class Search(Command):
+    """ Finds locations in catalog by name
+        Name may be misspelled or written in other script,
+        e.g. 'Kyiv' finds 'Київ' and 'Киев'.
+        If the first argument is provider title,
+        locations of this provider are searched only
+    """
+
+    name = 'Search'
+    limit = 10
+
+    def run(self):
+        """ Prints locations from the best match """
+
+        catalog = get_catalog()
+        if not catalog.exists():
+            self.app.stdout.write('Catalog is not built, run BuildCatalog\n')
+            return
+
+        args, provider = list(self.app.remaining_args), None
+        if len(args) > 1 and args[0] in self.app.providers.get_list():
+            provider = args.pop(0)
+
+        found = catalog.search(' '.join(args), provider, self.limit)
+        if not found:
+            self.app.stdout.write('Nothing is found\n')
+
+        for score, location in found:
+            self.app.stdout.write(
+                f"{location.name} ({location.provider}, {location.path}): "
+                f"{location.URL}\n")
+
+
+class Daemon(Command):
+    """ Runs application daemon in foreground
+        Runs of the app in the same directory are forwarded to it
+        while it is running. 'Daemon stop' stops running daemon,
+        'Daemon schedule' keeps pages fresh in the daemon, so runs
+        of users go before scheduled refreshes
+    """
+
+    name = 'Daemon'
+
+    def run(self):
+        """ Serves clients until stopped """
+
+        if self.app.remaining_args[:1] == ['stop']:
+            if daemon.request({'stop': True}) is None:
+                self.app.stdout.write('Daemon is not running\n')
+            else:
+                self.app.stdout.write('Daemon is stopped\n')
+            return
+
+        server = daemon.DaemonServer(type(self.app))
+        scheduler = Schedule(self.app).start() \
+            if 'schedule' in self.app.remaining_args else None
+        self.app.stdout.write(f"Daemon is listening on {server.path}\n")
+        self.app.stdout.flush()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if scheduler is not None:
+                scheduler.stop()
+
+
+class Serve(Command):
+    """ Runs HTTP JSON service in foreground
+        Port may be given as argument: 'Serve 8000'.
+        'Serve schedule' keeps pages fresh in the service process,
+        so requests of users go before scheduled refreshes
+    """
+
+    name = 'Serve'
+
+    def run(self):
+        """ Serves requests until interrupted """
+
+        address = None
+        if self.app.remaining_args and self.app.remaining_args[0].isdigit():
+            address = (config.WEATHER_PROVIDERS['App'].get(
+                'Serve_host', config.SERVE_HOST),
+                int(self.app.remaining_args[0]))
+
+        server = WeatherService(self.app, address)
+        scheduler = Schedule(self.app).start() \
+            if 'schedule' in self.app.remaining_args else None
+        host, port = server.server_address[:2]
+        self.app.stdout.write(f"Serving on http://{host}:{port}/\n")
+        self.app.stdout.flush()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if scheduler is not None:
+                scheduler.stop()
+
+
+class Schedule(Command):
+    """ Keeps pages of shown providers fresh until interrupted
+        Locations given for batch mode (--locations, -l) are
+        kept fresh too.
+        Priority of user requests over refreshes works in one process,
+        Serve and Daemon run scheduler in their process with 'schedule'
+    """
+
+    name = 'Schedule'
+
+    def add_pages(self, scheduler):
+        """ Adds pages of shown providers to scheduler
+            :param scheduler: Scheduler instance
+            :return: number of pages
+            :rtype: int
+        """
+
+        pages = 0
+        locations = self.app.get_locations()
+
+        for title in self.app.providers.get_list():
+            if not config.PROVIDERS_CONF.get(title, {}).get('Show'):
+                continue
+            argv = self.app.get_option_args(title)
+            pages += scheduler.add(title, argv)
+            for location, URLs in locations:
+                provider = self.app.providers.get(title)(self.app)
+                location_set = provider.resolve_location(location,
+                                                         URLs.get(title))
+                if location_set is not None:
+                    pages += scheduler.add(title, argv, location_set)
+
+        return pages
+
+    def report(self, task, error):
+        """ Prints result of refresh
+            :param task: refreshed page
+            :param error: error or None
+        """
+
+        result = 'оновлено' if error is None else f'помилка ({error})'
+        self.app.stdout.write(f"{time.strftime('%H:%M:%S')} {task.title} "
+                              f"{task.URL}: {result}\n")
+        self.app.stdout.flush()
+
+    def start(self):
+        """ Refreshes pages in background thread
+            :return: running scheduler, stop it when done
+            :rtype: Scheduler
+        """
+
+        scheduler = Scheduler(self.app)
+        self.add_pages(scheduler)
+        threading.Thread(target=scheduler.run, daemon=True).start()
+
+        return scheduler
+
+    def run(self):
+        """ Refreshes pages when their caching time is over """
+
+        scheduler = Scheduler(self.app)
+        self.app.stdout.write(
+            f"Scheduled pages: {self.add_pages(scheduler)}\n")
+        try:
+            scheduler.run(self.report)
+        except KeyboardInterrupt:
+            scheduler.stop()
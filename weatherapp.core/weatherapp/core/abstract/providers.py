@@ -4,18 +4,16 @@
     SinoptikProvider - sinoptik.ua
 """
 
-from urllib.request import urlopen, Request
 from urllib.parse import quote, unquote
 from urllib import parse
-from bs4 import BeautifulSoup
-import sys
+from urllib.error import URLError
 import re
 import os
 import time
 import pathlib
 import hashlib
 
-from abstract.abstract import WeatherProvider
+from abstract.abstract import WeatherProvider, parse_fallback
 import config.decorators
 
 
@@ -23,7 +21,19 @@ class AccuProvider(WeatherProvider):
     """ Class for Accuweather"""
 
     title = "Accuweather"
-
+    parse_only = {
+        'get_info': ('div', {'id': 'feed-tabs'}),
+        'get_hourly': ('div', {'class': re.compile(r'\bhourly-table\b')}),
+        'get_next_day': ('div', {'id': 'detail-day-night'}),
+        'get_current_location': ('ul', {'id': 'country-breadcrumbs'})
+        }
+    end_markers = {
+        'get_info': [('div', r'id=["\']?feed-tabs\b')],
+        'get_hourly': [('div', r'class=["\'][^"\']*\bhourly-table\b')],
+        'get_next_day': [('div', r'id=["\']?detail-day-night\b')]
+        }
+
+    @parse_fallback
     def get_info(self):
         """ Extracts weather info from ACCUWEATHER loaded page using BS4
             Returns info in dictionary:
@@ -36,7 +46,7 @@ class AccuProvider(WeatherProvider):
 
         weather_info = {}
 
-        soup = BeautifulSoup(self.raw_page, 'html.parser')
+        soup = self.get_soup()
 
         # find block with current condition
         current_cond_div = \
@@ -56,6 +66,7 @@ class AccuProvider(WeatherProvider):
 
         return weather_info
 
+    @parse_fallback
     def get_hourly(self):
         """ Gets temperature forecast for next 8 hours
             Returns info in dictionary:
@@ -68,7 +79,7 @@ class AccuProvider(WeatherProvider):
         """
 
         weather_info = {}
-        soup = BeautifulSoup(self.raw_page, 'html.parser')
+        soup = self.get_soup()
 
         # find hourly forecast table
         hourly_data = soup.find('div', class_='hourly-table overview-hourly')
@@ -90,6 +101,7 @@ class AccuProvider(WeatherProvider):
 
         return weather_info
 
+    @parse_fallback
     def get_next_day(self):
         """ Extracts weather info for next day
             Returns info in dictionary:
@@ -106,7 +118,7 @@ class AccuProvider(WeatherProvider):
         weather_info = {}
         regex = "  1?"  # to remove unnessecary symbols
 
-        soup = BeautifulSoup(self.raw_page, 'html.parser')
+        soup = self.get_soup()
         # find day/night forecast panel
         next_day_forec = soup.find('div', id="detail-day-night")
 
@@ -152,6 +164,7 @@ class AccuProvider(WeatherProvider):
 
         return weather_info
 
+    @parse_fallback
     def get_current_location(self):
         """ Returns current location of Accuweather
             with corresponding links
@@ -161,7 +174,7 @@ class AccuProvider(WeatherProvider):
 
         accu_location = []
 
-        soup = BeautifulSoup(self.raw_page, 'html.parser')
+        soup = self.get_soup()
         location_ul = soup.find('ul', id="country-breadcrumbs")
         location = location_ul.find_all('a')
 
@@ -171,24 +184,22 @@ class AccuProvider(WeatherProvider):
 
         return accu_location
 
-    def browse_location(self, level=0, URL_location=None):
-        """ Browse recursively locations of ACCU
-            Starts from continents
-            Defaults: level = 0: continent level
-                      URL_location: page with continents
-            Each next call with new URL and level + 1
-            :return: URL, URL_hourly, URL_next_day and Location
-            :rtype: list
+    def get_locations(self, level=0, URL_location=None):
+        """ Gets ACCU locations of given level
+            Levels: 0 - continents, 1 - countries, 2 - regions, 3 - cities
+            :param level: location level
+            :param URL_location: page of locations, continents by default
+            :return: location names with their pages
+            :rtype: dict
         """
 
         if URL_location is None:
             URL_location = self.URL_locations
 
-        # container for user input and level check
-        levels = ['continent', 'country', 'region', 'city']
         raw_page = self.get_raw_page(URL_location)  # read locations
         locations_list = {}  # locations associated with their urls
-        location_set = {}  # return
+
+        from bs4 import BeautifulSoup  # loaded on first parse
 
         soup = BeautifulSoup(raw_page, 'html.parser')  # parse page
         raw_list = soup.find('ul', class_="articles")  # find list of locations
@@ -197,34 +208,25 @@ class AccuProvider(WeatherProvider):
         for item in raw_list:  # associate location with ulr
             locations_list[item.get_text()] = item.attrs['href']
 
-        for item in locations_list:  # print out locations
-            self.app.stdout.write(f"{item}\n")
+        return locations_list
 
-        choice = input(f"\nEnter {levels[level]} name:\n")  # user input
+    def make_location_set(self, location, URL):
+        """ Makes ACCU location set from current weather page
+            :param location: location name
+            :param URL: current weather page of the location
+            :return: URL, URL_hourly, URL_next_day and Location
+            :rtype: dict
+        """
 
-        # call this function again with new locations
-        if level < 3:
-            try:
-                location_set = self.browse_location(
-                    level+1, URL_location=locations_list[choice])
-            except KeyError:
-                self.logger.error(
-                    'Wrong name entered. ' +
-                    'Please, restart application and try again')
-                sys.exit()
-
-        # end of browsing
-        if level == 3:
-            location_set['URL'] = locations_list[choice]
-            url_string = locations_list[choice]
-            regex = "weather-forecast"
+        location_set = {'URL': URL}
+        regex = "weather-forecast"
 
-            location_set['URL_hourly'] = \
-                re.sub(regex, 'hourly-weather-forecast', url_string)
-            location_set['URL_next_day'] = \
-                re.sub(regex, 'daily-weather-forecast', url_string)
-            location_set['URL_next_day'] += "?day=2"
-            location_set['Location'] = choice
+        location_set['URL_hourly'] = \
+            re.sub(regex, 'hourly-weather-forecast', URL)
+        location_set['URL_next_day'] = \
+            re.sub(regex, 'daily-weather-forecast', URL)
+        location_set['URL_next_day'] += "?day=2"
+        location_set['Location'] = location
 
         return location_set
 
@@ -243,7 +245,21 @@ class RP5_Provider(WeatherProvider):
     """ Class for RP5 """
 
     title = "RP5"
-
+    location_levels = ['country', 'region', 'city']
+    parse_only = {
+        'get_info': (['div', 'table'],
+                     {'id': re.compile('^(ArchTemp|forecastTable_1)$')}),
+        'get_hourly': ('table', {'id': 'forecastTable_1'}),
+        'get_next_day': ('div', {'id': 'forecastShort-content'})
+        }
+    end_markers = {
+        'get_info': [('div', r'id=["\']?ArchTemp\b'),
+                     ('table', r'id=["\']?forecastTable_1\b')],
+        'get_hourly': [('table', r'id=["\']?forecastTable_1\b')],
+        'get_next_day': [('div', r'id=["\']?forecastShort-content\b')]
+        }
+
+    @parse_fallback
     def get_info(self):
         """ Extracts data from RP5 loaded page
             Returns info in dictionary:
@@ -255,7 +271,7 @@ class RP5_Provider(WeatherProvider):
         """
 
         weather_info = {}
-        soup = BeautifulSoup(self.raw_page, 'lxml')
+        soup = self.get_soup('lxml')
 
         # get part with Temperature
         temperature_block = soup.find('div', id='ArchTemp')
@@ -311,6 +327,7 @@ class RP5_Provider(WeatherProvider):
 
         return weather_info
 
+    @parse_fallback
     def get_hourly(self):
         """ Gets temperature forecast for next 8 hours
             Returns info in dictionary:
@@ -324,7 +341,7 @@ class RP5_Provider(WeatherProvider):
 
         weather_info = {}
         table_data = []
-        soup = BeautifulSoup(self.raw_page, 'lxml')
+        soup = self.get_soup('lxml')
 
         # get table
         table = soup.find('table', id='forecastTable_1')
@@ -354,6 +371,7 @@ class RP5_Provider(WeatherProvider):
 
         return weather_info
 
+    @parse_fallback
     def get_next_day(self):
         """ Extracts weather info for next day using RegEx
             weather_info = {
@@ -364,7 +382,7 @@ class RP5_Provider(WeatherProvider):
         """
         weather_info = {}
 
-        soup = BeautifulSoup(self.raw_page, 'lxml')
+        soup = self.get_soup('lxml')
 
         # get string with short forecast
         forecast = soup.find('div', id="forecastShort-content").get_text()
@@ -390,24 +408,22 @@ class RP5_Provider(WeatherProvider):
 
         return weather_info
 
-    def browse_location(self, level=0, URL_location=None):
-        """ Browse recursively locations of ACCU
-            Starts from country
-            Defaults: level = 0: country level
-                      URL_location: page with location links
-            Each next call with new URL and level + 1
-            :return: URL, URL_hourly, URL_next_day and Location
-            :rtype: list
+    def get_locations(self, level=0, URL_location=None):
+        """ Gets RP5 locations of given level
+            Levels: 0 - countries, 1 - regions, 2 - cities
+            :param level: location level
+            :param URL_location: page of locations, countries by default
+            :return: location names with their pages
+            :rtype: dict
         """
 
         if URL_location is None:
             URL_location = self.URL_locations
-        # container for user input and level check
-        levels = ['country', 'region', 'city']
-        location_set = {}
         locations_list = {}  # locations associated with their urls
         raw_page = self.get_raw_page(URL_location)  # read locations
 
+        from bs4 import BeautifulSoup  # loaded on first parse
+
         soup = BeautifulSoup(raw_page, 'lxml')  # parse page
         table = soup.find('div', class_="countryMap")  # find table
 
@@ -421,9 +437,6 @@ class RP5_Provider(WeatherProvider):
                 url_decoded = quote(link.attrs['href'])
                 locations_list[link.get_text()] = "http://rp5.ua" + url_decoded
 
-            for item in locations_list:
-                self.app.stdout.write(f"{item}\n")
-
         # do it for next level
         if level == 1:
             links = table.find_all('a', class_='href12')
@@ -433,9 +446,6 @@ class RP5_Provider(WeatherProvider):
                 locations_list[item.attrs['title']] = \
                     "http://rp5.ua/" + url_decoded
 
-            for item in locations_list:
-                self.app.stdout.write(f"{item}\n")
-
         # do it for next level
         if level == 2:
             links = table.find_all('a')
@@ -445,28 +455,7 @@ class RP5_Provider(WeatherProvider):
                 locations_list[item.get_text()] = \
                     "http://rp5.ua/" + url_decoded
 
-            for item in locations_list:
-                self.app.stdout.write(f"{item}\n")
-
-        choice = input(f"\nEnter {levels[level]} name:\n")
-
-        # if not city level repeat recursively
-        if level < 2:
-            try:
-                location_set = \
-                    self.browse_location(level+1, locations_list[choice])
-            except KeyError:
-                self.logger.error(
-                    'Wrong name entered. ' +
-                    'Please, restart application and try again')
-                sys.exit()
-
-        # finish on city level
-        if level == 2:
-            location_set['URL'] = locations_list[choice]
-            location_set['Location'] = choice
-
-        return location_set
+        return locations_list
 
     def set_location(self, location_set):
         """ Sets RP5 location to the config
@@ -476,19 +465,14 @@ class RP5_Provider(WeatherProvider):
         self.URL = location_set['URL']
         self.Location = location_set['Location']
 
-    def search_location():
+    def search_location(self):
         """ Searches location typed by user through RP5 """
 
         location_search = input("Type location to search\n")
         data = location_search.encode('utf-8')
 
         URL_search = weather_providers['RP5']['URL_search']
-        HEAD_search = {
-            'User-Agent':
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:63.0) Gecko/201'
-            }
-        SEARCH_REQUEST = Request(URL_search, data=data, headers=HEAD_search)
-        PAGE_SEARCH = urlopen(SEARCH_REQUEST).read()
+        PAGE_SEARCH = self.transport.request(URL_search, data=data).body
         PAGE_SEARCH = str(PAGE_SEARCH, encoding='utf-8')
 
         self.app.stdout.write(f"{PAGE_SEARCH}\n")
@@ -498,7 +482,19 @@ class SinoptikProvider(WeatherProvider):
     """ Class for Sinoptik """
 
     title = "Sinoptik"
-
+    parse_only = {
+        'get_info': ('div', {'class': re.compile(r'\b(lSide|rSide)\b')}),
+        'get_hourly': ('table', {'class': re.compile(r'\bweatherDetails\b')}),
+        'get_next_day': ('div', {'id': 'bd2'})
+        }
+    end_markers = {
+        'get_info': [('div', r'class=["\'][^"\']*\blSide\b'),
+                     ('div', r'class=["\'][^"\']*\brSide\b')],
+        'get_hourly': [('table', r'class=["\'][^"\']*\bweatherDetails\b')],
+        'get_next_day': [('div', r'id=["\']?bd2\b')]
+        }
+
+    @parse_fallback
     def get_info(self):
         """ Extracts data from Sinoptik loaded page
             Returns info in dictionary:
@@ -510,7 +506,7 @@ class SinoptikProvider(WeatherProvider):
         """
         weather_info = {}
 
-        soup = BeautifulSoup(self.raw_page, 'html.parser')
+        soup = self.get_soup()
         curr_temp_cond = soup.find('div', class_='lSide')
         cond = list(curr_temp_cond.find('div', class_='img').children)
         cond = str(cond[1]['alt'])
@@ -529,6 +525,7 @@ class SinoptikProvider(WeatherProvider):
 
         return weather_info
 
+    @parse_fallback
     def get_hourly(self):
         """ Gets temperature forecast for next 8 hours
             Returns info in dictionary:
@@ -543,7 +540,7 @@ class SinoptikProvider(WeatherProvider):
         weather_info = {}
         table_data = []
 
-        soup = BeautifulSoup(self.raw_page, 'html.parser')
+        soup = self.get_soup()
         table = soup.find('table', class_='weatherDetails')
         table = table.find('tr', class_='temperature')
         table = table.find_all('td')
@@ -559,6 +556,7 @@ class SinoptikProvider(WeatherProvider):
 
         return weather_info
 
+    @parse_fallback
     def get_next_day(self):
         """ Extracts weather info for next day
             Returns info in dictionary:
@@ -570,7 +568,7 @@ class SinoptikProvider(WeatherProvider):
         """
         weather_info = {}
 
-        soup = BeautifulSoup(self.raw_page, 'html.parser')
+        soup = self.get_soup()
         next_day_block = soup.find('div', id="bd2")
         regex = "weatherIco.*"  # different weather icons for condition
         next_day_cond = next_day_block.find('div', class_=re.compile(regex))
@@ -586,95 +584,76 @@ class SinoptikProvider(WeatherProvider):
 
         return weather_info
 
-    def browse_location(self, level=0, URL_location=None):
-        """ Browse recursively locations of Sinoptik
-            Starts from continents
-            defaults: level = 0: continent level
-                      URL_location: page with continents, Europe by default
-            Each next call with new URL and level + 1
-            :return: URL, URL_hourly, URL_next_day and Location
-            :rtype: list
+    def get_locations(self, level=0, URL_location=None):
+        """ Gets Sinoptik locations of given level
+            Levels: 0 - continents, 1 - countries, 2 - regions, 3 - cities
+            :param level: location level
+            :param URL_location: page of locations, Europe by default
+            :return: location names with their pages
+            :rtype: dict
         """
+
         if URL_location is None:
             URL_location = self.URL_locations
 
-        # container for user input and level check
-        levels = ['continent', 'country', 'region', 'city']
         raw_page = self.get_raw_page(URL_location)  # read locations
         locations_list = {}  # locations associated with their urls
-        location_set = {}  # return
+        from bs4 import BeautifulSoup  # loaded on first parse
+
+        soup = BeautifulSoup(raw_page, 'html.parser')  # parse page
 
         """ Continents and countries are on same page
-            so if we are on 0 level we should print continents """
+            so if we are on 0 level we should get continents """
         if level == 0:
-            soup = BeautifulSoup(raw_page, 'html.parser')  # parse page
             # find list of locations
             raw_list = soup.find('div', class_="mapRightCol")
             # get first div
             raw_list = raw_list.find('div')
-            # get all links in list of locations
-            raw_list = raw_list.find_all('a')
-
-            for item in raw_list:  # associate location with ulr
-                url_decoded = quote(item.attrs['href'])
-                locations_list[item.get_text()] = "https:" + url_decoded
-
-            for item in locations_list:  # print out locations
-                self.app.stdout.write(f"{item}\n")
 
         # if country or region level
         if level == 1 or level == 2:
-            # parse page
-            soup = BeautifulSoup(raw_page, 'html.parser')
             # find list of locations
             raw_list = soup.find('div', class_="maxHeight")
             # get first div
             raw_list = raw_list.find('div')
-            # get all links in list of locations
-            raw_list = raw_list.find_all('a')
-
-            # associate location with ulr
-            for item in raw_list:
-                url_decoded = quote(item.attrs['href'])
-                locations_list[item.get_text()] = "https:" + url_decoded
-
-            for item in locations_list:  # print out locations
-                self.app.stdout.write(f"{item}\n")
 
         # on city level
         if level == 3:
-            # parse page
-            soup = BeautifulSoup(raw_page, 'html.parser')
             # find list of locations
             raw_list = soup.find('div', class_="mapBotCol")
             raw_list = raw_list.find('div', class_="clearfix")
-            # get all links in list of locations
-            raw_list = raw_list.find_all('a')
-            # associate location with ulr
-            for item in raw_list:
-                url_decoded = quote(item.attrs['href'])
-                locations_list[item.get_text()] = "https:" + url_decoded
 
-            for item in locations_list:  # print out locations
-                self.app.stdout.write(f"{item}\n")
+        # get all links in list of locations
+        raw_list = raw_list.find_all('a')
 
-        choice = input(f"\nEnter {levels[level]} name:\n")
+        # associate location with ulr
+        for item in raw_list:
+            url_decoded = quote(item.attrs['href'])
+            locations_list[item.get_text()] = "https:" + url_decoded
 
-        # call recursively if not on city level
-        if level != 3:
+        return locations_list
 
+    def resolve_location(self, location, URL=None):
+        """ Finds Sinoptik pages of location
+            Sinoptik page address is made of location name
+            :param location: location name
+            :param URL: current weather page of the location, if known
+            :return: location set for set_location or None
+                     if there is no page of the location
+            :rtype: dict
+        """
+
+        location_set = super().resolve_location(location, URL)
+
+        if location_set is None:
+            name = '-'.join(location.lower().split())
+            URL = "https://ua.sinoptik.ua/" + quote("погода-" + name)
             try:
-                location_set = \
-                    self.browse_location(level+1, locations_list[choice])
-            except KeyError:
-                self.logger.error(
-                    'Wrong name entered. ' +
-                    'Please, restart application and try again')
-                sys.exit()
-        # get the result
-        if level == 3:
-            location_set['URL'] = locations_list[choice]
-            location_set['Location'] = choice
+                self.get_raw_page(URL)  # misspelt name has no page
+            except URLError as err:
+                self.logger.warning(f'{location} is not found: {err}')
+                return None
+            location_set = self.make_location_set(location, URL)
 
         return location_set
 
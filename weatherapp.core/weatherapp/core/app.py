@@ -3,20 +3,27 @@
 import argparse
 import pathlib
 import sys
-import traceback
 import logging
+import time
+import hashlib
+import json
+import csv
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import config.decorators
 from config import config
 from managers.providermanager import ProviderManager
 from managers.commandmanager import CommandManager
 import managers.formatters as formatters
+from managers.transport import get_transport
+from managers.cache import get_cache
+from managers import daemon
 
 
 class App:
 
-    def __init__(self):
-        self.args, self.remaining_args = self.take_args()
+    def __init__(self, argv=None, cwd=None):
+        self.args, self.remaining_args = self.take_args(argv)
         self.providers = ProviderManager()
         self.commands = CommandManager().commands
         self.logger = self._get_logger(self.args.verbosity)
@@ -24,6 +31,11 @@ class App:
         self.stdout = sys.stdout
         self.stderr = sys.stderr
         self.formatter = None
+        self.run_times = {}  # provider run time by title
+        # relative file names are given in directory of the caller,
+        # which differs from working directory of daemon
+        self.cwd = pathlib.Path(cwd) if cwd else config.WORKING_DIR
+        self.output_state_path = self.get_path(config.OUTPUT_STATE_FILE)
 
         # define the displaying way of weather data
         if self.args.d:
@@ -33,6 +45,15 @@ class App:
             self.formatter = formatters.get_formatter(
                 config.WEATHER_PROVIDERS['App']['Display'])
 
+    def get_path(self, filename):
+        """ Gets path of file given in CLI arguments
+            :param filename: file name, relative to directory of the caller
+            :return: absolute path
+            :rtype: pathlib.Path
+        """
+
+        return self.cwd / filename
+
     @staticmethod
     def _get_logger(verbose_lvl):
         """ Gets looger for application
@@ -57,12 +78,14 @@ class App:
         fmt = logging.Formatter(
             '%(asctime)s %(name)s %(levelname)s %(message)s')
         console.setFormatter(fmt)
-        logger.addHandler(console)
+        if not logger.handlers:  # app may be created many times by daemon
+            logger.addHandler(console)
 
         return logger
 
-    def take_args(self):
+    def take_args(self, argv=None):
         """ Set, parse and manage CLI arguments
+            :param argv: CLI arguments, sys.argv by default
             :return: parsed CLI arguments for App and arguments for Provider
             :rtype: tuple
         """
@@ -81,6 +104,16 @@ Provider options:
         parser.add_argument("command",
             help="""ConfigureApp - aplication configuration.\n""" +
                 """Configure - provider configuration.\n""" +
+                """Prefetch - load pages of shown providers to cache.\n""" +
+                """BuildCatalog - index locations to find them by name.\n""" +
+                """Search - find locations in catalog by name.\n""" +
+                """Daemon - keep app loaded for faster runs, """ +
+                """'Daemon stop' to stop it.\n""" +
+                """Serve - run HTTP JSON service, 'Serve 8000' """ +
+                """to set port.\n""" +
+                """'Daemon schedule', 'Serve schedule' - keep pages """ +
+                """fresh in the same process.\n""" +
+                """Schedule - keep pages of shown providers fresh.\n""" +
                 """Provider - show specified provider.""",
             nargs="?")
 
@@ -98,6 +131,49 @@ Provider options:
         parser.add_argument("--clear-cache",
                             help="Remove cache files and directory",
                             action="store_true")  # App command
+        parser.add_argument("-w", "--workers", metavar="[number]",
+                            help="Number of providers loaded at the same time",
+                            type=int)  # App command
+        parser.add_argument("-p", "--progressive",
+                            help="Show each provider as soon as it is ready",
+                            action="store_true")  # App command
+        parser.add_argument("--stream",
+                            help="Stop loading pages after needed blocks",
+                            action="store_true")  # App command
+        parser.add_argument("--summary",
+                            help="Show loading time of providers at the end",
+                            action="store_true")  # App command
+        parser.add_argument("--locations", metavar="[filename]",
+                            help="Show weather in locations listed in " +
+                            "file,\na line per location: name or\n" +
+                            "name; Provider=URL; Provider=URL",
+                            type=str)  # App command
+        parser.add_argument("-l", "--location", metavar="[location]",
+                            help="Show weather in location, may be repeated",
+                            action="append")  # App command
+        parser.add_argument("--batch-format", metavar="[format]",
+                            help="Output of locations: 'table', 'csv'\n" +
+                            "or 'json' lines",
+                            choices=['table', 'csv', 'json'],
+                            default='table')  # App command
+        parser.add_argument("--if-changed",
+                            help="Show info and save files only if\n" +
+                            "it is changed since the last run",
+                            action="store_true")  # App command
+        parser.add_argument("--cache-stats",
+                            help="Show size of cache and saved bytes",
+                            action="store_true")  # App command
+        parser.add_argument("--cache-prune",
+                            help="Remove old and least recently used\n" +
+                            "cached pages without asking",
+                            action="store_true")  # App command
+        parser.add_argument("--older-than", metavar="[minutes]",
+                            help="With --cache-prune: remove pages " +
+                            "loaded earlier",
+                            type=int)  # App command
+        parser.add_argument("--max-size", metavar="[megabytes]",
+                            help="With --cache-prune: cache size limit",
+                            type=int)  # App command
         parser.add_argument("--debug", help="Show error tracebacks",
                             action="store_true")
         parser.add_argument("-v", "--verbosity",
@@ -105,7 +181,7 @@ Provider options:
                             " -v - INFO, -vv - DEBUG, -vvv - WARNING",
                             action="count")
 
-        args, remaining_args = parser.parse_known_args()
+        args, remaining_args = parser.parse_known_args(argv)
 
         return args, remaining_args
 
@@ -128,9 +204,66 @@ Provider options:
 
         return args
 
-    @staticmethod
-    def clear_cache():
-        """ Removes cache directory """
+    def get_workers(self):
+        """ Gets number of providers to run at the same time
+            CLI argument has priority over config
+            :return: workers limit
+            :rtype: int
+        """
+
+        workers = self.args.workers or \
+            config.WEATHER_PROVIDERS['App'].get('Workers', config.WORKERS)
+
+        return max(1, int(workers))
+
+    def run_provider(self, provider, argv):
+        """ Runs provider and measures its run time
+            :param provider: Provider instance
+            :param argv: Provider arguments
+            :return: weather info and title
+            :rtype: tuple
+        """
+
+        start_time = time.perf_counter()
+        weather_info, title = provider.run(argv)
+        self.run_times[title] = time.perf_counter() - start_time
+
+        return weather_info, title
+
+    def run_providers(self, titles, get_options=False, on_ready=None):
+        """ Runs providers concurrently
+            Pages are loaded and parsed in a thread pool,
+            results are kept in the order of given titles
+            :param titles: providers titles
+            :param get_options: take show options from providers config
+            :param on_ready: called with weather info and title
+                             as soon as a provider is done
+            :return: weather info and title of each provider
+            :rtype: list
+        """
+
+        jobs = []
+
+        with ThreadPoolExecutor(max_workers=self.get_workers()) as executor:
+            for item in titles:
+                if get_options:  # get options if no CLI provider args
+                    argv = self.get_option_args(item)
+                else:
+                    argv = list(self.remaining_args)
+                provider = self.providers.get(item)(self)
+                jobs.append(
+                    executor.submit(self.run_provider, provider, argv))
+
+            if on_ready is not None:  # in order of completion
+                for job in as_completed(jobs):
+                    on_ready(*job.result())
+
+            results = [job.result() for job in jobs]
+
+        return results
+
+    def clear_cache(self):
+        """ Removes cached pages and cache directory """
 
         path = pathlib.Path(config.WEATHER_PROVIDERS['App']['Cache_path'])
 
@@ -138,14 +271,54 @@ Provider options:
                 'Do you really want to remove ' +
                 'all cache files with directory? Y/N\n')
         if answer.lower() == 'y':
+            cache = get_cache()
+            cache.clear()
+            if hasattr(cache, 'close'):
+                cache.close()
             for item in list(path.glob('*.*')):
                 item.unlink()
-            self.stdout.write('Files removed')
+            self.stdout.write('Files removed\n')
             path.rmdir()
-            self.stdout.write('Directory removed')
+            self.stdout.write('Directory removed\n')
         else:
             pass
 
+    def cache_stats(self):
+        """ Shows number of cached pages, their size,
+            bytes saved by compression, caching time of provider pages
+            and how often the pages are changed
+        """
+
+        stats = get_cache().stats()
+
+        self.stdout.write(f"Cached pages: {stats['Entries']}\n")
+        self.stdout.write(f"Pages size: {stats['Pages']} bytes\n")
+        self.stdout.write(f"Size on disk: {stats['Stored']} bytes\n")
+        saved = stats['Pages'] - stats['Stored']
+        self.stdout.write(f"Saved by compression: {saved} bytes\n")
+
+        for title in self.providers.get_list():
+            provider = self.providers.get(title)(self)
+            for page, caching_time, checks, changes in \
+                    provider.get_cache_report():
+                self.stdout.write(f"{title} {page}: caching time "
+                                  f"{caching_time // 60} min, "
+                                  f"{changes} changes in {checks} loads\n")
+
+    def prune_cache(self):
+        """ Removes old and least recently used cached pages
+            Limits are taken from CLI arguments or config
+        """
+
+        max_size = None if self.args.max_size is None \
+            else self.args.max_size * 2**20
+        older_than = None if self.args.older_than is None \
+            else self.args.older_than * 60
+
+        removed = get_cache().prune(max_size=max_size, older_than=older_than)
+
+        self.stdout.write(f"Removed cached pages: {removed}\n")
+
     @staticmethod
     def save_csv(ACTUAL_WEATHER_INFO, filename):
         """ Saves weather info into comma-separated file
@@ -182,18 +355,204 @@ Provider options:
 
         pass
 
-    def produce_output(self, weather_info, title):
+    def show_output(self, weather_info, title):
+        """ Prints out weather information to the screen
+            :param weather_info: weather information
+            :param title: weather information title
+        """
+
+        self.stdout.write(self.formatter.print_out(weather_info, title))
+        self.stdout.flush()
+
+    def produce_output(self, weather_info, title, show=True):
         """ Produces outputs to the screen
             and to config vars for file saving
             :param weather_info: weather information
             :param title: weather information title
+            :param show: print out to the screen, False if already shown
         """
 
-        self.stdout.write(self.formatter.print_out(weather_info, title))
+        if show:
+            self.show_output(weather_info, title)
         config.ACTUAL_WEATHER_INFO[title] = weather_info
         config.ACTUAL_PRINTABLE_INFO[title] = \
             self.formatter.print_out(weather_info, title)
 
+    @staticmethod
+    def parse_location(line):
+        """ Parses location line
+            Line is location name, optionally followed by
+            provider pages: 'Львів; Sinoptik=https://...'
+            :param line: location line
+            :return: location name and {provider title: URL}
+            :rtype: tuple
+        """
+
+        parts = [part.strip() for part in line.split(';')]
+        URLs = {}
+
+        for part in parts[1:]:
+            title, sep, URL = part.partition('=')
+            if sep:
+                URLs[title.strip()] = URL.strip()
+
+        return parts[0], URLs
+
+    def get_locations(self):
+        """ Gets locations for batch mode from file and CLI
+            Empty lines and lines starting with '#' are skipped
+            :return: location name and provider pages of each location
+            :rtype: list
+        """
+
+        lines = list(self.args.location or [])
+
+        if self.args.locations:
+            with open(self.get_path(self.args.locations), 'r',
+                      encoding='utf-8') as f:
+                lines.extend(f.read().splitlines())
+
+        return [self.parse_location(line) for line in lines
+                if line.strip() and not line.lstrip().startswith('#')]
+
+    def run_location(self, title, location, URLs, argv):
+        """ Runs provider for a location
+            :param title: provider title
+            :param location: location name
+            :param URLs: provider pages of the location
+            :param argv: provider arguments
+            :return: location, provider title, weather info and title
+                     for output, weather info is None if not found
+            :rtype: tuple
+        """
+
+        provider = self.providers.get(title)(self)
+        location_set = provider.resolve_location(location, URLs.get(title))
+
+        if location_set is None:
+            self.logger.warning(f'{title}: {location} is not found, '
+                                'add its page to locations')
+            return location, title, None, None
+
+        provider.use_location(location_set)
+        weather_info, output_title = provider.run(argv)
+
+        return location, title, weather_info, output_title
+
+    def write_location(self, location, title, weather_info, output_title,
+                       writer=None):
+        """ Writes out weather info of location in batch format
+            :param location: location name
+            :param title: provider title
+            :param weather_info: weather information
+            :param output_title: weather information title
+            :param writer: csv writer for 'csv' format
+        """
+
+        if self.args.batch_format == 'json':
+            self.stdout.write(json.dumps(
+                {'Location': location, 'Provider': title,
+                 'Title': output_title, 'Info': weather_info},
+                ensure_ascii=False) + '\n')
+        elif self.args.batch_format == 'csv':
+            for key in weather_info:
+                writer.writerow([location, title, key, weather_info[key]])
+        else:
+            self.show_output(weather_info, output_title)
+            return
+
+        self.stdout.flush()
+
+    def run_batch(self, titles, get_options=False):
+        """ Runs providers for many locations
+            Jobs run in a thread pool, results are written
+            as soon as they are ready.
+            Requests to one host are limited by the transport
+            :param titles: providers titles
+            :param get_options: take show options from providers config
+            :return: number of locations not found or failed
+            :rtype: int
+        """
+
+        jobs = []
+        failed = 0
+        writer = None
+
+        if self.args.batch_format == 'csv':
+            writer = csv.writer(self.stdout, lineterminator='\n')
+            writer.writerow(['Location', 'Provider', 'Key', 'Value'])
+
+        with ThreadPoolExecutor(max_workers=self.get_workers()) as executor:
+            for location, URLs in self.get_locations():
+                for title in titles:
+                    argv = self.get_option_args(title) if get_options \
+                        else list(self.remaining_args)
+                    jobs.append(executor.submit(
+                        self.run_location, title, location, URLs, argv))
+
+            for job in as_completed(jobs):
+                try:
+                    location, title, weather_info, output_title = \
+                        job.result()
+                except Exception as err:  # other locations still go
+                    self.logger.error(f'Location is not loaded: {err}')
+                    failed += 1
+                    continue
+                if weather_info is None:
+                    failed += 1
+                    continue
+                self.write_location(location, title, weather_info,
+                                    output_title, writer)
+
+        return failed
+
+    def data_changed(self, results):
+        """ Checks if weather info is changed since the last run
+            Digests of the last info of each provider and location
+            are kept in output state file, apart from cache,
+            so pruned cache does not look like changed info
+            :param results: weather info and title of each provider
+            :return: True if info of any provider is changed
+            :rtype: boolean
+        """
+
+        backend = config.FileBackend()
+        try:
+            state = json.loads(backend.read(self.output_state_path) or '{}')
+        except ValueError:  # broken file, info is shown again
+            state = {}
+        changed = False
+
+        for weather_info, title in results:
+            # info of expired page is the same info
+            key = title.replace(config.STALE_MARK, '')
+            digest = hashlib.sha1(json.dumps(
+                weather_info, sort_keys=True).encode('utf-8')).hexdigest()
+            if state.get(key) != digest:
+                state[key] = digest
+                changed = True
+
+        if changed:
+            backend.write(self.output_state_path,
+                          json.dumps(state, ensure_ascii=False))
+
+        return changed
+
+    def produce_summary(self, run_time):
+        """ Prints out loading time of each provider and total time
+            :param run_time: time of all providers run, seconds
+        """
+
+        self.stdout.write('\nЧас завантаження:\n')
+        for title in self.run_times:
+            self.stdout.write(f"{title}: {self.run_times[title]:.2f} с\n")
+        self.stdout.write(f"Всього: {run_time:.2f} с\n")
+
+        stats = getattr(get_transport(), 'stats', None)
+        if stats:
+            self.stdout.write(f"Отримано: {stats['Received']} байт, "
+                              f"розпаковано: {stats['Pages']} байт\n")
+
     # @decorators.show_loading
     def main(self):
         """ Runs application """
@@ -201,12 +560,22 @@ Provider options:
         weather_info = {}
         title = ''
         get_options = False
+        produce_files = True  # False if info is not changed
 
         # clear cache first and exit. If no such option - continue
         if self.args.clear_cache:
             self.clear_cache()
             return None
 
+        if self.args.cache_prune:
+            self.prune_cache()
+            if not self.args.cache_stats:
+                return None
+
+        if self.args.cache_stats:
+            self.cache_stats()
+            return None
+
         # check if config file is valid, exit if not
         if not config.is_valid():
             self.stdout.write('Config files are broken. ' +
@@ -219,6 +588,17 @@ Provider options:
 
         command = self.args.command
 
+        if self.args.locations or self.args.location:
+            # one provider if given, else all shown ones
+            if command in self.providers.get_list():
+                titles = [command]
+            else:
+                titles = [item for item in config.PROVIDERS_CONF
+                          if config.PROVIDERS_CONF[item]['Show'] is True]
+            if self.run_batch(titles, get_options):
+                sys.exit(1)  # some locations are not shown
+            return None
+
         if command in self.commands:
             command_factory = self.commands.get(command)
             command_factory(self).run()
@@ -228,33 +608,57 @@ Provider options:
                 self.remaining_args = self.get_option_args(command)
             provider = self.providers.get(command)
             weather_info, title = provider(self).run()
-            self.produce_output(weather_info, title)
+            if not self.args.if_changed or \
+                    self.data_changed([(weather_info, title)]):
+                self.produce_output(weather_info, title)
+            else:
+                produce_files = False
 
         elif not command:  # run all providers if 'Show' option is set
-            for item in config.PROVIDERS_CONF:
-                if get_options:  # get options if no CLI provider args
-                    self.remaining_args = self.get_option_args(item)
-
-                if config.PROVIDERS_CONF[item]['Show'] is True:
-                    provider = self.providers.get(item)
-                    weather_info, title = provider(self).run()
-                    self.produce_output(weather_info, title)
+            titles = [item for item in config.PROVIDERS_CONF
+                      if config.PROVIDERS_CONF[item]['Show'] is True]
+            # print out each provider as soon as it is ready,
+            # unless it is not known yet if any info is changed
+            on_ready = None
+            if self.args.progressive and not self.args.if_changed:
+                on_ready = self.show_output
+
+            start_time = time.perf_counter()
+            results = self.run_providers(titles, get_options, on_ready)
+            run_time = time.perf_counter() - start_time
+
+            if self.args.if_changed and not self.data_changed(results):
+                results = []
+                produce_files = False
+
+            # files get all providers in the same order anyway
+            for weather_info, title in results:
+                self.produce_output(weather_info, title,
+                                    show=on_ready is None)
+
+            if self.args.summary:
+                self.produce_summary(run_time)
 
         else:
             self.stdout.write('No such command')
 
-        if self.args.csv:
-            self.save_csv(config.ACTUAL_WEATHER_INFO, self.args.csv)
+        if self.args.csv and produce_files:
+            self.save_csv(config.ACTUAL_WEATHER_INFO,
+                          str(self.get_path(self.args.csv)))
 
-        if self.args.save:
-            self.save_txt(config.ACTUAL_PRINTABLE_INFO, self.args.save)
+        if self.args.save and produce_files:
+            self.save_txt(config.ACTUAL_PRINTABLE_INFO,
+                          str(self.get_path(self.args.save)))
 
-        config.save_config(config.CONFIG)
-        config.write_providers_conf()
+        config.save()
 
 
-if __name__ == "__main__":
-    Ap = App()
+def run(argv=None):
+    """ Runs application in this process
+        :param argv: CLI arguments, sys.argv by default
+    """
+
+    Ap = App(argv)
     try:
         Ap.main()
     except Exception:
@@ -262,4 +666,22 @@ if __name__ == "__main__":
             Ap.logger.exception('Unexpected error')
         else:
             Ap.logger.error(f'Unexpected error, {sys.exc_info()[0]}')
-        sys.exit()
+        sys.exit(1)
+
+
+def main(argv=None):
+    """ Runs application in daemon if it is running, here otherwise
+        :param argv: CLI arguments, sys.argv by default
+    """
+
+    argv = sys.argv[1:] if argv is None else list(argv)
+    code = daemon.forward(argv)
+
+    if code is None:
+        run(argv)
+    else:
+        sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+""" Thin client of application
+    Sends CLI arguments to running daemon, see 'Daemon' command.
+    Application is imported and run here only if daemon is not running,
+    so runs for shell prompts and status bars cost Python startup only.
+
+    Usage: python client.py [app arguments]
+"""
+
+import sys
+
+from managers import daemon
+
+
+def main(argv=None):
+    """ Runs application in daemon or in this process
+        :param argv: CLI arguments, sys.argv by default
+    """
+
+    argv = sys.argv[1:] if argv is None else list(argv)
+    code = daemon.forward(argv)
+
+    if code is None:
+        import app  # loads providers and config, daemon is not running
+        app.run(argv)
+    else:
+        sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,25 +4,60 @@
     weather_config.ini:   # application configuration
     providers_conf.json:  # providers configuration
 
+    Files are read on first access of CONFIG, WEATHER_PROVIDERS or
+    PROVIDERS_CONF and written by save() only if configuration is changed.
+
     Defaults:
-    WEATHER_PROVIDERS:    # providers defaults; cache path; display type
-    PROVIDERS_CONF:       # providers web parsing options
+    DEFAULT_WEATHER_PROVIDERS:  # providers defaults; cache path; display type
+    DEFAULT_PROVIDERS_CONF:     # providers web parsing options
 
 """
 
 from urllib.parse import quote, unquote
 import pathlib
 import configparser
+import io
 import json
+import locale
+import os
+import tempfile
+import threading
 
 import config.decorators
 
 """ Define global params """
 # Defaults
-WEATHER_PROVIDERS = {
+DEFAULT_WEATHER_PROVIDERS = {
 'App': {
         'Cache_path': str(pathlib.Path.cwd() / 'Cache'),
-        'Display': 'table'
+        'Catalog_path': str(pathlib.Path.cwd() / 'locations_catalog.tsv'),
+        'Display': 'table',
+        'Workers': 3,
+        'Pool_size': 2,
+        'Connect_timeout': 10,
+        'Read_timeout': 30,
+        'DNS_cache_time': 300,
+        'Host_connections': 4,
+        'Cache_compression': 'zlib',
+        'Cache_backend': 'files',
+        'Cache_max_size': 50,
+        'Cache_max_entries': 0,
+        'Adaptive_TTL': 0,
+        'TTL_min': 10,
+        'TTL_max': 360,
+        'Lease_wait': 10,
+        'Lease_time': 60,
+        'Streaming': 0,
+        'Stale_time': 0,
+        'Stale_if_error': 1,
+        'Browse_prefetch': 10,
+        'Serve_host': '127.0.0.1',
+        'Serve_port': 8080,
+        'Serve_cache_time': 60,
+        'Serve_cache_entries': 1000,
+        'Host_rate': 0,
+        'Host_burst': 10,
+        'Refresh_jitter': 10
         },
 'Accuweather': {'Title': 'Accuweather',
         'URL': "https://www.accuweather.com" +
@@ -33,23 +68,28 @@ WEATHER_PROVIDERS = {
                 "/uk/ua/kyiv/324505/daily-weather-forecast/324505?day=2",
         'Location': 'Київ',
         'URL_locations': "https://www.accuweather.com/uk/browse-locations",
-        'Caching_time': 60
+        'Caching_time': 60,
+        'Caching_time_hourly': 60,
+        'Caching_time_next_day': 180,
+        'Caching_time_locations': 1440
                 },
 'RP5': {'Title': 'RP5',
         'URL': "http://rp5.ua/" + quote("Погода_в_Києві"),
         'Location': 'Київ',
         'URL_locations': "http://rp5.ua/" + quote("Погода_в_світі"),
-        'Caching_time': 60
+        'Caching_time': 60,
+        'Caching_time_locations': 1440
         },
 'Sinoptik': {'Title': 'Sinoptik',
         'URL': "https://ua.sinoptik.ua/" + quote("погода-київ"),
         'Location': 'Київ',
         'URL_locations': "https://ua.sinoptik.ua/" + quote("погода-європа"),
-        'Caching_time': 60
+        'Caching_time': 60,
+        'Caching_time_locations': 1440
         }
 }
 # Defaults
-PROVIDERS_CONF = {
+DEFAULT_PROVIDERS_CONF = {
                 'Accuweather': {'Show': True,
                                 'Next_day': False,
                                 'Next_hours': True},
@@ -65,20 +105,174 @@ ACTUAL_WEATHER_INFO = {}
 ACTUAL_PRINTABLE_INFO = {}
 WORKING_DIR = pathlib.Path.cwd()
 CACHING_TIME = 60
+CATALOG_FILE = 'locations_catalog.tsv'  # in WORKING_DIR if not configured
+OUTPUT_STATE_FILE = '.wfapp_output.json'  # last output for --if-changed
+STALE_MARK = ' (застарілі дані)'  # added to title of info from expired page
+CATALOG_CHECKPOINT = 20  # pages crawled between checkpoints of catalog build
+WORKERS = 3  # providers running at the same time
+POOL_SIZE = 2  # idle connections kept for each host
+CONNECT_TIMEOUT = 10  # seconds
+READ_TIMEOUT = 30  # seconds
+DNS_CACHE_TIME = 300  # seconds
+HOST_CONNECTIONS = 4  # requests to one host at the same time, 0 - no limit
+CACHE_COMPRESSION = 'zlib'  # 'none', 'zlib' or 'lzma'
+CACHE_BACKEND = 'files'  # 'files' or 'sqlite'
+CACHE_MAX_SIZE = 50  # megabytes of cache on disk, 0 - no limit
+CACHE_MAX_ENTRIES = 0  # cached pages, 0 - no limit
+ADAPTIVE_TTL = 0  # 1 - adapt caching time of pages to their changes
+TTL_MIN = 10  # minutes, bounds of adaptive caching time
+TTL_MAX = 360
+LEASE_WAIT = 10  # seconds to wait for page loaded by other process
+LEASE_TIME = 60  # seconds page may be loaded by one process at most
+STREAMING = 0  # 1 - stop loading pages after blocks providers need
+STALE_TIME = 0  # minutes expired page is shown while it is refreshed
+STALE_IF_ERROR = 1  # 1 - show expired page if provider is down
+BROWSE_PREFETCH = 10  # pages loaded while user browses locations, 0 - off
+BROWSE_WORKERS = 4  # pages loaded at the same time while browsing
+SERVE_HOST = '127.0.0.1'  # address of HTTP service
+SERVE_PORT = 8080
+SERVE_CACHE_TIME = 60  # seconds answers of HTTP service are kept in memory
+SERVE_CACHE_ENTRIES = 1000  # answers of HTTP service kept in memory at most
+HOST_RATE = 0  # requests to one host a minute, 0 - no limit
+HOST_BURST = 10  # requests to one host made at once before rate limit
+REFRESH_JITTER = 10  # percent of caching time scheduled refresh is moved
+REFRESH_RETRY = 60  # seconds to wait before refresh of failed page
+NUMERIC_OPTIONS = ('Caching_time', 'Workers', 'Pool_size', 'Connect_timeout',
+                   'Read_timeout', 'DNS_cache_time', 'Host_connections',
+                   'Streaming', 'Stale_time',
+                   'Stale_if_error', 'Cache_max_size',
+                   'Cache_max_entries', 'Adaptive_TTL', 'TTL_min', 'TTL_max',
+                   'Caching_time_hourly', 'Caching_time_next_day',
+                   'Caching_time_locations', 'Lease_wait',
+                   'Lease_time', 'Browse_prefetch', 'Serve_port',
+                   'Serve_cache_time', 'Serve_cache_entries', 'Host_rate',
+                   'Host_burst', 'Refresh_jitter')  # stored as numbers
 
-CONFIG = configparser.ConfigParser()
-CONFIG.optionxform = str
 CONFIG_PATH = 'weather_config.ini'
 PROVIDERS_CONF_PATH = 'providers_conf.json'
+FALLBACK_ENCODING = 'cp1251'  # locale encoding of config saved on Windows
+LAZY_OPTIONS = ('CONFIG', 'WEATHER_PROVIDERS',
+                'PROVIDERS_CONF')  # loaded on first access
+
+
+class FileBackend:
+    """ Keeps configuration files in working directory
+        Files are replaced atomically, so other process never reads
+        a half-written file.
+        Files saved by older versions are in locale encoding,
+        they are read and written in their encoding
+    """
+
+    def __init__(self):
+        """ Initialize backend """
+
+        self.encodings = {}  # path: encoding file was read in
+
+    @staticmethod
+    def get_encodings():
+        """ Gets encodings config files may be in
+            :return: encodings to try, in order
+            :rtype: list
+        """
+
+        encodings = ['utf-8', locale.getpreferredencoding(False),
+                     FALLBACK_ENCODING]
+
+        return list(dict.fromkeys(encoding.lower() for encoding in encodings))
+
+    def read(self, path):
+        """ Reads file
+            :param path: file path
+            :return: file text or None if there is no file
+            :rtype: string
+        """
+
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        for encoding in self.get_encodings():
+            try:
+                text = data.decode(encoding)
+            except (UnicodeDecodeError, LookupError):
+                continue
+            self.encodings[str(path)] = encoding
+            return text.replace('\r\n', '\n')
+
+        return data.decode('utf-8', 'replace').replace('\r\n', '\n')
+
+    def write(self, path, text):
+        """ Writes file
+            :param path: file path
+            :param text: file text
+        """
+
+        encoding = self.encodings.get(str(path), 'utf-8')
+        try:
+            text.encode(encoding)
+        except UnicodeEncodeError:  # new values are not in file encoding
+            encoding = 'utf-8'
+
+        full_path = pathlib.Path(path).absolute()
+        fd, temp_path = tempfile.mkstemp(prefix=f'.{full_path.name}.',
+                                         suffix='.tmp',
+                                         dir=str(full_path.parent))
+        try:
+            with os.fdopen(fd, 'w', encoding=encoding) as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, str(full_path))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+        self.encodings[str(path)] = encoding
+
+
+class MemoryBackend:
+    """ Keeps configuration files in memory, for tests and benchmarks """
+
+    def __init__(self, files=None):
+        """ Initialize backend
+            :param files: {path: text} of existing files
+        """
+
+        self.files = dict(files or {})
+        self.writes = 0
+
+    def read(self, path):
+        return self.files.get(path)
+
+    def write(self, path, text):
+        self.files[path] = text
+        self.writes += 1
+
+
+_backend = FileBackend()
+_loaded = False
+_snapshots = {}  # path: file text as loaded or saved, None if no file
+_lock = threading.RLock()
+
+
+def __getattr__(name):
+    """ Loads configuration on first access of its options
+        :param name: module attribute name
+    """
+
+    if name in LAZY_OPTIONS:
+        load()
+        return globals()[name]
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def restore_providers_conf():
     """ Restores providers configuration file """
 
-    path_providers = pathlib.Path(PROVIDERS_CONF_PATH)
-
-    with open(path_providers, 'w') as conf_file:
-        json.dump(PROVIDERS_CONF, conf_file)
+    _backend.write(PROVIDERS_CONF_PATH, json.dumps(DEFAULT_PROVIDERS_CONF))
 
 
 def load_providers_conf():
@@ -87,77 +281,93 @@ def load_providers_conf():
         :rtype: dictionary
     """
 
-    path_providers = pathlib.Path(PROVIDERS_CONF_PATH)
+    return json.loads(_backend.read(PROVIDERS_CONF_PATH))
 
-    with open(path_providers, 'r') as conf_file:
-        providers_configuration = json.load(conf_file)
 
-    return providers_configuration
+def dump_providers_conf():
+    """ Makes text of providers configuration file
+        :rtype: string
+    """
+
+    return json.dumps(PROVIDERS_CONF)
 
 
 def write_providers_conf():
     """ Saves to file providers configuration """
 
-    path_providers = pathlib.Path(PROVIDERS_CONF_PATH)
-
-    with open(path_providers, 'w') as conf_file:
-        json.dump(PROVIDERS_CONF, conf_file)
+    text = dump_providers_conf()
+    _backend.write(PROVIDERS_CONF_PATH, text)
+    _snapshots[PROVIDERS_CONF_PATH] = text
 
 
 def initiate_providers_conf():
-    """ Checks if configuration file existed
-        if no file creates one with default conf
-        Loads configuration from a file at the end
-        :return: provider conf loaded from providers_conf.json
+    """ Loads providers configuration from file
+        Defaults are taken if there is no file,
+        the file is created by save()
+        :return: providers configuration
         :rtype: dictionary
     """
-    path_providers = pathlib.Path(PROVIDERS_CONF_PATH)
-
-    if not path_providers.exists():
-        restore_providers_conf()
 
-    providers_configuration = load_providers_conf()
+    if _backend.read(PROVIDERS_CONF_PATH) is None:
+        return json.loads(json.dumps(DEFAULT_PROVIDERS_CONF))  # copy
 
-    return providers_configuration
+    return load_providers_conf()
 
 
-def write_config(config):
+def write_config(config, weather_providers=None):
     """ Writes WEATHER_PROVIDERS attributes to config
         :param config: ConfigParser instance
+        :param weather_providers: providers settings, current by default
         :return: config
         :rtype: ConfigParser instance
     """
 
-    for item in WEATHER_PROVIDERS:
+    if weather_providers is None:
+        load()
+        weather_providers = WEATHER_PROVIDERS
+
+    for item in weather_providers:
         config[item] = {}
-        for key in WEATHER_PROVIDERS[item]:
-                config[item][key] = unquote(str(WEATHER_PROVIDERS[item][key]))
+        for key in weather_providers[item]:
+                config[item][key] = unquote(str(weather_providers[item][key]))
 
     return config
 
 
+def dump_config(config):
+    """ Makes text of config file with current values
+        :param config: ConfigParser instance
+        :rtype: string
+    """
+
+    text = io.StringIO()
+    write_config(config, WEATHER_PROVIDERS).write(text)
+
+    return text.getvalue()
+
+
 def save_config(config):
     """ Saves config to file with current values
         :param config: ConfigParser instance
     """
 
-    config = write_config(config)
-    path = pathlib.Path(CONFIG_PATH)
-
-    with open(path, 'w') as f:
-        config.write(f)
+    text = dump_config(config)
+    _backend.write(CONFIG_PATH, text)
+    _snapshots[CONFIG_PATH] = text
 
 
-def load_config(config):
+def load_config(config, text=None):
     """ Loads configuration to WEATHER_PROVIDERS
         :param config: ConfigParser instance
+        :param text: config file text, read from file if None
         :return: providers settings
         :rtype: dictionary
     """
 
     weather_providers = {}
 
-    config.read(CONFIG_PATH)
+    config.read_string(text if text is not None
+                       else _backend.read(CONFIG_PATH) or '')
 
     # load configuration to the weather_providers dict
     # if no entry - pass. Check config file with is_valid()
@@ -165,9 +375,8 @@ def load_config(config):
         for item in config:
             weather_providers[item] = {}
             for key in config[item]:
-                if key == 'Caching_time':
-                    weather_providers[item]['Caching_time'] = \
-                        int(config[item][key])
+                if key in NUMERIC_OPTIONS:
+                    weather_providers[item][key] = int(config[item][key])
                 elif key == 'Location':
                     weather_providers[item][key] = config[item][key]
                 # if key is URL apply 'urlib.quote'
@@ -187,27 +396,28 @@ def restore_config(config):
         :rtype: ConfigParser instance
     """
 
-    config = write_config(config)
+    config = write_config(config, DEFAULT_WEATHER_PROVIDERS)
 
     return config
 
 
 def initiate_config(config):
     """ Initiates config
-        Sets weather_providers and other conf variables
+        Sets weather_providers and other conf variables.
+        Defaults are taken if there is no config file,
+        the file is created by save()
         :param config: ConfigParser instance
         :return: configuration and providers settings dictionary
         :rtype: tuple
     """
 
-    weather_providers = {}
-    path = pathlib.Path(CONFIG_PATH)
+    text = None
 
-    if not path.exists():  # create new config file with defaults
+    if _backend.read(CONFIG_PATH) is None:  # defaults, file is not read
         config = restore_config(config)
-        save_config(config)
+        text = ''
 
-    weather_providers = load_config(config)
+    weather_providers = load_config(config, text)
 
     return config, weather_providers
 
@@ -236,11 +446,11 @@ def set_config(title, variables, weather_providers):
 
 def is_valid():
     """ Checks config file for existing values in config file
-        Should be run after initiate_config() (loaded file)
         :return: False if config file is broken
         :rtype: boolean
     """
 
+    load()
     valid_config = True
 
     # check if values in config exists
@@ -265,8 +475,100 @@ def is_valid():
     return valid_config
 
 
-CONFIG, WEATHER_PROVIDERS = initiate_config(CONFIG)
-PROVIDERS_CONF = initiate_providers_conf()
+def load():
+    """ Loads configuration files, once
+        Snapshots of loaded configuration are kept to find changes
+    """
+
+    global CONFIG, WEATHER_PROVIDERS, PROVIDERS_CONF, _loaded
+
+    with _lock:
+        if _loaded:
+            return
+
+        exists = {path: _backend.read(path) is not None
+                  for path in (CONFIG_PATH, PROVIDERS_CONF_PATH)}
+
+        CONFIG = configparser.ConfigParser()
+        CONFIG.optionxform = str
+        CONFIG, WEATHER_PROVIDERS = initiate_config(CONFIG)
+        PROVIDERS_CONF = initiate_providers_conf()
+
+        # missing files differ from any configuration, so they are saved
+        _snapshots[CONFIG_PATH] = \
+            dump_config(CONFIG) if exists[CONFIG_PATH] else None
+        _snapshots[PROVIDERS_CONF_PATH] = \
+            dump_providers_conf() if exists[PROVIDERS_CONF_PATH] else None
+        _loaded = True
+
+
+def unload():
+    """ Forgets loaded configuration, next access loads it again """
+
+    global _loaded
+
+    with _lock:
+        _loaded = False
+        _snapshots.clear()
+        for name in LAZY_OPTIONS:
+            globals().pop(name, None)
+
+
+def reload_config():
+    """ Loads configuration files again
+        Used by long running process when files are changed by other one
+    """
+
+    with _lock:
+        unload()
+        load()
+
+
+def is_dirty():
+    """ Checks if configuration is changed since it was loaded or saved
+        :rtype: boolean
+    """
+
+    with _lock:
+        if not _loaded:
+            return False
+
+        return dump_config(CONFIG) != _snapshots[CONFIG_PATH] or \
+            dump_providers_conf() != _snapshots[PROVIDERS_CONF_PATH]
+
+
+def save():
+    """ Saves changed configuration files
+        Nothing is written if configuration was not loaded
+        or is the same as in files
+    """
+
+    with _lock:
+        if not _loaded:
+            return
+
+        if dump_config(CONFIG) != _snapshots[CONFIG_PATH]:
+            save_config(CONFIG)
+        if dump_providers_conf() != _snapshots[PROVIDERS_CONF_PATH]:
+            write_providers_conf()
+
+
+def set_backend(backend):
+    """ Replaces storage of configuration files
+        Configuration is loaded from the new backend on next access
+        :param backend: FileBackend, MemoryBackend or any object
+                        with read() and write()
+        :return: previous backend
+    """
+
+    global _backend
+
+    with _lock:
+        previous, _backend = _backend, backend
+        unload()
+
+    return previous
+
 
 if __name__ == "__main__":
     pass
@@ -0,0 +1,806 @@
+""" Page cache storage
+    Cached page may be saved compressed, then the file starts with a header:
+        magic:  # b'WBC' and format version
+        codec:  # 1 byte, 0 - none, 1 - zlib, 2 - lzma
+        size:   # 8 bytes, size of uncompressed page
+    Files without header are raw pages, as saved by older versions.
+
+    pack_page:        # page to cache file content
+    unpack_page:      # cache file content to page
+    get_cache_stats:  # entries and sizes of cache directory
+
+    Cache backends keep pages with their load time and validators:
+    CacheBackend:     # backend interface
+    FileCache:        # .wbc file per page with .wbm file of validators
+    SQLiteCache:      # all pages in one indexed database file
+
+    Lease:            # cross-process lock of a page being loaded
+
+    All providers share one backend, get it with get_cache().
+    'Cache_backend' option of App selects it: 'files' or 'sqlite'.
+    Backend size is bounded by 'Cache_max_size' and 'Cache_max_entries',
+    least recently used pages are removed first. Size of cache is counted
+    once and then kept by saves, so cache is listed only when it is
+    pruned, and pruned below the limits to be pruned seldom.
+"""
+
+import abc
+import hashlib
+import json
+import lzma
+import math
+import os
+import pathlib
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+from config import config
+
+MAGIC = b'WBC\x01'
+HEADER = struct.Struct('>4sBQ')
+CODECS = {'none': 0, 'zlib': 1, 'lzma': 2}
+CODEC_NAMES = {number: name for name, number in CODECS.items()}
+DATABASE_NAME = 'cache.sqlite'
+LEASE_POLL = 0.1  # seconds between attempts to take a lease
+USE_RESOLUTION = 600  # seconds, last use of page is not updated more often
+PRUNE_TARGET = 0.9  # share of limits cache is pruned to when they are hit
+TEMP_FILE_AGE = 3600  # seconds, older temporary files are left by crashes
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def pack_page(data, codec='none'):
+    """ Prepares page for saving to cache
+        :param data: loaded web page
+        :param codec: 'none', 'zlib' or 'lzma'
+        :return: cache file content
+        :rtype: bytes
+    """
+
+    if codec == 'zlib':
+        packed = zlib.compress(data)
+    elif codec == 'lzma':
+        packed = lzma.compress(data)
+    else:  # raw page, readable by older versions too
+        return data
+
+    return HEADER.pack(MAGIC, CODECS[codec], len(data)) + packed
+
+
+def read_header(data):
+    """ Reads cache file header
+        :param data: cache file content or its beginning
+        :return: codec name and page size, None if file has no header
+        :rtype: tuple
+    """
+
+    if len(data) < HEADER.size or not data.startswith(MAGIC):
+        return None
+
+    magic, codec, size = HEADER.unpack_from(data)
+
+    return CODEC_NAMES.get(codec, 'none'), size
+
+
+def unpack_page(data):
+    """ Restores page from cache file content
+        :param data: cache file content
+        :return: web page
+        :rtype: bytes
+    """
+
+    header = read_header(data)
+
+    if header is None:  # raw page
+        return data
+
+    codec, size = header
+    packed = data[HEADER.size:]
+
+    if codec == 'zlib':
+        return zlib.decompress(packed)
+    elif codec == 'lzma':
+        return lzma.decompress(packed)
+
+    return packed
+
+
+def get_cache_stats(path):
+    """ Counts cached pages and their sizes
+        :param path: cache directory
+        :return: number of entries, size on disk and size of pages
+        :rtype: dict
+    """
+
+    stats = {'Entries': 0, 'Stored': 0, 'Pages': 0}
+
+    for cache_file in pathlib.Path(path).glob('*.wbc'):
+        with open(cache_file, 'rb') as f:
+            header = read_header(f.read(HEADER.size))
+        stored = cache_file.stat().st_size
+
+        stats['Entries'] += 1
+        stats['Stored'] += stored
+        stats['Pages'] += stored if header is None else header[1]
+
+    return stats
+
+
+class CacheEntry:
+    """ Cached page
+        attributes:
+        URL:        # web page address
+        time:       # time page was loaded or revalidated, seconds
+        validators: # ETag, Last-Modified and Max-age of page
+        page:       # page content, decompressed
+    """
+
+    def __init__(self, URL, time, validators, page):
+        self.URL = URL
+        self.time = time
+        self.validators = validators
+        self.page = page
+
+
+class Lease:
+    """ Cross-process lock of a cached page
+        Lock file is created exclusively, so only one process
+        or thread holds the lease. Lock file of a crashed process
+        is removed when the lease time is over
+    """
+
+    def __init__(self, path, lease_time=60):
+        """ Initialize lease
+            :param path: lock file path
+            :param lease_time: time lease is held at most, seconds
+        """
+
+        self.path = pathlib.Path(path)
+        self.lease_time = lease_time
+        self.acquired = False
+        self.waited = False  # True if lease was held by other process
+
+    def acquire(self, wait=0):
+        """ Takes lease, waits for other holder if needed
+            :param wait: time to wait for other holder, seconds
+            :return: True if lease is taken
+            :rtype: boolean
+        """
+
+        deadline = time.time() + wait
+
+        while True:
+            try:
+                fd = os.open(str(self.path),
+                             os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                self.waited = True
+                if self.break_expired():
+                    continue
+                if time.time() >= deadline:
+                    return False
+                time.sleep(LEASE_POLL)
+                continue
+            except FileNotFoundError:  # no cache directory yet
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                continue
+
+            os.write(fd, str(os.getpid()).encode('utf-8'))
+            os.close(fd)
+            self.acquired = True
+
+            return True
+
+    def break_expired(self):
+        """ Removes lock file if its lease time is over
+            :return: True if lock file is removed or already released
+            :rtype: boolean
+        """
+
+        try:
+            if time.time() - self.path.stat().st_mtime > self.lease_time:
+                self.path.unlink()
+                return True
+        except FileNotFoundError:  # released meanwhile
+            return True
+
+        return False
+
+    def release(self):
+        """ Gives lease back """
+
+        if not self.acquired:
+            return
+
+        self.acquired = False
+        try:
+            self.path.unlink()
+        except FileNotFoundError:  # broken as expired
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class CacheBackend(abc.ABC):
+    """ Storage of cached pages """
+
+    def __init__(self, path, codec='none', max_size=0, max_entries=0):
+        """ Initialize backend
+            :param path: cache directory
+            :param codec: compression of saved pages
+            :param max_size: size of cache on disk, bytes, 0 - no limit
+            :param max_entries: number of cached pages, 0 - no limit
+        """
+
+        self.path = pathlib.Path(path)
+        self.codec = codec
+        self.max_size = max_size
+        self.max_entries = max_entries
+        self.use_resolution = USE_RESOLUTION
+        self._usage = None  # size and number of pages, counted on demand
+        self._usage_lock = threading.Lock()
+
+    @abc.abstractmethod
+    def load(self, URL):
+        """ Finds cached page
+            :param URL: web page address
+            :return: cached page or None if page is not in cache
+            :rtype: CacheEntry
+
+            Should be overriden
+        """
+
+    @abc.abstractmethod
+    def save(self, URL, page, validators, cache_time=None):
+        """ Saves loaded page
+            :param URL: web page address
+            :param page: loaded web page
+            :param validators: page validators
+            :param cache_time: time page was loaded, now if None
+
+            Should be overriden
+        """
+
+    @abc.abstractmethod
+    def touch(self, URL, validators):
+        """ Marks cached page as just loaded, updates its validators
+            :param URL: web page address
+            :param validators: page validators
+            :return: False if page is not in cache, e.g. it was pruned
+            :rtype: boolean
+
+            Should be overriden
+        """
+
+    @abc.abstractmethod
+    def clear(self):
+        """ Removes all cached pages
+
+            Should be overriden
+        """
+
+    @abc.abstractmethod
+    def entries(self):
+        """ Lists cached pages
+            :return: (key, load time, last use time, size on disk)
+                     of each page
+            :rtype: list
+
+            Should be overriden
+        """
+
+    @abc.abstractmethod
+    def remove(self, keys):
+        """ Removes cached pages
+            :param keys: keys of pages, as listed by entries()
+
+            Should be overriden
+        """
+
+    def prune(self, max_size=None, max_entries=None, older_than=None):
+        """ Removes old pages and least recently used ones
+            until cache fits the limits
+            :param max_size: size of cache on disk, bytes,
+                             backend limit if None
+            :param max_entries: number of cached pages,
+                                backend limit if None
+            :param older_than: age of pages to remove, seconds
+            :return: number of removed pages
+            :rtype: int
+        """
+
+        max_size = self.max_size if max_size is None else max_size
+        max_entries = self.max_entries if max_entries is None \
+            else max_entries
+        entries = sorted(self.entries(), key=lambda item: item[2])
+        size = sum(item[3] for item in entries)
+        count = len(entries)
+        now = time.time()
+        keys = []
+
+        for key, cache_time, used, entry_size in entries:
+            if (older_than is not None and cache_time < now - older_than) \
+                    or (max_size and size > max_size) \
+                    or (max_entries and count > max_entries):
+                keys.append(key)
+                size -= entry_size
+                count -= 1
+
+        if keys:
+            self.remove(keys)
+
+        with self._usage_lock:
+            self._usage = (size, count)
+
+        return len(keys)
+
+    def lease(self, URL, lease_time=60):
+        """ Gets cross-process lease of a page
+            Process holding it loads the page, the others wait
+            and take the page from cache
+            :param URL: web page address
+            :param lease_time: time lease is held at most, seconds
+            :rtype: Lease
+        """
+
+        filename = hashlib.md5(URL.encode('utf-8')).hexdigest() + '.lock'
+
+        return Lease(self.path / filename, lease_time)
+
+    def enforce_limits(self, size=0, count=0):
+        """ Prunes cache if backend has limits and they are exceeded
+            Cache is listed on first call only, then its size
+            is kept by saved pages
+            :param size: bytes added to cache by saved page
+            :param count: pages added to cache, 1 for new page
+        """
+
+        if not self.max_size and not self.max_entries:
+            return
+
+        with self._usage_lock:
+            if self._usage is None:
+                entries = self.entries()
+                self._usage = (sum(item[3] for item in entries),
+                               len(entries))
+            else:
+                self._usage = (self._usage[0] + size,
+                               self._usage[1] + count)
+            total_size, total_count = self._usage
+
+        if (self.max_size and total_size > self.max_size) or \
+                (self.max_entries and total_count > self.max_entries):
+            self.prune(math.ceil(self.max_size * PRUNE_TARGET),
+                       math.ceil(self.max_entries * PRUNE_TARGET))
+
+    def is_used_long_ago(self, used):
+        """ Checks if last use of page should be updated
+            :param used: time page was used last, seconds
+            :rtype: boolean
+        """
+
+        return used is None or time.time() - used >= self.use_resolution
+
+    @abc.abstractmethod
+    def stats(self):
+        """ Counts cached pages and their sizes
+            :return: number of entries, size on disk and size of pages
+            :rtype: dict
+
+            Should be overriden
+        """
+
+
+class FileCache(CacheBackend):
+    """ Keeps each page in its own file named by URL hash """
+
+    def get_file_path(self, URL):
+        """ Gets cache file full path
+            :param URL: web page address
+            :return: cache file path
+            :rtype: pathlib.Path
+        """
+
+        filename = hashlib.md5(URL.encode('utf-8')).hexdigest() + '.wbc'
+
+        return self.path.joinpath(filename)
+
+    def get_meta_file_path(self, URL):
+        """ Gets path of file with cached page validators
+            :param URL: web page address
+            :return: metadata file path
+            :rtype: pathlib.Path
+        """
+
+        return self.get_file_path(URL).with_suffix('.wbm')
+
+    def load_validators(self, URL):
+        """ Loads validators of cached page
+            :param URL: web page address
+            :rtype: dict
+        """
+
+        try:
+            with open(self.get_meta_file_path(URL), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_validators(self, URL, validators):
+        """ Saves validators of cached page
+            Old validators are removed if there are no new ones
+            :param URL: web page address
+            :param validators: page validators
+        """
+
+        meta_file = self.get_meta_file_path(URL)
+
+        if validators:
+            self.write_file(meta_file, json.dumps(validators).encode('utf-8'))
+        else:
+            try:
+                meta_file.unlink()
+            except FileNotFoundError:
+                pass
+
+    def write_file(self, path, data, file_time=None):
+        """ Writes file atomically
+            Data is written to a temporary file which then replaces
+            the target, so other processes never read a half-written file
+            :param path: target file path
+            :param data: file content
+            :param file_time: modification time to set, now if None
+        """
+
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=str(self.path))
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            if file_time is not None:
+                os.utime(temp_path, (time.time(), file_time))
+            os.replace(temp_path, str(path))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def load(self, URL):
+        """ Reads page file and its validators
+            Access time of file is set to mark page as used,
+            if it was not set recently
+        """
+
+        cache_file = self.get_file_path(URL)
+
+        try:
+            with open(cache_file, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                cache_time = stat.st_mtime
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        if self.is_used_long_ago(max(stat.st_atime, cache_time)):
+            try:
+                os.utime(cache_file, (time.time(), cache_time))
+            except OSError:  # replaced or removed by other process
+                pass
+
+        return CacheEntry(URL, cache_time, self.load_validators(URL),
+                          unpack_page(data))
+
+    def get_size(self, URL):
+        """ Gets size of cached page with its validators
+            :param URL: web page address
+            :return: size on disk, None if page is not cached
+            :rtype: int
+        """
+
+        size = None
+
+        for path in (self.get_file_path(URL), self.get_meta_file_path(URL)):
+            try:
+                size = (size or 0) + path.stat().st_size
+            except FileNotFoundError:
+                pass
+
+        return size
+
+    def save(self, URL, page, validators, cache_time=None):
+        """ Writes page file and its validators """
+
+        # providers may run in parallel, so directory could be just created
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        old_size = self.get_size(URL) \
+            if self.max_size or self.max_entries else None
+        data = pack_page(page, self.codec)
+
+        # page goes first: new validators with old page could make
+        # server answer 'not modified' to a changed page
+        self.write_file(self.get_file_path(URL), data, cache_time)
+        self.save_validators(URL, validators)
+
+        size = len(data) + (len(json.dumps(validators)) if validators else 0)
+        self.enforce_limits(size - (old_size or 0), int(old_size is None))
+
+    def touch(self, URL, validators):
+        """ Updates page file time and its validators """
+
+        try:
+            os.utime(self.get_file_path(URL))
+        except FileNotFoundError:  # removed by other process or pruned
+            return False
+
+        self.save_validators(URL, validators)
+
+        return True
+
+    def remove_temp_files(self, older_than=TEMP_FILE_AGE):
+        """ Removes temporary files left by processes crashed while
+            writing, files being written now are younger
+            :param older_than: age of files to remove, seconds
+        """
+
+        now = time.time()
+
+        for item in list(self.path.glob('*.tmp')):
+            try:
+                if item.stat().st_mtime < now - older_than:
+                    item.unlink()
+            except FileNotFoundError:  # renamed or removed by writer
+                pass
+
+    def prune(self, max_size=None, max_entries=None, older_than=None):
+        """ Removes old and least recently used pages,
+            and temporary files left by crashes
+        """
+
+        removed = super().prune(max_size, max_entries, older_than)
+        self.remove_temp_files()
+
+        return removed
+
+    def clear(self):
+        """ Removes page files and temporary files left by crashes """
+
+        if not self.path.exists():
+            return
+
+        for item in list(self.path.glob('*.wb[cm]')):
+            item.unlink()
+        self.remove_temp_files()
+
+        with self._usage_lock:
+            self._usage = None
+
+    def stats(self):
+        """ Counts page files """
+
+        return get_cache_stats(self.path)
+
+    def entries(self):
+        """ Lists page files, key is file name without suffix """
+
+        entries = []
+
+        for cache_file in self.path.glob('*.wbc'):
+            try:
+                stat = cache_file.stat()
+            except FileNotFoundError:  # removed by other process
+                continue
+            size = stat.st_size
+            meta_file = cache_file.with_suffix('.wbm')
+            if meta_file.exists():
+                size += meta_file.stat().st_size
+            entries.append((cache_file.stem, stat.st_mtime,
+                            max(stat.st_atime, stat.st_mtime), size))
+
+        return entries
+
+    def remove(self, keys):
+        """ Removes page files with their validators """
+
+        for key in keys:
+            for suffix in ('.wbc', '.wbm'):
+                try:
+                    self.path.joinpath(key + suffix).unlink()
+                except FileNotFoundError:
+                    pass
+
+
+class SQLiteCache(CacheBackend):
+    """ Keeps all pages in one SQLite database
+        Page, its load time and validators are found by one indexed lookup
+    """
+
+    def __init__(self, path, codec='none', max_size=0, max_entries=0):
+        """ Initialize backend, database is opened on first use """
+
+        super().__init__(path, codec, max_size, max_entries)
+
+        self.database_path = self.path / DATABASE_NAME
+        self._db = None
+        self._lock = threading.Lock()  # providers share the connection
+
+    def _connect(self):
+        """ Opens database, creates table of pages on first use
+            :return: database connection
+            :rtype: sqlite3.Connection
+        """
+
+        if self._db is None:
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.database_path), timeout=30,
+                                       check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS pages ('
+                             'URL TEXT PRIMARY KEY, time REAL NOT NULL, '
+                             'validators TEXT, size INTEGER, page BLOB, '
+                             'used REAL)')
+            columns = [row[1] for row in
+                       self._db.execute('PRAGMA table_info(pages)')]
+            if 'used' not in columns:  # database of older version
+                self._db.execute('ALTER TABLE pages ADD COLUMN used REAL')
+
+        return self._db
+
+    def load(self, URL):
+        """ Selects page row by URL
+            Row is marked as used, if it was not marked recently
+        """
+
+        with self._lock:
+            db = self._connect()
+            row = db.execute(
+                'SELECT time, validators, page, used FROM pages '
+                'WHERE URL = ?', (URL,)).fetchone()
+            if row is not None and self.is_used_long_ago(row[3]):
+                with db:
+                    db.execute('UPDATE pages SET used = ? WHERE URL = ?',
+                               (time.time(), URL))
+
+        if row is None:
+            return None
+
+        cache_time, validators, data, used = row
+
+        return CacheEntry(URL, cache_time, json.loads(validators or '{}'),
+                          unpack_page(bytes(data)))
+
+    def save(self, URL, page, validators, cache_time=None):
+        """ Inserts or replaces page row """
+
+        data = pack_page(page, self.codec)
+
+        with self._lock, self._connect() as db:
+            now = time.time()
+            old_size = db.execute(
+                'SELECT LENGTH(page) FROM pages WHERE URL = ?',
+                (URL,)).fetchone()
+            db.execute('INSERT OR REPLACE INTO pages '
+                       '(URL, time, validators, size, page, used) '
+                       'VALUES (?, ?, ?, ?, ?, ?)',
+                       (URL, now if cache_time is None else cache_time,
+                        json.dumps(validators), len(page),
+                        sqlite3.Binary(data), now))
+
+        if old_size is None:
+            self.enforce_limits(len(data), 1)
+        else:
+            self.enforce_limits(len(data) - (old_size[0] or 0))
+
+    def touch(self, URL, validators):
+        """ Updates time and validators of page row """
+
+        with self._lock, self._connect() as db:
+            cursor = db.execute('UPDATE pages SET time = ?, validators = ? '
+                                'WHERE URL = ?',
+                                (time.time(), json.dumps(validators), URL))
+
+        return cursor.rowcount > 0
+
+    def clear(self):
+        """ Deletes all page rows """
+
+        if not self.database_path.exists():
+            return
+
+        with self._lock, self._connect() as db:
+            db.execute('DELETE FROM pages')
+
+        with self._usage_lock:
+            self._usage = None
+
+    def stats(self):
+        """ Sums sizes of page rows """
+
+        stats = {'Entries': 0, 'Stored': 0, 'Pages': 0}
+
+        if not self.database_path.exists():
+            return stats
+
+        with self._lock:
+            entries, stored, pages = self._connect().execute(
+                'SELECT COUNT(*), SUM(LENGTH(page)), SUM(size) '
+                'FROM pages').fetchone()
+
+        stats['Entries'] = entries
+        stats['Stored'] = stored or 0
+        stats['Pages'] = pages or 0
+
+        return stats
+
+    def entries(self):
+        """ Lists page rows, key is page URL """
+
+        if not self.database_path.exists():
+            return []
+
+        with self._lock:
+            return self._connect().execute(
+                'SELECT URL, time, COALESCE(used, time), LENGTH(page) '
+                'FROM pages').fetchall()
+
+    def remove(self, keys):
+        """ Deletes page rows, freed space is reused by next pages """
+
+        with self._lock, self._connect() as db:
+            db.executemany('DELETE FROM pages WHERE URL = ?',
+                           [(key,) for key in keys])
+
+    def close(self):
+        """ Closes database connection """
+
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+BACKENDS = {'files': FileCache, 'sqlite': SQLiteCache}
+
+
+def get_cache():
+    """ Returns cache backend shared by providers
+        Backend is created with config settings on first call
+        :rtype: CacheBackend
+    """
+
+    global _cache
+
+    with _cache_lock:
+        if _cache is None:
+            options = config.WEATHER_PROVIDERS['App']
+            backend = BACKENDS.get(
+                options.get('Cache_backend', config.CACHE_BACKEND), FileCache)
+            _cache = backend(
+                options['Cache_path'],
+                options.get('Cache_compression', config.CACHE_COMPRESSION),
+                options.get('Cache_max_size', config.CACHE_MAX_SIZE) * 2**20,
+                options.get('Cache_max_entries', config.CACHE_MAX_ENTRIES))
+
+    return _cache
+
+
+def set_cache(cache):
+    """ Replaces cache backend shared by providers
+        :param cache: CacheBackend instance
+        :return: previous backend
+    """
+
+    global _cache
+
+    with _cache_lock:
+        previous, _cache = _cache, cache
+
+    return previous
@@ -0,0 +1,395 @@
+""" Locations catalog
+    Index of provider locations built by BuildCatalog command,
+    so a location is found by name without browsing provider pages.
+
+    Catalog:   # sorted index with case-insensitive prefix lookup
+               # and fuzzy search
+    Location:  # catalog entry
+
+    Index file is a text file, a line per location sorted by key:
+        key \t name \t provider \t URL \t path
+    key is casefolded name, path is names of upper location levels.
+
+    Search index is saved next to it, with '.search' suffix added:
+    trigram index of names grouped by provider and file offset
+    of each line. The file is a JSON line with strings of index and
+    lengths of arrays, followed by the arrays in machine format.
+    It is loaded by search instead of index file, so search costs
+    a few milliseconds in a new process too.
+
+    All commands share one catalog, get it with get_catalog().
+"""
+
+from array import array
+import bisect
+import collections
+import json
+import os
+import pathlib
+import sys
+import tempfile
+import threading
+
+from config import config
+from managers.search import TrigramIndex
+
+Location = collections.namedtuple('Location', 'key name provider URL path')
+SEARCH_VERSION = 2  # format of search index file
+SEARCH_ARRAYS = (('key_starts', 'I'), ('sizes', 'H'),
+                 ('sorted_numbers', 'I'), ('counts', 'I'),
+                 ('postings', 'I'), ('offsets', 'Q'))  # in file order
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def make_key(name):
+    """ Makes lookup key of location name
+        :param name: location name
+        :return: casefolded name with single spaces
+        :rtype: string
+    """
+
+    return ' '.join(name.casefold().split())
+
+
+class Catalog:
+    """ Sorted index of locations
+        Index is loaded on first lookup, lookups are binary searches
+    """
+
+    def __init__(self, path):
+        """ Initialize catalog
+            :param path: index file path
+        """
+
+        self.path = pathlib.Path(path)
+        self.search_path = self.path.with_name(self.path.name + '.search')
+        self.locations = None  # sorted by key, None until loaded
+        self.keys = []
+        self.index = None  # search index, loaded on first search
+        self._lock = threading.Lock()
+
+    def exists(self):
+        """ Checks if catalog is built
+            :rtype: boolean
+        """
+
+        return self.path.exists()
+
+    def load(self):
+        """ Loads index file
+            :return: locations sorted by key
+            :rtype: list
+        """
+
+        with self._lock:
+            if self.locations is None:
+                locations = []
+                if self.path.exists():
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        for line in f:
+                            fields = line.rstrip('\n').split('\t')
+                            if len(fields) == len(Location._fields):
+                                locations.append(Location(*fields))
+                self.keys = [location.key for location in locations]
+                self.locations = locations
+
+        return self.locations
+
+    def find(self, prefix, provider=None, limit=None):
+        """ Finds locations which names start with prefix
+            :param prefix: beginning of location name, any case
+            :param provider: provider title, all providers if None
+            :param limit: number of locations to return, all if None
+            :return: found locations sorted by name
+            :rtype: list
+        """
+
+        locations = self.load()
+        key = make_key(prefix)
+        found = []
+
+        for index in range(bisect.bisect_left(self.keys, key),
+                           len(locations)):
+            location = locations[index]
+            if not location.key.startswith(key):
+                break
+            if provider is None or location.provider == provider:
+                found.append(location)
+                if limit is not None and len(found) >= limit:
+                    break
+
+        return found
+
+    def get(self, name, provider):
+        """ Gets page of location with given name
+            :param name: location name, any case
+            :param provider: provider title
+            :return: location page or None if not found
+            :rtype: string
+        """
+
+        locations = self.load()
+        key = make_key(name)
+
+        for index in range(bisect.bisect_left(self.keys, key),
+                           len(locations)):
+            location = locations[index]
+            if location.key != key:
+                break
+            if location.provider == provider:
+                return location.URL
+
+        return None
+
+    def search(self, text, provider=None, limit=10):
+        """ Finds locations with names similar to text
+            Names are compared in Latin, so Cyrillic and Latin
+            spellings of the same name match
+            :param text: part of location name, any script and case
+            :param provider: provider title, all providers if None
+            :param limit: number of locations to return
+            :return: (score, location) from the best match
+            :rtype: list
+        """
+
+        search_index = self.get_search_index()
+
+        within = None
+        if provider is not None:
+            if provider not in search_index['providers']:
+                return []
+            within = range(*search_index['providers'][provider])
+
+        found = search_index['index'].search(text, limit, within=within)
+        locations = self.read_locations([number for score, number in found],
+                                        search_index['offsets'])
+
+        return [(score, location) for (score, number), location
+                in zip(found, locations)]
+
+    def get_stamp(self):
+        """ Gets size and modification time of index file
+            Search index made for other index file is not used
+            :rtype: tuple
+        """
+
+        stat = self.path.stat()
+
+        return stat.st_size, stat.st_mtime_ns
+
+    def make_search_index(self):
+        """ Makes search index of index file
+            Names are numbered by provider, so names of a provider
+            are a range of numbers
+            :return: trigram index of names, (first, last + 1) number
+                     of each provider and offset of each line in file
+            :rtype: dict
+        """
+
+        lines = collections.defaultdict(list)  # provider: (name, offset)
+        position = 0
+
+        with open(self.path, 'rb') as f:
+            for line in f:
+                fields = line.decode('utf-8').rstrip('\n').split('\t')
+                if len(fields) == len(Location._fields):
+                    location = Location(*fields)
+                    lines[location.provider].append((location.name,
+                                                     position))
+                position += len(line)
+
+        names, providers, offsets = [], {}, array('Q')
+        for provider in sorted(lines):
+            providers[provider] = (len(names), len(names) +
+                                   len(lines[provider]))
+            for name, offset in lines[provider]:
+                names.append(name)
+                offsets.append(offset)
+
+        return {'version': SEARCH_VERSION, 'stamp': self.get_stamp(),
+                'providers': providers, 'offsets': offsets,
+                'index': TrigramIndex(names)}
+
+    def save_search_index(self, search_index):
+        """ Writes search index file atomically
+            :param search_index: data of make_search_index()
+        """
+
+        data = dict(search_index['index'].dump(),
+                    offsets=search_index['offsets'])
+        header = {'version': SEARCH_VERSION, 'byteorder': sys.byteorder,
+                  'stamp': search_index['stamp'],
+                  'providers': search_index['providers'],
+                  'keys': data['keys'], 'trigrams': data['trigrams'],
+                  'arrays': [(name, array(typecode).itemsize,
+                              len(data[name]))
+                             for name, typecode in SEARCH_ARRAYS]}
+
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp',
+                                         dir=str(self.path.parent))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json.dumps(header).encode('utf-8') + b'\n')
+                for name, typecode in SEARCH_ARRAYS:
+                    data[name].tofile(f)
+            os.replace(temp_path, str(self.search_path))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def load_search_index(self):
+        """ Reads search index file
+            :return: search index or None if file is missing,
+                     broken or made for other index file
+            :rtype: dict
+        """
+
+        try:
+            with open(self.search_path, 'rb') as f:
+                header = json.loads(f.readline().decode('utf-8'))
+                if not self.is_search_header(header):
+                    return None
+
+                data = {'keys': header['keys'],
+                        'trigrams': header['trigrams']}
+                for (name, typecode), (_, _, length) in \
+                        zip(SEARCH_ARRAYS, header['arrays']):
+                    data[name] = array(typecode)
+                    data[name].fromfile(f, length)
+
+            index = TrigramIndex.from_dump(data)
+        except (OSError, EOFError, ValueError, TypeError, KeyError,
+                IndexError):
+            return None
+
+        return {'version': SEARCH_VERSION, 'stamp': self.get_stamp(),
+                'providers': {provider: tuple(numbers) for provider, numbers
+                              in header['providers'].items()},
+                'offsets': data['offsets'], 'index': index}
+
+    def is_search_header(self, header):
+        """ Checks search index file is made for index file
+            by this version on the same platform
+            :param header: JSON header of search index file
+            :rtype: boolean
+        """
+
+        return isinstance(header, dict) and \
+            header.get('version') == SEARCH_VERSION and \
+            header.get('byteorder') == sys.byteorder and \
+            header.get('stamp') == list(self.get_stamp()) and \
+            header.get('arrays') == [
+                [name, array(typecode).itemsize, length]
+                for (name, typecode), (_, _, length) in
+                zip(SEARCH_ARRAYS, header['arrays'])]
+
+    def get_search_index(self):
+        """ Gets search index, loaded from file
+            Index is made and saved if there is no valid file,
+            e.g. catalog is built by older version
+            :rtype: dict
+        """
+
+        with self._lock:
+            if self.index is None:
+                search_index = self.load_search_index()
+                if search_index is None:
+                    search_index = self.make_search_index()
+                    try:
+                        self.save_search_index(search_index)
+                    except OSError:  # read-only catalog is searched too
+                        pass
+                self.index = search_index
+
+            return self.index
+
+    def read_locations(self, numbers, offsets):
+        """ Reads locations by their numbers in search index
+            :param numbers: location numbers
+            :param offsets: file offsets of lines
+            :return: locations
+            :rtype: list
+        """
+
+        locations = []
+        with open(self.path, 'rb') as f:
+            for number in numbers:
+                f.seek(offsets[number])
+                fields = f.readline().decode('utf-8').rstrip('\n')
+                locations.append(Location(*fields.split('\t')))
+
+        return locations
+
+    def save(self, locations):
+        """ Writes index file and its search index
+            Files are replaced atomically, so lookups of other
+            processes never see a half-written index
+            :param locations: (name, provider, URL, path) of each location
+        """
+
+        locations = sorted(
+            Location(make_key(name), *(' '.join(str(field).split())
+                                       for field in (name, provider, URL,
+                                                     path)))
+            for name, provider, URL, path in locations)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp',
+                                         dir=str(self.path.parent))
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                for location in locations:
+                    f.write('\t'.join(location) + '\n')
+            os.replace(temp_path, str(self.path))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+        search_index = self.make_search_index()
+        self.save_search_index(search_index)
+
+        with self._lock:
+            self.keys = [location.key for location in locations]
+            self.locations = locations
+            self.index = search_index
+
+
+def get_catalog_path():
+    """ Gets index file path from config
+        :rtype: pathlib.Path
+    """
+
+    path = config.WEATHER_PROVIDERS['App'].get('Catalog_path')
+
+    return pathlib.Path(path) if path else config.WORKING_DIR / \
+        config.CATALOG_FILE
+
+
+def get_catalog():
+    """ Returns catalog shared by commands and providers
+        :rtype: Catalog
+    """
+
+    global _catalog
+
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = Catalog(get_catalog_path())
+
+    return _catalog
+
+
+def set_catalog(catalog):
+    """ Replaces shared catalog
+        :param catalog: Catalog instance
+        :return: previous catalog
+    """
+
+    global _catalog
+
+    with _catalog_lock:
+        previous, _catalog = _catalog, catalog
+
+    return previous
@@ -1,6 +1,7 @@
 """ Application command manager """
 
-from abstract.commands import ConfigureApp, Configure
+from abstract.commands import ConfigureApp, Configure, Prefetch, \
+    BuildCatalog, Search, Daemon, Serve, Schedule
 import abstract.abstract
 
 
@@ -22,7 +23,8 @@ class CommandManager(abstract.abstract.Manager):
     def _load_commands(self):
         """ Loads commands from commands.py """
 
-        for item in [ConfigureApp, Configure]:
+        for item in [ConfigureApp, Configure, Prefetch, BuildCatalog,
+                     Search, Daemon, Serve, Schedule]:
             self.commands[item.name] = item
 
     def add(self, name, command):
@@ -0,0 +1,226 @@
+""" Application daemon
+    Keeps application loaded between runs: imported providers,
+    open connections of transport and cache stay in memory.
+    Clients send CLI arguments over Unix socket and get output of the run.
+
+    DaemonServer:  # runs application for clients one run at a time
+    forward():     # client side, sends arguments to running daemon
+
+    Protocol: client sends a JSON line {"argv": [...], "cwd": "..."},
+    {"ping": true}
+    or {"stop": true}, daemon answers a JSON line {"output": "", "code": 0}
+    or {"local": true} if the run needs terminal and is left to client.
+
+    Client side imports nothing of application, so forwarded run
+    costs Python startup only.
+"""
+
+import contextlib
+import io
+import json
+import os
+import pathlib
+import socket
+import socketserver
+import sys
+import threading
+
+SOCKET_FILE = '.wfapp.sock'  # in working directory, as config files
+TIMEOUT = 120  # seconds client waits for answer
+INTERACTIVE = {'ConfigureApp', 'Configure', 'BuildCatalog', 'Daemon',
+               'Serve', 'Schedule'}  # not forwarded, need terminal or run long
+
+
+def get_socket_path():
+    """ Gets daemon socket path
+        WFAPP_SOCKET environment variable has priority
+        :rtype: pathlib.Path
+    """
+
+    return pathlib.Path(os.environ.get('WFAPP_SOCKET') or
+                        pathlib.Path.cwd() / SOCKET_FILE)
+
+
+def is_interactive(args):
+    """ Checks if run needs terminal or runs long
+        :param args: parsed CLI arguments of App
+        :rtype: boolean
+    """
+
+    return args.command in INTERACTIVE or bool(args.clear_cache)
+
+
+def request(message, path=None, timeout=TIMEOUT):
+    """ Sends message to daemon
+        Message sent to daemon is never sent again: if daemon does not
+        answer in time, answer with error is returned
+        :param message: request dict
+        :param path: socket path, get_socket_path() by default
+        :param timeout: seconds to wait for answer
+        :return: answer or None if daemon is not running
+        :rtype: dict
+    """
+
+    path = path or get_socket_path()
+    if not hasattr(socket, 'AF_UNIX') or not path.exists():
+        return None
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        try:
+            client.connect(str(path))
+        except OSError:  # socket of stopped daemon
+            return None
+
+        try:
+            client.sendall(json.dumps(message).encode('utf-8') + b'\n')
+            with client.makefile('rb') as answer:
+                line = answer.readline()
+        except OSError as err:
+            return {'output': f'Daemon did not answer, {err}\n', 'code': 1}
+
+    if not line:
+        return {'output': 'Daemon closed connection\n', 'code': 1}
+
+    return json.loads(line.decode('utf-8'))
+
+
+def forward(argv, stdout=None):
+    """ Runs application in daemon
+        Interactive commands are not forwarded, they need terminal.
+        Daemon checks parsed arguments too and leaves interactive
+        runs, e.g. with --clear-cache, to caller
+        :param argv: CLI arguments
+        :param stdout: stream for output of the run, sys.stdout by default
+        :return: exit code or None if the run should be done by caller
+        :rtype: int
+    """
+
+    if INTERACTIVE.intersection(argv):
+        return None
+
+    # file names in arguments are relative to directory of the caller
+    answer = request({'argv': list(argv), 'cwd': os.getcwd()})
+    if answer is None or answer.get('local'):
+        return None
+
+    stdout = stdout or sys.stdout
+    stdout.write(answer['output'])
+    stdout.flush()
+
+    return answer['code']
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    """ Handles one client request """
+
+    def handle(self):
+        try:
+            message = json.loads(self.rfile.readline().decode('utf-8'))
+        except ValueError:
+            return
+
+        answer = {'output': '', 'code': 0}
+        if message.get('stop'):
+            # shutdown waits for this request, so it is called from thread
+            threading.Thread(target=self.server.shutdown).start()
+        elif 'argv' in message:
+            result = self.server.run_app(message['argv'],
+                                         message.get('cwd'))
+            if result is None:
+                answer = {'local': True}
+            else:
+                answer['output'], answer['code'] = result
+
+        self.wfile.write(json.dumps(answer).encode('utf-8') + b'\n')
+
+
+class DaemonServer(socketserver.UnixStreamServer):
+    """ Unix socket server running application
+        Runs are done one after another, as they share
+        configuration and output of application
+    """
+
+    def __init__(self, app_factory, path=None):
+        """ Initialize server
+            Socket left by crashed daemon is removed
+            :param app_factory: App class, created with argv and
+                                directory of the caller for each run
+            :param path: socket path, get_socket_path() by default
+        """
+
+        self.path = path or get_socket_path()
+        self.app_factory = app_factory
+
+        if self.path.exists():
+            if request({'ping': True}, self.path, timeout=1) is not None:
+                raise OSError(f'Daemon is already running on {self.path}')
+            self.path.unlink()
+
+        super().__init__(str(self.path), DaemonHandler)
+        self.config_times = self.get_config_times()
+
+    @staticmethod
+    def get_config_times():
+        """ Gets modification times of config files
+            :rtype: tuple
+        """
+
+        from config import config  # client side must not load config
+
+        times = []
+        for path in (config.CONFIG_PATH, config.PROVIDERS_CONF_PATH):
+            try:
+                times.append(os.stat(path).st_mtime)
+            except OSError:
+                times.append(None)
+
+        return tuple(times)
+
+    def run_app(self, argv, cwd=None):
+        """ Runs application with CLI arguments
+            Config changed by other process, e.g. by Configure command,
+            is loaded again before the run, weather info of previous
+            run is dropped
+            :param argv: CLI arguments
+            :param cwd: working directory of the caller
+            :return: output and exit code of the run,
+                     None if the run needs terminal
+            :rtype: tuple
+        """
+
+        from config import config
+
+        output, code = io.StringIO(), 0
+        with contextlib.redirect_stdout(output):
+            try:
+                if self.get_config_times() != self.config_times:
+                    config.reload_config()
+                config.ACTUAL_WEATHER_INFO.clear()
+                config.ACTUAL_PRINTABLE_INFO.clear()
+
+                app = self.app_factory(argv, cwd)
+                if is_interactive(app.args):
+                    return None
+                app.main()
+            except SystemExit as err:
+                if isinstance(err.code, str):  # sys.exit(message)
+                    output.write(f'{err.code}\n')
+                code = err.code if isinstance(err.code, int) else \
+                    int(err.code is not None)
+            except Exception as err:  # daemon serves next runs
+                output.write(f'Unexpected error, {err!r}\n')
+                code = 1
+
+        self.config_times = self.get_config_times()
+
+        return output.getvalue(), code
+
+    def server_close(self):
+        """ Closes socket and removes its file """
+
+        super().server_close()
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
@@ -1,8 +1,17 @@
-""" Provider Manager """
+""" Provider Manager
+    Providers are registered by title and imported on first use,
+    so commands not running providers do not load them
+"""
+
+import importlib
 
-from abstract.providers import AccuProvider, RP5_Provider, SinoptikProvider
 import abstract.abstract
 
+# provider title: (module, class)
+PROVIDERS = {'Accuweather': ('abstract.providers', 'AccuProvider'),
+             'RP5': ('abstract.providers', 'RP5_Provider'),
+             'Sinoptik': ('abstract.providers', 'SinoptikProvider')}
+
 
 class ProviderManager(abstract.abstract.Manager):
     """ Container for providers """
@@ -12,15 +21,15 @@ class ProviderManager(abstract.abstract.Manager):
         self._load_providers()
 
     def _load_providers(self):
-        """ Loads existing providers """
+        """ Registers existing providers, they are imported by get() """
 
-        for provider in [AccuProvider, RP5_Provider, SinoptikProvider]:
-            self.add(provider.title, provider)
+        for name, path in PROVIDERS.items():
+            self.add(name, path)
 
     def add(self, name, provider):
         """ Add provider
             :param name: provider title
-            :param provider: provider instance
+            :param provider: provider class or (module, class) to import
         """
 
         self._providers[name] = provider
@@ -31,7 +40,14 @@ class ProviderManager(abstract.abstract.Manager):
             :return: provider instance
         """
 
-        return self._providers.get(name, None)
+        provider = self._providers.get(name, None)
+
+        if isinstance(provider, tuple):  # import on first use
+            module, class_name = provider
+            provider = getattr(importlib.import_module(module), class_name)
+            self._providers[name] = provider
+
+        return provider
 
     def get_list(self):
         """ Gets list of providers
@@ -0,0 +1,197 @@
+""" Background refresh scheduler
+    Keeps pages of providers fresh for unattended operation.
+    Each page is reloaded when its caching time is over, moved by
+    random jitter, so pages of one site are not reloaded at one moment.
+    Pages are revalidated by conditional requests, so unchanged pages
+    cost 304 answers only.
+    Requests of scheduler have background priority in transport:
+    while a host is rate limited, requests of users go first.
+    Priority works inside one process, so for it scheduler should run
+    in the process serving users: 'Serve schedule' or 'Daemon schedule'.
+
+    Scheduler:  # queue of pages by time of their next refresh
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import itertools
+import random
+import threading
+import time
+
+from config import config
+from managers.transport import background
+from abstract.abstract import REVALIDATE
+
+
+class Task:
+    """ Page of provider to keep fresh """
+
+    def __init__(self, title, argv, location_set, URL, scrapers):
+        """ Initialize task
+            :param title: provider title
+            :param argv: provider arguments
+            :param location_set: location of provider, configured if None
+            :param URL: page address
+            :param scrapers: scrapers to run on the page
+        """
+
+        self.title = title
+        self.argv = argv
+        self.location_set = location_set
+        self.URL = URL
+        self.scrapers = scrapers
+
+
+class Scheduler:
+    """ Refreshes pages of providers in thread pool """
+
+    def __init__(self, app, jitter=None, retry_time=None):
+        """ Initialize scheduler
+            :param app: App instance, its providers are refreshed
+            :param jitter: share of caching time refresh may be moved by,
+                           Refresh_jitter option by default
+            :param retry_time: seconds before refresh of failed page
+        """
+
+        if jitter is None:
+            jitter = config.WEATHER_PROVIDERS['App'].get(
+                'Refresh_jitter', config.REFRESH_JITTER) / 100
+
+        self.app = app
+        self.jitter = jitter
+        self.retry_time = retry_time or config.REFRESH_RETRY
+        self.queue = []  # heap of (refresh time, number, task)
+        self._numbers = itertools.count()
+        self._condition = threading.Condition()
+        self._stopped = False
+
+    def get_provider(self, title, argv, location_set=None):
+        """ Makes provider
+            Provider is made for each refresh, so nothing of
+            previous refresh is kept in its memory
+            :param title: provider title
+            :param argv: provider arguments
+            :param location_set: location of provider, configured if None
+            :rtype: WeatherProvider
+        """
+
+        provider = self.app.providers.get(title)(self.app)
+        provider.get_cli_args(argv)
+        if location_set is not None:
+            provider.use_location(location_set)
+
+        return provider
+
+    def add(self, title, argv, location_set=None):
+        """ Adds pages of provider
+            Cached pages are refreshed when they expire,
+            others at once
+            :param title: provider title
+            :param argv: provider arguments
+            :param location_set: location of provider, configured if None
+            :return: number of added pages
+            :rtype: int
+        """
+
+        provider = self.get_provider(title, argv, location_set)
+        jobs = provider.get_jobs()
+
+        for URL in dict.fromkeys(URL for URL, scraper in jobs):
+            scrapers = [item for page, item in jobs if page == URL]
+            entry = provider.cache.load(URL)
+            if entry is None:
+                refresh_time = time.time()
+            else:
+                refresh_time = entry.time + \
+                    provider.get_caching_time(entry, URL)
+            self.schedule(Task(title, argv, location_set, URL, scrapers),
+                          refresh_time)
+
+        return len(set(URL for URL, scraper in jobs))
+
+    def schedule(self, task, refresh_time):
+        """ Puts task to queue
+            :param task: Task instance
+            :param refresh_time: time to refresh page, seconds since epoch
+        """
+
+        with self._condition:
+            heapq.heappush(self.queue,
+                           (refresh_time, next(self._numbers), task))
+            self._condition.notify()
+
+    def get_refresh_time(self, provider, URL):
+        """ Gets time of next refresh of page
+            Caching time of the page is moved by random jitter
+            :param provider: provider of the page
+            :param URL: page address
+            :return: seconds since epoch
+            :rtype: float
+        """
+
+        entry = provider.cache.load(URL)
+        if entry is None:
+            caching_time = provider.get_endpoint_caching_time(URL)
+        else:
+            caching_time = provider.get_caching_time(entry, URL)
+
+        caching_time *= 1 + random.uniform(-self.jitter, self.jitter)
+
+        return time.time() + caching_time
+
+    def refresh(self, task, on_refresh=None):
+        """ Reloads page, scrapes it and schedules next refresh
+            :param task: Task instance
+            :param on_refresh: called with task and error or None
+        """
+
+        error = None
+        refresh_time = time.time() + self.retry_time
+        try:
+            provider = self.get_provider(task.title, task.argv,
+                                         task.location_set)
+            with background():
+                for scraper in task.scrapers:
+                    provider.scrape(task.URL, scraper, REVALIDATE,
+                                    task.scrapers)
+            refresh_time = self.get_refresh_time(provider, task.URL)
+        except Exception as err:  # page is refreshed again later
+            error = err
+            self.app.logger.warning(
+                f"{task.title} {task.URL} is not refreshed: {err}")
+
+        self.schedule(task, refresh_time)
+        if on_refresh is not None:
+            on_refresh(task, error)
+
+    def run(self, on_refresh=None, workers=None):
+        """ Refreshes pages until stopped
+            :param on_refresh: called with task and error or None
+                               after each refresh
+            :param workers: pages refreshed at the same time,
+                            app workers by default
+        """
+
+        workers = workers or self.app.get_workers()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                with self._condition:
+                    while not self._stopped and (
+                            not self.queue or
+                            self.queue[0][0] > time.time()):
+                        self._condition.wait(
+                            self.queue[0][0] - time.time()
+                            if self.queue else None)
+                    if self._stopped:
+                        break
+                    refresh_time, number, task = heapq.heappop(self.queue)
+                executor.submit(self.refresh, task, on_refresh)
+
+    def stop(self):
+        """ Stops run after refreshes being done """
+
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
@@ -0,0 +1,249 @@
+""" Fuzzy search of location names
+    Providers write the same location differently: 'Київ' on Sinoptik,
+    'Киев' on RP5, 'Kyiv' on Accuweather. Names are transliterated
+    to Latin and folded, then compared by shared trigrams.
+
+    TrigramIndex:  # index of names ranked by similarity to query
+
+    Index is kept in compact arrays, so it is saved with dump()
+    and loaded back with TrigramIndex.from_dump() in a few milliseconds.
+"""
+
+from array import array
+import bisect
+import collections
+import heapq
+import unicodedata
+
+CYRILLIC = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'h', 'ґ': 'g', 'д': 'd', 'е': 'e',
+    'є': 'ie', 'ё': 'e', 'ж': 'zh', 'з': 'z', 'и': 'y', 'і': 'i', 'ї': 'i',
+    'й': 'i', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p',
+    'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '',
+    'э': 'e', 'ю': 'iu', 'я': 'ia', "'": '', '’': '', 'ʼ': ''}
+
+# letters written differently by transliteration systems
+FOLDS = str.maketrans({'y': 'i', 'j': 'i', 'g': 'h', 'w': 'v', 'x': 'ks'})
+
+
+def normalize(name):
+    """ Makes comparable form of location name
+        Cyrillic is transliterated, accents are removed,
+        letters of alternative spellings are folded
+        :param name: location name
+        :return: lowercase Latin letters, digits and single spaces
+        :rtype: string
+    """
+
+    name = ''.join(CYRILLIC.get(char, char) for char in name.casefold())
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(char if char.isalnum() else ' ' for char in name
+                   if not unicodedata.combining(char))
+
+    return ' '.join(name.translate(FOLDS).split())
+
+
+def get_trigrams(key):
+    """ Gets trigrams of normalized name
+        Name is padded, so short queries and beginnings of names match
+        :param key: normalized name
+        :rtype: set
+    """
+
+    if not key:
+        return set()
+
+    key = f'  {key} '
+
+    return {key[i:i+3] for i in range(len(key) - 2)}
+
+
+class PackedKeys:
+    """ Keys kept in one string, split on access
+        Loaded index needs only few keys for a search,
+        so they are not split all at once
+    """
+
+    def __init__(self, text, starts):
+        """ Initialize keys
+            :param text: keys joined by new lines
+            :param starts: position of each key in text
+        """
+
+        self.text = text
+        self.starts = starts
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        end = self.starts[index + 1] - 1 if index + 1 < len(self.starts) \
+            else len(self.text)
+
+        return self.text[self.starts[index]:end]
+
+
+class SortedKeys:
+    """ Keys in sorted order, for bisect, without copying them """
+
+    def __init__(self, keys, numbers):
+        """ Initialize view
+            :param keys: keys of names
+            :param numbers: numbers of names sorted by key
+        """
+
+        self.keys = keys
+        self.numbers = numbers
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def __getitem__(self, index):
+        return self.keys[self.numbers[index]]
+
+
+class TrigramIndex:
+    """ Index of names for fuzzy search
+        Each trigram refers to numbers of names containing it,
+        so only names sharing trigrams with query are scored.
+        Sorted keys find names starting with query.
+    """
+
+    pool = 20  # candidates scored for each result
+
+    def __init__(self, names=()):
+        """ Builds index
+            :param names: names to search, results refer to their numbers
+        """
+
+        self.keys = [normalize(name) for name in names]
+        self.sizes = array('H')
+        postings = collections.defaultdict(lambda: array('I'))
+
+        for number, key in enumerate(self.keys):
+            trigrams = get_trigrams(key)
+            self.sizes.append(min(len(trigrams), 0xffff))
+            for trigram in trigrams:
+                postings[trigram].append(number)
+
+        self.postings = dict(postings)
+        self.sorted_numbers = array('I', sorted(range(len(self.keys)),
+                                                key=self.keys.__getitem__))
+        self.sorted_keys = SortedKeys(self.keys, self.sorted_numbers)
+
+    def dump(self):
+        """ Gets index data for saving
+            :return: strings and arrays of index
+            :rtype: dict
+        """
+
+        trigrams = sorted(self.postings)
+        starts = array('I')
+        position = 0
+        for key in self.keys:
+            starts.append(position)
+            position += len(key) + 1
+
+        return {'keys': '\n'.join(self.keys),
+                'key_starts': starts,
+                'sizes': self.sizes,
+                'sorted_numbers': self.sorted_numbers,
+                'trigrams': ''.join(trigrams),
+                'counts': array('I', (len(self.postings[trigram])
+                                      for trigram in trigrams)),
+                'postings': array('I', (number for trigram in trigrams
+                                        for number in self.postings[trigram]))}
+
+    @classmethod
+    def from_dump(cls, data):
+        """ Restores index from data of dump()
+            :param data: strings and arrays of index
+            :rtype: TrigramIndex
+        """
+
+        index = cls()
+        index.keys = PackedKeys(data['keys'], data['key_starts'])
+        index.sizes = data['sizes']
+        index.sorted_numbers = data['sorted_numbers']
+        index.sorted_keys = SortedKeys(index.keys, index.sorted_numbers)
+
+        trigrams, postings = data['trigrams'], data['postings']
+        start = 0
+        for number, count in enumerate(data['counts']):
+            index.postings[trigrams[3*number:3*number+3]] = \
+                postings[start:start+count]
+            start += count
+
+        return index
+
+    def find_prefix(self, key, limit, within=None):
+        """ Finds shortest names starting with key
+            :param key: normalized query
+            :param limit: number of names
+            :param within: range of name numbers to search, all if None
+            :return: names numbers
+            :rtype: list
+        """
+
+        start = bisect.bisect_left(self.sorted_keys, key)
+        end = bisect.bisect_left(self.sorted_keys, key + '\uffff', start)
+        numbers = self.sorted_numbers[start:end]
+        if within is not None:
+            numbers = [number for number in numbers if number in within]
+
+        return heapq.nsmallest(limit, numbers, key=self.sizes.__getitem__)
+
+    def get_postings(self, trigram, within=None):
+        """ Gets numbers of names containing trigram
+            :param trigram: trigram of query
+            :param within: range of name numbers, all if None
+            :return: ascending names numbers
+            :rtype: array
+        """
+
+        postings = self.postings.get(trigram, ())
+        if within is None or not postings:
+            return postings
+
+        return postings[bisect.bisect_left(postings, within.start):
+                        bisect.bisect_left(postings, within.stop)]
+
+    def search(self, text, limit=10, min_score=0.3, within=None):
+        """ Finds names similar to text
+            Score is Dice coefficient of trigrams, plus 1
+            if name starts with text. Only names sharing most trigrams
+            with text and the shortest names starting with it are scored,
+            so search time depends little on number of names
+            :param text: query, any script and case
+            :param limit: number of results
+            :param min_score: lowest score of returned names
+            :param within: range of name numbers to search, all if None,
+                           e.g. names of one provider
+            :return: (score, name number) from the best match
+            :rtype: list
+        """
+
+        key = normalize(text)
+        if not key:
+            return []
+
+        trigrams = get_trigrams(key)
+        shared = collections.Counter()
+
+        for trigram in trigrams:
+            shared.update(self.get_postings(trigram, within))
+
+        candidates = {number for number, count
+                      in shared.most_common(limit * self.pool)}
+        candidates.update(self.find_prefix(key, limit, within))
+
+        scores = []
+        for number in candidates:
+            score = 2 * shared[number] / (len(trigrams) + self.sizes[number])
+            score += self.keys[number].startswith(key)
+            if score >= min_score:
+                scores.append((score, -number))
+
+        return [(score, -number) for score, number
+                in heapq.nlargest(limit, scores)]
@@ -0,0 +1,295 @@
+""" HTTP JSON service
+    Serves weather of providers to dashboards and other pollers:
+
+    GET /providers                   # providers with their options
+    GET /weather/{provider}          # weather of configured location
+    GET /weather/{provider}?location=Київ
+    GET /weather?location=Київ       # weather of shown providers
+
+    Query options next=1 and hourly=1 set forecast as -next and -f
+    provider arguments, options of providers config are used otherwise.
+
+    Answers are kept in memory for Serve_cache_time seconds and have
+    ETag, so pollers sending If-None-Match get 304 without body.
+    At most Serve_cache_entries answers are kept, the oldest go first.
+    Requests for the same answer wait for the one making it,
+    so providers run once for them.
+
+    WeatherService:  # threaded HTTP server running providers of app
+    ResponseCache:   # answers in memory
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlsplit, parse_qs, unquote
+import contextlib
+import hashlib
+import json
+import threading
+import time
+
+from config import config
+
+
+class ResponseCache:
+    """ Answers of service by request path
+        Answers are ordered by time they were kept, so expired
+        and oldest ones are removed from the beginning
+    """
+
+    def __init__(self, cache_time, max_entries=config.SERVE_CACHE_ENTRIES):
+        """ Initialize cache
+            :param cache_time: seconds answer is kept
+            :param max_entries: number of answers kept at most
+        """
+
+        self.cache_time = cache_time
+        self.max_entries = max_entries
+        self.responses = OrderedDict()  # path: (expiry time, body, ETag)
+        self._making = {}  # path: (lock, number of requests using it)
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """ Gets answer
+            :param path: request path with query
+            :return: body and ETag or None if answer is expired
+            :rtype: tuple
+        """
+
+        with self._lock:
+            response = self.responses.get(path)
+            if response is None or response[0] < time.monotonic():
+                self.responses.pop(path, None)
+                return None
+
+        return response[1:]
+
+    @contextlib.contextmanager
+    def making(self, path):
+        """ Lets one request at a time make answer of the path
+            :param path: request path with query
+        """
+
+        with self._lock:
+            lock, users = self._making.get(path, (threading.Lock(), 0))
+            self._making[path] = (lock, users + 1)
+
+        try:
+            with lock:
+                yield
+        finally:
+            with self._lock:
+                lock, users = self._making[path]
+                if users == 1:
+                    del self._making[path]
+                else:
+                    self._making[path] = (lock, users - 1)
+
+    def put(self, path, body):
+        """ Keeps answer
+            :param path: request path with query
+            :param body: answer body
+            :return: body and its ETag
+            :rtype: tuple
+        """
+
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        now = time.monotonic()
+
+        with self._lock:
+            self.responses.pop(path, None)
+            while self.responses and \
+                    next(iter(self.responses.values()))[0] < now:
+                self.responses.popitem(last=False)
+            self.responses[path] = (now + self.cache_time, body, etag)
+            while len(self.responses) > self.max_entries:
+                self.responses.popitem(last=False)
+
+        return body, etag
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """ Handles GET requests of service """
+
+    server_version = 'Weatherapp'
+
+    def do_GET(self):
+        """ Sends answer from memory or runs providers for it """
+
+        response = self.server.responses.get(self.path)
+
+        if response is None:
+            with self.server.responses.making(self.path):
+                # answer may be made while the request waited
+                response = self.server.responses.get(self.path)
+                if response is None:
+                    status, body = self.make_body()
+                    if status != 200:
+                        self.send_body(status, body)
+                        return
+                    response = self.server.responses.put(self.path, body)
+
+        body, etag = response
+
+        if etag in [tag.strip() for tag
+                    in self.headers.get('If-None-Match', '').split(',')]:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_body(200, body, etag)
+
+    def make_body(self):
+        """ Runs providers for the request
+            :return: HTTP status and JSON bytes
+            :rtype: tuple
+        """
+
+        URL = urlsplit(self.path)
+        query = {key: values[-1] for key, values
+                 in parse_qs(URL.query, keep_blank_values=True).items()}
+        try:
+            status, payload = self.server.get_payload(
+                unquote(URL.path).rstrip('/'), query)
+        except Exception as err:  # e.g. provider site is down
+            self.server.app.logger.error(f"{self.path}: {err!r}")
+            status, payload = 502, {'error': str(err)}
+
+        return status, json.dumps(payload, ensure_ascii=False).encode('utf-8')
+
+    def send_body(self, status, body, etag=None):
+        """ Sends JSON answer
+            :param status: HTTP status
+            :param body: JSON bytes
+            :param etag: ETag of body, if it is cached
+        """
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if etag is not None:
+            self.send_header('ETag', etag)
+            self.send_header(
+                'Cache-Control', f'max-age={self.server.responses.cache_time}')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """ Logs requests to app logger """
+
+        self.server.app.logger.info(
+            f"{self.address_string()} {format % args}")
+
+
+class WeatherService(ThreadingMixIn, HTTPServer):
+    """ HTTP server answering with weather info of app providers """
+
+    daemon_threads = True
+
+    def __init__(self, app, address=None, cache_time=None,
+                 cache_entries=None):
+        """ Initialize server
+            :param app: App instance
+            :param address: (host, port), Serve_host and Serve_port
+                            options by default
+            :param cache_time: seconds answers are kept in memory,
+                               Serve_cache_time option by default
+            :param cache_entries: answers kept in memory at most,
+                                  Serve_cache_entries option by default
+        """
+
+        app_config = config.WEATHER_PROVIDERS['App']
+        if address is None:
+            address = (app_config.get('Serve_host', config.SERVE_HOST),
+                       int(app_config.get('Serve_port', config.SERVE_PORT)))
+        if cache_time is None:
+            cache_time = int(app_config.get('Serve_cache_time',
+                                            config.SERVE_CACHE_TIME))
+        if cache_entries is None:
+            cache_entries = int(app_config.get('Serve_cache_entries',
+                                               config.SERVE_CACHE_ENTRIES))
+
+        self.app = app
+        self.responses = ResponseCache(cache_time, cache_entries)
+        super().__init__(address, ServiceHandler)
+
+    def get_payload(self, path, query):
+        """ Makes answer of request
+            :param path: request path without query
+            :param query: query options
+            :return: HTTP status and JSON data
+            :rtype: tuple
+        """
+
+        titles = list(self.app.providers.get_list())
+
+        if 'location' in query and not query['location'].strip():
+            return 400, {'error': 'Location is empty'}
+
+        if path == '/providers':
+            return 200, [self.get_provider(title) for title in titles]
+
+        if path == '/weather' and query.get('location'):
+            shown = [title for title in titles
+                     if config.PROVIDERS_CONF.get(title, {}).get('Show')]
+            with ThreadPoolExecutor(
+                    max_workers=self.app.get_workers()) as executor:
+                weather = list(executor.map(
+                    lambda title: self.get_weather(
+                        title, query['location'], query), shown))
+            return 200, {'location': query['location'],
+                         'providers': [item for item in weather
+                                       if item is not None]}
+
+        if path.startswith('/weather/') and path[9:] in titles:
+            weather = self.get_weather(path[9:], query.get('location'),
+                                       query)
+            if weather is None:
+                return 404, {'error': 'Location is not found'}
+            return 200, weather
+
+        return 404, {'error': 'Not found'}
+
+    def get_provider(self, title):
+        """ Gets provider description
+            :param title: provider title
+            :rtype: dict
+        """
+
+        provider = self.app.providers.get(title)(self.app)
+
+        return {'title': title, 'location': provider.Location,
+                **config.PROVIDERS_CONF.get(title, {})}
+
+    def get_weather(self, title, location, query):
+        """ Runs provider
+            :param title: provider title
+            :param location: location name, configured location if None
+            :param query: query options
+            :return: weather info with its title and location
+                     or None if location is not found
+            :rtype: dict
+        """
+
+        if 'next' in query or 'hourly' in query:
+            argv = ['-next'] * (query.get('next') == '1') + \
+                ['-f'] * (query.get('hourly') == '1')
+        else:
+            argv = self.app.get_option_args(title)
+
+        provider = self.app.providers.get(title)(self.app)
+
+        if location is not None:
+            location_set = provider.resolve_location(location)
+            if location_set is None:
+                return None
+            provider.use_location(location_set)
+
+        weather_info, output_title = provider.run(argv)
+
+        return {'provider': title, 'location': provider.Location,
+                'title': output_title, 'stale': provider.stale,
+                'info': weather_info}
@@ -0,0 +1,660 @@
+""" HTTP transport for weather providers
+    HTTPTransport:  # keeps connections to hosts alive, caches DNS results
+    Response:       # loaded web page with status and headers
+    BlockMarker:    # finds end of page block while page is loading
+    DeflateDecoder: # decompresses deflate page with or without zlib header
+    TokenBucket:    # limits rate of requests to a host
+
+    Requests of background work, e.g. scheduled refresh, are made
+    inside background() and wait for a host after requests of users.
+
+    Proxies are taken from environment (HTTP_PROXY, HTTPS_PROXY, NO_PROXY)
+    or system settings, as urllib does. HTTP proxies are supported:
+    plain HTTP pages are requested from proxy, HTTPS ones go through
+    CONNECT tunnel.
+
+    All providers share one transport, get it with get_transport().
+    set_transport() replaces it, e.g. with one pointed at a local server.
+"""
+
+from urllib.parse import urlsplit, urlunsplit, urljoin, unquote
+from urllib.error import HTTPError, URLError
+import urllib.request
+import base64
+import contextlib
+import heapq
+import http.client
+import itertools
+import re
+import socket
+import ssl
+import threading
+import time
+import zlib
+
+from config import config
+
+HEAD = {'User-Agent':
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:63.0) Gecko/201',
+        'Accept-Encoding': 'gzip, deflate'}
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+CHUNK_SIZE = 16384  # bytes read at once when looking for end markers
+MAX_REDIRECTS = 5
+# errors of a kept alive connection closed by server in the meantime
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected,
+                           http.client.BadStatusLine,
+                           ConnectionResetError, BrokenPipeError)
+
+PRIORITY_USER = 0  # requests wait for rate limited host in this order
+PRIORITY_BACKGROUND = 1
+
+_transport = None
+_transport_lock = threading.Lock()
+_priority = threading.local()  # priority of requests of current thread
+
+
+@contextlib.contextmanager
+def background():
+    """ Gives background priority to requests of current thread """
+
+    previous = get_priority()
+    _priority.value = PRIORITY_BACKGROUND
+    try:
+        yield
+    finally:
+        _priority.value = previous
+
+
+def get_priority():
+    """ Gets priority of requests of current thread
+        :rtype: int
+    """
+
+    return getattr(_priority, 'value', PRIORITY_USER)
+
+
+class DeflateDecoder:
+    """ Decompressor of deflate encoded page loaded by chunks
+        Some servers send deflate without zlib header,
+        it is checked on the first chunk
+    """
+
+    def __init__(self):
+        self.decoder = None
+
+    def decompress(self, chunk):
+        if self.decoder is None:
+            self.decoder = zlib.decompressobj()
+            try:
+                return self.decoder.decompress(chunk)
+            except zlib.error:  # no zlib header, raw deflate
+                self.decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+
+        return self.decoder.decompress(chunk)
+
+    def flush(self):
+        return self.decoder.flush() if self.decoder else b''
+
+
+def get_decoder(encoding):
+    """ Returns decompressor for gzip or deflate encoded page
+        :param encoding: Content-Encoding header value
+        :return: zlib decompress object or None if page is not compressed
+    """
+
+    encoding = (encoding or '').strip().lower()
+
+    if encoding in ('gzip', 'x-gzip'):
+        return zlib.decompressobj(32 + zlib.MAX_WBITS)  # detect header
+    elif encoding == 'deflate':
+        return DeflateDecoder()
+
+    return None
+
+
+def decode_content(body, encoding):
+    """ Decompresses page sent with gzip or deflate encoding
+        :param body: response body
+        :param encoding: Content-Encoding header value
+        :return: page content
+        :rtype: bytes
+    """
+
+    encoding = (encoding or '').strip().lower()
+
+    if not body:
+        return body
+    elif encoding in ('gzip', 'x-gzip'):
+        return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    elif encoding == 'deflate':
+        try:
+            return zlib.decompress(body)
+        except zlib.error:  # some servers send deflate without zlib header
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+
+    return body
+
+
+class Response:
+    """ Loaded web page
+        attributes:
+        URL:       # final page address, after redirects
+        status:    # HTTP status code
+        headers:   # response headers, http.client.HTTPMessage
+        body:      # page content, decompressed
+        wire_size: # bytes received, before decompression
+        truncated: # True if loading stopped after marked blocks
+    """
+
+    def __init__(self, URL, status, headers, body, wire_size=None,
+                 truncated=False):
+        self.URL = URL
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.wire_size = len(body) if wire_size is None else wire_size
+        self.truncated = truncated
+
+
+class BlockMarker:
+    """ Finds the end of page block while page is being loaded
+        Block starts with the tag having given attributes text
+        and ends with its closing tag, nested tags of the same name
+        are counted
+    """
+
+    def __init__(self, tag, attrs):
+        """ Initialize marker
+            :param tag: block tag name, e.g. 'div'
+            :param attrs: regex of block attributes, e.g. 'id="ArchTemp"'
+        """
+
+        tag = re.escape(tag.encode('utf-8'))
+        self.start = re.compile(b'<' + tag + rb'\b[^>]*' +
+                                attrs.encode('utf-8'), re.IGNORECASE)
+        self.tags = re.compile(b'<(/?)' + tag + rb'[\s>/]', re.IGNORECASE)
+        self.position = 0  # loaded data is searched from here
+        self.depth = None  # of nested tags, None until block starts
+        self.found = False
+
+    def search(self, data):
+        """ Continues search in loaded data
+            :param data: page loaded so far
+            :return: True if the whole block is loaded
+            :rtype: boolean
+        """
+
+        if self.found:
+            return True
+
+        if self.depth is None:
+            match = self.start.search(data, self.position)
+            if match is None:  # opening tag may be loaded partially
+                self.position = max(self.position, len(data) - 1024)
+                return False
+            self.depth = 1
+            self.position = match.end()
+
+        while True:
+            match = self.tags.search(data, self.position)
+            if match is None:
+                self.position = max(self.position, len(data) - 16)
+                return False
+            self.position = match.end()
+            self.depth += -1 if match.group(1) else 1
+            if self.depth == 0:
+                self.found = True
+                return True
+
+
+class TokenBucket:
+    """ Limits rate of requests
+        Bucket holds up to burst tokens and gets rate tokens a second,
+        each request takes a token. Waiting requests get tokens
+        in order of priority, then in order of arrival
+    """
+
+    def __init__(self, rate, burst=1):
+        """ Initialize bucket, it is full at start
+            :param rate: tokens a second
+            :param burst: bucket size, requests made at once
+        """
+
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._waiting = []  # heap of (priority, number)
+        self._numbers = itertools.count()
+        self._condition = threading.Condition()
+
+    def _refill(self):
+        """ Adds tokens for time passed """
+
+        now = time.monotonic()
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, priority=PRIORITY_USER):
+        """ Takes a token, waits for it if bucket is empty
+            :param priority: lower is served first
+            :return: seconds waited
+            :rtype: float
+        """
+
+        start_time = time.monotonic()
+
+        with self._condition:
+            place = (priority, next(self._numbers))
+            heapq.heappush(self._waiting, place)
+            while True:
+                self._refill()
+                if self._waiting[0] == place:
+                    if self.tokens >= 1:
+                        heapq.heappop(self._waiting)
+                        self.tokens -= 1
+                        self._condition.notify_all()  # next in line
+                        return time.monotonic() - start_time
+                    self._condition.wait((1 - self.tokens) / self.rate)
+                else:  # woken up when first in line takes its token
+                    self._condition.wait()
+
+
+class HTTPTransport:
+    """ Loads web pages through persistent connections
+        Idle connections are pooled per host and reused by next requests,
+        so DNS lookup, TCP and TLS handshakes are done once per connection
+    """
+
+    def __init__(self, pool_size=2, connect_timeout=10, read_timeout=30,
+                 dns_cache_time=300, hosts=None, host_connections=0,
+                 host_rate=0, host_burst=10, proxies=None):
+        """ Initialize transport
+            :param pool_size: idle connections kept for each host
+            :param connect_timeout: connection timeout, seconds
+            :param read_timeout: timeout of waiting for data, seconds
+            :param dns_cache_time: time to keep resolved addresses, seconds
+            :param hosts: {host: address} to connect instead of DNS lookup
+            :param host_connections: requests to one host at the same time,
+                                     0 - no limit
+            :param host_rate: requests to one host a minute, 0 - no limit
+            :param host_burst: requests to one host made at once
+                               before rate limit applies
+            :param proxies: {scheme: proxy URL, 'no': hosts without proxy},
+                            environment and system settings by default
+        """
+
+        self.pool_size = pool_size
+        self.host_connections = host_connections
+        self.host_rate = host_rate
+        self.host_burst = host_burst
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.dns_cache_time = dns_cache_time
+        self.hosts = hosts or {}
+        self.ssl_context = ssl.create_default_context()
+
+        if proxies is None:
+            self.proxies = urllib.request.getproxies()
+            self._bypass_proxy = urllib.request.proxy_bypass
+        else:
+            self.proxies = proxies
+            self._bypass_proxy = lambda host: \
+                urllib.request.proxy_bypass_environment(host, proxies)
+
+        self.stats = {'Received': 0, 'Pages': 0}  # bytes
+        self._pools = {}  # (scheme, host, port): idle connections
+        self._dns_cache = {}  # host: (addresses, expire time)
+        self._host_slots = {}  # host: semaphore of its requests
+        self._host_buckets = {}  # host: token bucket of its requests
+        self._lock = threading.Lock()
+
+    def resolve(self, host, port):
+        """ Resolves host name using DNS cache
+            :param host: host name
+            :param port: port number
+            :return: socket addresses of the host
+            :rtype: list
+        """
+
+        if host in self.hosts:
+            return [(self.hosts[host], port)]
+
+        with self._lock:
+            addresses, expire_time = self._dns_cache.get(host, (None, 0))
+        if addresses is not None and time.time() < expire_time:
+            return [address[:1] + (port,) + address[2:]
+                    for address in addresses]
+
+        addresses = [info[4] for info in socket.getaddrinfo(
+            host, port, type=socket.SOCK_STREAM)]
+        with self._lock:
+            self._dns_cache[host] = \
+                (addresses, time.time() + self.dns_cache_time)
+
+        return addresses
+
+    def _create_connection(self, address, timeout=None, source_address=None):
+        """ Opens socket to resolved host address
+            Replaces socket.create_connection in http.client connections
+            :param address: host and port
+            :return: connected socket
+        """
+
+        error = None
+
+        for socket_address in self.resolve(*address):
+            try:
+                return socket.create_connection(
+                    socket_address[:2], timeout, source_address)
+            except OSError as err:
+                error = err
+
+        raise error
+
+    def get_proxy(self, scheme, host):
+        """ Finds proxy for the host
+            :param scheme: 'http' or 'https'
+            :param host: host name
+            :return: proxy host, port and Proxy-Authorization header
+                     or None if the host is connected directly
+            :rtype: tuple
+        """
+
+        proxy_URL = self.proxies.get(scheme)
+        if not proxy_URL or self._bypass_proxy(host):
+            return None
+
+        if '://' not in proxy_URL:  # e.g. 'proxy:3128'
+            proxy_URL = 'http://' + proxy_URL
+        parts = urlsplit(proxy_URL)
+        if parts.scheme != 'http':
+            raise URLError(f'Unsupported proxy: {proxy_URL}')
+
+        authorization = None
+        if parts.username is not None:
+            credentials = unquote(parts.username) + ':' + \
+                unquote(parts.password or '')
+            authorization = 'Basic ' + \
+                base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+
+        return parts.hostname, parts.port or 80, authorization
+
+    def _new_connection(self, scheme, host, port, proxy=None):
+        """ Creates connection to the host
+            :param proxy: proxy host, port and authorization, see get_proxy
+            :return: http.client connection
+        """
+
+        address = (host, port) if proxy is None else proxy[:2]
+
+        if scheme == 'https':
+            conn = http.client.HTTPSConnection(
+                *address, timeout=self.connect_timeout,
+                context=self.ssl_context)
+            if proxy is not None:  # TLS goes through CONNECT tunnel
+                conn.set_tunnel(host, port, headers=(
+                    {'Proxy-Authorization': proxy[2]} if proxy[2] else None))
+        else:
+            conn = http.client.HTTPConnection(
+                *address, timeout=self.connect_timeout)
+        conn._create_connection = self._create_connection
+
+        return conn
+
+    def _get_connection(self, key):
+        """ Takes idle connection from pool or creates a new one
+            :param key: scheme, host, port and proxy
+            :return: connection and True if it was used before
+            :rtype: tuple
+        """
+
+        with self._lock:
+            pool = self._pools.get(key, [])
+            if pool:
+                return pool.pop(), True
+
+        return self._new_connection(*key), False
+
+    def _get_host_slots(self, host):
+        """ Gets semaphore limiting requests to the host
+            :param host: host name
+            :return: semaphore or None if there is no limit
+            :rtype: threading.BoundedSemaphore
+        """
+
+        if not self.host_connections:
+            return None
+
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = \
+                    threading.BoundedSemaphore(self.host_connections)
+
+            return self._host_slots[host]
+
+    def _get_host_bucket(self, host):
+        """ Gets token bucket limiting rate of requests to the host
+            :param host: host name
+            :return: bucket or None if there is no limit
+            :rtype: TokenBucket
+        """
+
+        if not self.host_rate:
+            return None
+
+        with self._lock:
+            if host not in self._host_buckets:
+                self._host_buckets[host] = TokenBucket(self.host_rate / 60,
+                                                       self.host_burst)
+
+            return self._host_buckets[host]
+
+    def _release_connection(self, key, conn):
+        """ Puts connection back to pool or closes it if pool is full
+            :param key: scheme, host, port and proxy
+            :param conn: connection
+        """
+
+        with self._lock:
+            pool = self._pools.setdefault(key, [])
+            if len(pool) < self.pool_size:
+                pool.append(conn)
+                return
+
+        conn.close()
+
+    @staticmethod
+    def _read_body(response, end_markers=None):
+        """ Reads and decompresses response body
+            With end markers page is read by chunks
+            until all marked blocks are loaded
+            :param response: http.client response
+            :param end_markers: (tag, attributes) of page blocks
+            :return: page, bytes received and True if page was cut
+            :rtype: tuple
+        """
+
+        encoding = response.msg.get('Content-Encoding')
+
+        if not end_markers or response.status != 200:
+            body = response.read()
+            if 200 <= response.status < 300:
+                return decode_content(body, encoding), len(body), False
+            return body, len(body), False
+
+        markers = [BlockMarker(*marker) for marker in end_markers]
+        decoder = get_decoder(encoding)
+        page = bytearray()
+        wire_size = 0
+
+        while True:
+            chunk = response.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            wire_size += len(chunk)
+            page += decoder.decompress(chunk) if decoder else chunk
+            if all(marker.search(page) for marker in markers):
+                return bytes(page), wire_size, True
+
+        if decoder:
+            page += decoder.flush()
+
+        return bytes(page), wire_size, False
+
+    def _send(self, key, path, headers, data, end_markers=None):
+        """ Sends request and reads response once
+            Request is repeated on a new connection
+            if kept alive one was closed by server
+            :return: status, reason, headers, body of response,
+                     bytes received and True if body was cut
+            :rtype: tuple
+        """
+
+        method = 'GET' if data is None else 'POST'
+
+        while True:
+            conn, reused = self._get_connection(key)
+            try:
+                if conn.sock is None:
+                    conn.connect()
+                conn.sock.settimeout(self.read_timeout)
+                conn.request(method, path, body=data, headers=headers)
+                response = conn.getresponse()
+                body, wire_size, truncated = \
+                    self._read_body(response, end_markers)
+            except STALE_CONNECTION_ERRORS:
+                conn.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+
+            # the rest of cut page is still in connection, drop it
+            if response.will_close or truncated:
+                conn.close()
+            else:
+                self._release_connection(key, conn)
+
+            return (response.status, response.reason, response.msg, body,
+                    wire_size, truncated)
+
+    def request(self, URL, headers=None, data=None, end_markers=None):
+        """ Loads a page from given URL following redirects
+            :param URL: web page address
+            :param headers: additional request headers
+            :param data: data to post, GET request if None
+            :param end_markers: (tag, attributes) of page blocks,
+                                loading stops when all of them are loaded
+            :return: loaded page
+            :rtype: Response
+        """
+
+        request_headers = dict(HEAD)
+        request_headers.update(headers or {})
+
+        for redirect in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(URL)
+            scheme = parts.scheme or 'http'
+            port = parts.port or (443 if scheme == 'https' else 80)
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+
+            proxy = self.get_proxy(scheme, parts.hostname)
+            send_headers = request_headers
+            if proxy is not None and scheme == 'http':
+                # plain HTTP proxy is asked for full address
+                path = urlunsplit(parts._replace(fragment=''))
+                if proxy[2]:
+                    send_headers = dict(request_headers,
+                                        **{'Proxy-Authorization': proxy[2]})
+
+            bucket = self._get_host_bucket(parts.hostname)
+            if bucket is not None:  # wait for rate limit of the host
+                bucket.acquire(get_priority())
+
+            slots = self._get_host_slots(parts.hostname)
+            if slots is not None:  # wait for other requests to the host
+                slots.acquire()
+            try:
+                status, reason, response_headers, body, wire_size, \
+                    truncated = self._send(
+                        (scheme, parts.hostname, port, proxy),
+                        path, send_headers, data, end_markers)
+            except (OSError, http.client.HTTPException, zlib.error) as err:
+                raise URLError(err)  # zlib.error if page is broken
+            finally:
+                if slots is not None:
+                    slots.release()
+
+            if status in REDIRECT_CODES and 'Location' in response_headers:
+                URL = urljoin(URL, response_headers['Location'])
+                if status == 303:
+                    data = None
+                continue
+
+            if status >= 400:
+                raise HTTPError(URL, status, reason, response_headers, None)
+
+            with self._lock:
+                self.stats['Received'] += wire_size
+                self.stats['Pages'] += len(body)
+
+            return Response(URL, status, response_headers, body, wire_size,
+                            truncated)
+
+        raise URLError(f'Too many redirects: {URL}')
+
+    def close(self):
+        """ Closes all idle connections """
+
+        with self._lock:
+            pools, self._pools = self._pools, {}
+
+        for pool in pools.values():
+            for conn in pool:
+                conn.close()
+
+
+def get_transport():
+    """ Returns transport shared by providers
+        Transport is created with config settings on first call
+        :rtype: HTTPTransport
+    """
+
+    global _transport
+
+    with _transport_lock:
+        if _transport is None:
+            options = config.WEATHER_PROVIDERS['App']
+            _transport = HTTPTransport(
+                pool_size=options.get('Pool_size', config.POOL_SIZE),
+                connect_timeout=options.get('Connect_timeout',
+                                            config.CONNECT_TIMEOUT),
+                read_timeout=options.get('Read_timeout', config.READ_TIMEOUT),
+                dns_cache_time=options.get('DNS_cache_time',
+                                           config.DNS_CACHE_TIME),
+                host_connections=options.get('Host_connections',
+                                             config.HOST_CONNECTIONS),
+                host_rate=options.get('Host_rate', config.HOST_RATE),
+                host_burst=options.get('Host_burst', config.HOST_BURST))
+
+    return _transport
+
+
+def set_transport(transport):
+    """ Replaces transport shared by providers
+        :param transport: HTTPTransport or any object with request()
+        :return: previous transport
+    """
+
+    global _transport
+
+    with _transport_lock:
+        previous, _transport = _transport, transport
+
+    return previous
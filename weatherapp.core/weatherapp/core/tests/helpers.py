@@ -0,0 +1,104 @@
+""" Test doubles shared by tests
+    StubProvider:          # provider with fixed info, no config is read
+    FakeTransport:         # transport returning the same page for any URL
+    use_temporary_cache:   # points shared cache to temporary directory
+    use_transport:         # replaces shared transport for a test
+    use_app_options:       # changes App options of config for a test
+"""
+
+import tempfile
+
+from abstract.abstract import WeatherProvider
+from managers.transport import Response, set_transport
+from managers.cache import FileCache, set_cache
+from config import config
+
+
+class StubProvider(WeatherProvider):
+    """ Test provider with fixed pages and info
+        Tests override title, pages and scrapers in subclasses
+    """
+
+    title = 'Accuweather'
+    Location = 'Test Location'
+    URL = 'http://weather.test/now'
+    Caching_time = 60
+
+    def initiate(self):
+        """ Takes logger only, pages are set in class """
+
+        self.logger = self._get_logger(self.title, None)
+
+    def get_info(self):
+        return {"Info": "Parsed"}
+
+    def get_hourly(self):
+        return {"Info": "Parsed hourly"}
+
+    def get_next_day(self):
+        return {"Info": "Parsed next day"}
+
+    def set_location(self, location_set):
+        pass
+
+
+class FakeTransport():
+    """ Transport returning the same page for any URL
+        Page is not sent again if request has its ETag
+    """
+
+    def __init__(self, headers=None):
+        self.headers = headers or {}  # response headers
+        self.requested = []
+        self.request_headers = []
+        self.end_markers = []
+
+    def request(self, URL, headers=None, data=None, end_markers=None):
+        self.requested.append(URL)
+        self.request_headers.append(headers or {})
+        self.end_markers.append(end_markers)
+
+        if 'ETag' in self.headers and (headers or {}).get(
+                'If-None-Match') == self.headers['ETag']:
+            return Response(URL, 304, dict(self.headers), b'')
+
+        return Response(URL, 200, dict(self.headers),
+                        'Погода'.encode('utf-8'))
+
+
+def use_temporary_cache(test):
+    """ Points shared cache to temporary directory until test ends
+        :param test: TestCase instance
+        :return: cache
+        :rtype: FileCache
+    """
+
+    directory = tempfile.TemporaryDirectory()
+    cache = FileCache(directory.name)
+    test.addCleanup(directory.cleanup)
+    test.addCleanup(set_cache, set_cache(cache))
+
+    return cache
+
+
+def use_transport(test, transport):
+    """ Replaces shared transport until test ends
+        :param test: TestCase instance
+        :param transport: transport for the test
+        :return: the transport
+    """
+
+    test.addCleanup(set_transport, set_transport(transport))
+
+    return transport
+
+
+def use_app_options(test, **options):
+    """ Changes App options of config until test ends
+        :param test: TestCase instance
+        :param options: App options and their values
+    """
+
+    app_config = dict(config.WEATHER_PROVIDERS['App'])
+    test.addCleanup(config.WEATHER_PROVIDERS.__setitem__, 'App', app_config)
+    config.WEATHER_PROVIDERS['App'].update(options)
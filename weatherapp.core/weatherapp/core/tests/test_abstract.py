@@ -1,9 +1,13 @@
 import sys
 
 import unittest
+from urllib.error import URLError
 
 from abstract.abstract import WeatherProvider, Formatter
+from managers.transport import Response
 from app import App
+from helpers import FakeTransport, use_temporary_cache, use_transport, \
+    use_app_options
 
 sys.path.insert(0, '..')
 
@@ -40,6 +44,19 @@ class TestProvider(WeatherProvider):
         pass
 
 
+class ChangingTransport(FakeTransport):
+    """ Transport returning new page on each request, or error if down """
+
+    down = False
+
+    def request(self, URL, headers=None, data=None, end_markers=None):
+        if self.down:
+            raise URLError('Provider is down')
+        self.requested.append(URL)
+        page = f'Погода {len(self.requested)}'
+        return Response(URL, 200, {}, page.encode('utf-8'))
+
+
 class ABC_Formatter(Formatter):
     """ Fake Formatter class to test """
 
@@ -51,8 +68,9 @@ class TestWeatherProvider(unittest.TestCase):
     """ WeatherProvider abstract class unit test """
 
     def setUp(self):
-        self.app = App()
+        self.app = App([])  # not arguments of test runner
         self.test_provider = TestProvider(self.app)
+        use_temporary_cache(self)
 
     def test_get_raw_page(self):
         """ Test loading page """
@@ -63,10 +81,209 @@ class TestWeatherProvider(unittest.TestCase):
             page = self.test_provider.get_raw_page(self.test_provider.URL)
             self.assertNotEqual(page, "")
 
+    def test_get_raw_page_transport(self):
+        """ Test loading page through shared transport """
+
+        transport = use_transport(self, FakeTransport())
+        page = self.test_provider.get_raw_page('http://weather.test/page',
+                                               True)
+
+        self.assertEqual(page, 'Погода')
+        self.assertEqual(transport.requested, ['http://weather.test/page'])
+
+    def test_get_raw_page_not_modified(self):
+        """ Test revalidating expired cache with conditional request """
+
+        URL = 'http://weather.test/etag'
+        transport = use_transport(self, FakeTransport(
+            {'ETag': '"v1"', 'Cache-Control': 'public, max-age=0'}))
+        self.test_provider.get_raw_page(URL, True)
+        self.test_provider.Caching_time = 0  # cache is expired at once
+        cache_time = self.test_provider.get_cache_time(URL)
+        page = self.test_provider.get_raw_page(URL)
+
+        self.assertEqual(page, 'Погода')
+        self.assertEqual(transport.request_headers[-1],
+                         {'If-None-Match': '"v1"'})
+        self.assertEqual(self.test_provider.load_validators(URL),
+                         {'ETag': '"v1"', 'Max-age': 0,
+                          'Digest': self.test_provider.get_digest(
+                              'Погода'.encode('utf-8')),
+                          'Checks': 2, 'Changes': 0})
+        self.assertGreaterEqual(
+            self.test_provider.get_cache_time(URL), cache_time)
+
+    def test_not_modified_removed(self):
+        """ Test loading page again if it is pruned while revalidated """
+
+        URL = 'http://weather.test/pruned'
+        transport = use_transport(self, FakeTransport({'ETag': '"v1"'}))
+        self.test_provider.get_raw_page(URL, True)
+        self.test_provider.Caching_time = 0  # cache is expired at once
+        request = transport.request
+
+        def request_pruned(URL, headers=None, **kwargs):
+            self.test_provider.cache.clear()  # pruned by other process
+            return request(URL, headers, **kwargs)
+
+        transport.request = request_pruned
+        page = self.test_provider.get_raw_page(URL)
+
+        self.assertEqual(page, 'Погода')
+        self.assertEqual(transport.request_headers[1:],
+                         [{'If-None-Match': '"v1"'}, {}])
+        self.assertIsNotNone(self.test_provider.cache.load(URL))
+
+    def test_stale_while_revalidate(self):
+        """ Test showing expired page while it is refreshed in background """
+
+        URL = 'http://weather.test/stale'
+        transport = use_transport(self, ChangingTransport())
+        use_app_options(self, Stale_time=10)
+        refreshes = []  # futures of background refresh
+        refresh_in_background = self.test_provider.refresh_in_background
+        self.test_provider.refresh_in_background = \
+            lambda URL: refreshes.append(refresh_in_background(URL))
+
+        self.test_provider.get_raw_page(URL, True)
+        self.test_provider.Caching_time = 0  # cache is expired at once
+        page = self.test_provider.get_raw_page(URL)
+        refreshes[0].result(5)
+
+        self.assertEqual(len(transport.requested), 2)
+
+        self.assertEqual(page, 'Погода 1')
+        self.assertTrue(self.test_provider.stale)
+        self.assertEqual(self.test_provider.load_cache(URL),
+                         'Погода 2'.encode('utf-8'))
+
+    def test_stale_if_error(self):
+        """ Test showing expired page if provider is down """
+
+        URL = 'http://weather.test/down'
+        transport = use_transport(self, ChangingTransport())
+        self.test_provider.get_raw_page(URL, True)
+        transport.down = True
+        page = self.test_provider.get_raw_page(URL, True)
+
+        self.assertEqual(page, 'Погода 1')
+        self.assertTrue(self.test_provider.stale)
+
+    def test_stale_pages(self):
+        """ Test results are not saved for stale page only """
+
+        stale_URL = 'http://weather.test/stale_page'
+        URL = 'http://weather.test/fresh_page'
+        transport = use_transport(self, ChangingTransport())
+        self.test_provider.get_raw_page(stale_URL, True)
+        transport.down = True
+        self.test_provider.get_raw_page(stale_URL, True)
+        transport.down = False
+
+        self.test_provider.scrape(URL, 'get_info', True)
+        self.test_provider.save_result(stale_URL, 'get_info', {"Info": "Old"})
+
+        self.assertEqual(self.test_provider.stale_pages, {stale_URL})
+        self.assertEqual(self.test_provider.load_result(URL, 'get_info'),
+                         {"Info": "Parsed"})
+        self.assertIsNone(
+            self.test_provider.load_result(stale_URL, 'get_info'))
+
+    def test_single_flight(self):
+        """ Test showing cached page while other process loads it """
+
+        URL = 'http://weather.test/single'
+        transport = use_transport(self, ChangingTransport())
+        use_app_options(self, Lease_wait=0)
+        self.test_provider.get_raw_page(URL, True)
+        self.test_provider.Caching_time = 0  # cache is expired at once
+        with self.test_provider.cache.lease(URL) as lease:
+            lease.acquire()  # page is being loaded by other process
+            page = self.test_provider.get_raw_page(URL)
+
+        self.assertEqual(page, 'Погода 1')
+        self.assertTrue(self.test_provider.stale)
+        self.assertEqual(len(transport.requested), 1)
+
+    def test_load_page(self):
+        """ Test loading and parsing each page once per run """
+
+        transport = use_transport(self, FakeTransport())
+        for i in range(2):  # e.g. URL and URL_hourly of RP5
+            self.test_provider.load_page('http://weather.test/same', True)
+            soup = self.test_provider.get_soup()
+
+        self.assertEqual(transport.requested, ['http://weather.test/same'])
+        self.assertEqual(self.test_provider.raw_page, 'Погода')
+        self.assertIs(soup, self.test_provider.get_soup())
+        self.assertEqual(len(self.test_provider.soups), 1)
+
+    def test_scrape_result_cache(self):
+        """ Test taking scraper result from cache without parsing """
+
+        URL = 'http://weather.test/result'
+        transport = use_transport(self, FakeTransport())
+        self.test_provider.scrape(URL, 'get_info', True)
+        provider = TestProvider(self.app)
+        provider.get_info = None  # must not be called
+        weather_info = provider.scrape(URL, 'get_info')
+
+        provider.parser_version += 1  # scrapers are changed
+        self.assertIsNone(provider.load_result(URL, 'get_info'))
+
+        self.assertEqual(weather_info, {"Info": "Parsed"})
+        self.assertEqual(transport.requested, [URL])
+        self.assertNotIn(URL, provider.documents)
+
+    def test_scrape_same_page(self):
+        """ Test reusing result of reloaded page with the same content """
+
+        URL = 'http://weather.test/same_result'
+        transport = use_transport(self, FakeTransport())
+        self.test_provider.scrape(URL, 'get_info', True)
+        provider = TestProvider(self.app)
+        provider.get_info = None  # must not be called
+        weather_info = provider.scrape(URL, 'get_info', True)
+
+        self.assertEqual(weather_info, {"Info": "Parsed"})
+        self.assertEqual(transport.requested, [URL, URL])
+
+    def test_endpoint_caching_time(self):
+        """ Test own caching time of next day page """
+
+        self.test_provider.Caching_time = 10
+        self.test_provider.Caching_time_next_day = 120
+
+        self.assertEqual(self.test_provider.get_endpoint_caching_time(
+            self.test_provider.URL_next_day), 7200)
+        self.assertEqual(self.test_provider.get_endpoint_caching_time(
+            'http://weather.test/other'), 600)
+
+    def test_adaptive_ttl(self):
+        """ Test adapting caching time to page changes """
+
+        use_app_options(self, Adaptive_TTL=1, TTL_min=1, TTL_max=100)
+        self.test_provider.Caching_time = 10
+        caching_times = []
+        for transport in [FakeTransport(), ChangingTransport()]:
+            URL = f'http://weather.test/adaptive/{len(caching_times)}'
+            use_transport(self, transport)
+            for i in range(3):
+                self.test_provider.get_raw_page(URL, True)
+            entry = self.test_provider.cache.load(URL)
+            caching_times.append(self.test_provider.get_caching_time(entry))
+
+        # 600 seconds grow twice while page is the same,
+        # or are halved twice if it is changed each time
+        self.assertEqual(caching_times, [1350, 150])
+        self.assertEqual(entry.validators['Checks'], 3)
+        self.assertEqual(entry.validators['Changes'], 2)
+
     def test_run(self):
         """ Testing run of WeatherProvider abstract class """
 
         weather_info = {}
+        use_transport(self, FakeTransport())
         self.test_provider = TestProvider(self.app)
         title = self.test_provider.title
         city = self.test_provider.Location
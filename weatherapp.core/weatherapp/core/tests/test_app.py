@@ -1,4 +1,9 @@
+import io
 import sys
+import json
+import time
+import tempfile
+import pathlib
 
 import unittest
 
@@ -8,6 +13,51 @@ import argparse
 sys.path.insert(0, '..')
 
 
+class SlowProvider():
+    """ Fake provider which loads its page for a while """
+
+    delay = 0.3
+
+    def __init__(self, app):
+        self.app = app
+
+    def run(self, argv=None):
+        time.sleep(self.delay)
+        return {'Temperature': self.delay}, self.title
+
+
+class FirstProvider(SlowProvider):
+
+    title = 'First'
+    delay = 0.3
+
+
+class SecondProvider(SlowProvider):
+
+    title = 'Second'
+    delay = 0.1
+
+
+class LocationProvider(SlowProvider):
+    """ Fake provider which knows any location but 'Nowhere' """
+
+    title = 'Located'
+    delay = 0.01
+
+    def resolve_location(self, location, URL=None):
+        if location == 'Nowhere':
+            return None
+        return {'Location': location, 'URL': URL}
+
+    def use_location(self, location_set):
+        self.location_set = location_set
+
+    def run(self, argv=None):
+        time.sleep(self.delay)
+        return dict(self.location_set), \
+            f"{self.title}, {self.location_set['Location']}"
+
+
 class TestApp(unittest.TestCase):
     """ Test Case for App """
 
@@ -20,7 +70,18 @@ class TestApp(unittest.TestCase):
         test_logger = self.app._get_logger(self.app.args.verbosity)
         self.assertEqual(str(test_logger), '<Logger app (WARNING)>')
         self.assertEqual(test_logger.name, 'app')
-        self.assertEqual(len(test_logger.handlers), 2)
+        # handler is added once, App may be created many times by daemon
+        self.assertEqual(len(test_logger.handlers), 1)
+
+    def test_get_path(self):
+        """ Test file names are relative to directory of the caller """
+
+        app = App([], cwd='/client')
+
+        self.assertEqual(app.get_path('out'), pathlib.Path('/client/out'))
+        self.assertEqual(app.output_state_path,
+                         pathlib.Path('/client/.wfapp_output.json'))
+        self.assertEqual(app.get_path('/tmp/out'), pathlib.Path('/tmp/out'))
 
     def test_take_args(self):
         """ Test taking cli args """
@@ -34,5 +95,95 @@ class TestApp(unittest.TestCase):
             args = self.app.get_option_args(provider)
             self.assertEqual(str(type(args)), "<class 'list'>")
 
+    def test_run_providers(self):
+        """ Test running providers concurrently """
+
+        for provider in [FirstProvider, SecondProvider]:
+            self.app.providers.add(provider.title, provider)
+        self.app.args.workers = 2
+
+        start_time = time.perf_counter()
+        results = self.app.run_providers(['First', 'Second'])
+        run_time = time.perf_counter() - start_time
+
+        # results are in given order, not in order of completion
+        self.assertEqual([title for info, title in results],
+                         ['First', 'Second'])
+        # providers were loaded at the same time
+        self.assertLess(run_time, FirstProvider.delay + SecondProvider.delay)
+
+    def test_run_providers_on_ready(self):
+        """ Test showing providers in order of completion """
+
+        for provider in [FirstProvider, SecondProvider]:
+            self.app.providers.add(provider.title, provider)
+        self.app.args.workers = 2
+        ready = []
+
+        results = self.app.run_providers(
+            ['First', 'Second'],
+            on_ready=lambda weather_info, title: ready.append(title))
+
+        # faster provider is shown first, results keep given order
+        self.assertEqual(ready, ['Second', 'First'])
+        self.assertEqual([title for info, title in results],
+                         ['First', 'Second'])
+        self.assertEqual(set(self.app.run_times), {'First', 'Second'})
+
+    def test_parse_location(self):
+        """ Test parsing location line with provider page """
+
+        self.assertEqual(
+            self.app.parse_location('Львів; Sinoptik = https://weather.test'),
+            ('Львів', {'Sinoptik': 'https://weather.test'}))
+
+    def test_run_batch(self):
+        """ Test running provider for many locations """
+
+        self.app.providers.add(LocationProvider.title, LocationProvider)
+        self.app.args.location = ['Київ', 'Nowhere',
+                                  'Львів; Located=http://weather.test/lviv']
+        self.app.args.batch_format = 'json'
+        self.app.stdout = io.StringIO()
+
+        failed = self.app.run_batch(['Located'])
+
+        lines = [json.loads(line)
+                 for line in self.app.stdout.getvalue().splitlines()]
+        self.assertEqual(failed, 1)
+        self.assertEqual(
+            sorted((line['Location'], line['Info']['URL']) for line in lines),
+            [('Київ', None), ('Львів', 'http://weather.test/lviv')])
+
+    def test_batch_failed(self):
+        """ Test batch run exits with error if a location failed """
+
+        app = App(['Located', '-l', 'Київ', '-l', 'Nowhere',
+                   '--batch-format', 'json', '-f'])
+        app.providers.add(LocationProvider.title, LocationProvider)
+        app.stdout = io.StringIO()
+
+        with self.assertRaises(SystemExit) as exit:
+            app.main()
+
+        self.assertEqual(exit.exception.code, 1)
+        self.assertEqual(len(app.stdout.getvalue().splitlines()), 1)
+
+    def test_data_changed(self):
+        """ Test detecting changed weather info """
+
+        results = [({'Temperature': 5}, 'Changed, test')]
+
+        with tempfile.TemporaryDirectory() as path:
+            self.app.output_state_path = pathlib.Path(path) / 'output.json'
+
+            self.app.data_changed(results)
+            self.assertFalse(self.app.data_changed(results))
+            self.assertFalse(self.app.data_changed(
+                [({'Temperature': 5}, 'Changed, test (застарілі дані)')]))
+            self.assertTrue(self.app.data_changed(
+                [({'Temperature': 6}, 'Changed, test')]))
+
+
 if __name__ == "__main__":
     unittest.main()
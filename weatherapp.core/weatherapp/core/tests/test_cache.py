@@ -0,0 +1,221 @@
+import sys
+import os
+import time
+import tempfile
+import pathlib
+import unittest
+from unittest import mock
+
+from managers.cache import pack_page, unpack_page, read_header, \
+    get_cache_stats, FileCache, SQLiteCache, Lease
+
+sys.path.insert(0, '..')
+
+
+class TestCacheFormat(unittest.TestCase):
+    """ Test cache file format """
+
+    def setUp(self):
+        self.page = ('<html>' + 'Погода ' * 500 + '</html>').encode('utf-8')
+
+    def test_pack_page(self):
+        """ Test compressing page """
+
+        for codec in ['zlib', 'lzma']:
+            packed = pack_page(self.page, codec)
+
+            self.assertEqual(read_header(packed), (codec, len(self.page)))
+            self.assertLess(len(packed), len(self.page))
+            self.assertEqual(unpack_page(packed), self.page)
+
+    def test_raw_page(self):
+        """ Test pages saved without compression and by older versions """
+
+        packed = pack_page(self.page, 'none')
+
+        self.assertEqual(packed, self.page)
+        self.assertIsNone(read_header(packed))
+        self.assertEqual(unpack_page(self.page), self.page)
+
+    def test_get_cache_stats(self):
+        """ Test counting saved bytes """
+
+        with tempfile.TemporaryDirectory() as path:
+            path = pathlib.Path(path)
+            (path / 'raw.wbc').write_bytes(self.page)
+            (path / 'packed.wbc').write_bytes(pack_page(self.page, 'zlib'))
+
+            stats = get_cache_stats(path)
+
+        self.assertEqual(stats['Entries'], 2)
+        self.assertEqual(stats['Pages'], 2 * len(self.page))
+        self.assertLess(stats['Stored'], stats['Pages'])
+
+
+class TestCacheBackends(unittest.TestCase):
+    """ Test file and SQLite cache backends """
+
+    def setUp(self):
+        self.page = ('<html>' + 'Погода ' * 500 + '</html>').encode('utf-8')
+        self.directory = tempfile.TemporaryDirectory()
+        self.backends = [FileCache(self.directory.name, 'zlib'),
+                         SQLiteCache(self.directory.name, 'zlib')]
+
+    def tearDown(self):
+        self.backends[1].close()
+        self.directory.cleanup()
+
+    def test_save_load(self):
+        """ Test loading saved page with its validators """
+
+        for cache in self.backends:
+            self.assertIsNone(cache.load('http://weather.test/page'))
+
+            cache.save('http://weather.test/page', self.page, {'ETag': '"1"'})
+            entry = cache.load('http://weather.test/page')
+
+            self.assertEqual(entry.page, self.page)
+            self.assertEqual(entry.validators, {'ETag': '"1"'})
+            self.assertAlmostEqual(entry.time, time.time(), delta=5)
+
+    def test_touch(self):
+        """ Test marking page as just loaded """
+
+        for cache in self.backends:
+            cache.save('http://weather.test/page', self.page, {})
+            self.assertTrue(
+                cache.touch('http://weather.test/page', {'Max-age': 60}))
+            entry = cache.load('http://weather.test/page')
+
+            self.assertEqual(entry.validators, {'Max-age': 60})
+            self.assertEqual(entry.page, self.page)
+
+            # page removed by other process is not brought back
+            cache.clear()
+            self.assertFalse(
+                cache.touch('http://weather.test/page', {'Max-age': 60}))
+            self.assertIsNone(cache.load('http://weather.test/page'))
+
+    def test_stats_clear(self):
+        """ Test counting and removing cached pages """
+
+        for cache in self.backends:
+            cache.save('http://weather.test/1', self.page, {})
+            cache.save('http://weather.test/2', self.page, {})
+
+            stats = cache.stats()
+            self.assertEqual(stats['Entries'], 2)
+            self.assertEqual(stats['Pages'], 2 * len(self.page))
+            self.assertLess(stats['Stored'], stats['Pages'])
+
+            cache.clear()
+            self.assertIsNone(cache.load('http://weather.test/1'))
+            self.assertEqual(cache.stats()['Entries'], 0)
+
+    def test_max_entries(self):
+        """ Test removing least recently used pages over the limit """
+
+        for cache in self.backends:
+            cache.max_entries = 2
+            cache.use_resolution = 0
+            cache.save('http://weather.test/1', self.page, {})
+            cache.save('http://weather.test/2', self.page, {})
+            time.sleep(0.01)
+            cache.load('http://weather.test/1')  # 2 is used earlier now
+            cache.save('http://weather.test/3', self.page, {})
+
+            self.assertIsNotNone(cache.load('http://weather.test/1'))
+            self.assertIsNone(cache.load('http://weather.test/2'))
+            self.assertIsNotNone(cache.load('http://weather.test/3'))
+
+    def test_limits_counted(self):
+        """ Test cache is listed only when it is pruned """
+
+        for cache in self.backends:
+            cache.max_entries = 10
+            with mock.patch.object(cache, 'entries',
+                                   wraps=cache.entries) as entries:
+                for number in range(12):
+                    cache.save(f'http://weather.test/{number}', self.page, {})
+                cache.save('http://weather.test/11', self.page, {})
+
+            self.assertEqual(entries.call_count, 2)  # counted and pruned
+            self.assertEqual(cache.stats()['Entries'], 10)
+
+    def test_prune(self):
+        """ Test removing old pages and pages over size limit """
+
+        for cache in self.backends:
+            cache.save('http://weather.test/1', self.page, {})
+            cache.save('http://weather.test/2', self.page, {})
+
+            size = cache.entries()[0][3]  # on disk, pages are compressed
+
+            self.assertEqual(cache.prune(older_than=60), 0)
+            self.assertEqual(cache.prune(max_size=size), 1)
+            self.assertEqual(cache.prune(older_than=-1), 1)
+            self.assertEqual(cache.stats()['Entries'], 0)
+
+
+    def test_atomic_write(self):
+        """ Test no temporary files are left after saving """
+
+        cache = self.backends[0]
+        cache.save('http://weather.test/page', self.page, {'ETag': '"1"'})
+
+        self.assertEqual(
+            sorted(path.suffix for path in cache.path.iterdir()),
+            ['.wbc', '.wbm'])
+
+    def test_temp_files_removed(self):
+        """ Test removing temporary files left by crashed writers """
+
+        cache = self.backends[0]
+        old_file = cache.path / 'old.tmp'
+        new_file = cache.path / 'new.tmp'  # being written now
+        for path in (old_file, new_file):
+            path.write_bytes(b'Pog')
+        os.utime(old_file, (time.time() - 7200, time.time() - 7200))
+
+        cache.prune()
+        self.assertFalse(old_file.exists())
+        self.assertTrue(new_file.exists())
+
+        os.utime(new_file, (time.time() - 7200, time.time() - 7200))
+        cache.clear()
+        self.assertFalse(new_file.exists())
+
+
+class TestLease(unittest.TestCase):
+    """ Test cross-process lease of cached page """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name) / 'page.lock'
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_acquire(self):
+        """ Test only one holder of lease """
+
+        with Lease(self.path) as lease:
+            self.assertTrue(lease.acquire())
+            other = Lease(self.path)
+            self.assertFalse(other.acquire(wait=0.2))
+            self.assertTrue(other.waited)
+
+        self.assertFalse(self.path.exists())
+        self.assertTrue(other.acquire())
+        other.release()
+
+    def test_expired(self):
+        """ Test taking lease of crashed process """
+
+        Lease(self.path).acquire()  # never released
+        time.sleep(0.01)
+
+        self.assertTrue(Lease(self.path, lease_time=0).acquire())
+
+if __name__ == "__main__":
+    unittest.main()
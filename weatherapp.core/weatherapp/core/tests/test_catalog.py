@@ -0,0 +1,232 @@
+import io
+import sys
+import pathlib
+import tempfile
+
+import unittest
+from unittest import mock
+
+from abstract.commands import BuildCatalog
+from managers.catalog import Catalog, set_catalog
+from managers.search import normalize, TrigramIndex
+from app import App
+from helpers import StubProvider, use_app_options
+
+sys.path.insert(0, '..')
+
+
+class CatalogProvider(StubProvider):
+    """ Test provider with two countries of two cities """
+
+    title = 'RP5'
+    URL_locations = 'http://weather.test/'
+    location_levels = ['country', 'city']
+    down = set()  # pages which fail to load
+    loaded = []  # pages of get_locations calls
+
+    def get_locations(self, level=0, URL_location=None):
+        URL_location = URL_location or self.URL_locations
+        self.loaded.append(URL_location)
+        if URL_location in self.down:
+            raise OSError('Page is not loaded')
+        if level == 0:
+            return {'Україна': 'http://weather.test/ua',
+                    'Польща': 'http://weather.test/pl'}
+        if URL_location.endswith('ua'):
+            return {'Київ': 'http://weather.test/kyiv',
+                    'Кривий Ріг': 'http://weather.test/kryvyi-rih'}
+        return {'Краків': 'http://weather.test/krakow',
+                'Варшава': 'http://weather.test/warszawa'}
+
+
+class TestCatalog(unittest.TestCase):
+    """ Test locations catalog """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.catalog = Catalog(pathlib.Path(self.directory.name) /
+                               'catalog.tsv')
+        self.catalog.save([
+            ('Київ', 'RP5', 'http://rp5.test/kyiv', 'Україна'),
+            ('Київ', 'Sinoptik', 'http://sinoptik.test/kyiv', ''),
+            ('Кривий Ріг', 'RP5', 'http://rp5.test/kryvyi-rih', 'Україна'),
+            ('Краків', 'RP5', 'http://rp5.test/krakow', 'Польща')])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_find(self):
+        """ Test case-insensitive prefix lookup """
+
+        catalog = Catalog(self.catalog.path)  # read from file
+
+        self.assertEqual([location.name for location in
+                          catalog.find('кр', 'RP5')],
+                         ['Краків', 'Кривий Ріг'])
+        self.assertEqual(len(catalog.find('КИЇВ')), 2)
+        self.assertEqual(len(catalog.find('К', limit=3)), 3)
+        self.assertEqual(catalog.find('Львів'), [])
+
+    def test_get(self):
+        """ Test exact lookup of location page """
+
+        self.assertEqual(self.catalog.get('київ', 'Sinoptik'),
+                         'http://sinoptik.test/kyiv')
+        self.assertIsNone(self.catalog.get('Ки', 'RP5'))
+        self.assertIsNone(self.catalog.get('Краків', 'Sinoptik'))
+
+    def test_search(self):
+        """ Test fuzzy search in other script """
+
+        found = self.catalog.search('Kyiv')
+
+        self.assertEqual([(location.name, location.provider)
+                          for score, location in found[:2]],
+                         [('Київ', 'RP5'), ('Київ', 'Sinoptik')])
+        self.assertEqual(
+            self.catalog.search('Krakow', 'RP5')[0][1].name, 'Краків')
+        self.assertEqual(self.catalog.search('Krakow', 'Sinoptik'), [])
+
+    def test_saved_search_index(self):
+        """ Test search index is loaded from file, not made again """
+
+        catalog = Catalog(self.catalog.path)
+        with mock.patch.object(catalog, 'make_search_index') as make:
+            found = catalog.search('Kyiv', 'Sinoptik')
+
+        make.assert_not_called()
+        self.assertEqual([location.URL for score, location in found],
+                         ['http://sinoptik.test/kyiv'])
+
+        # file cut by full disk is not used
+        data = catalog.search_path.read_bytes()
+        catalog.search_path.write_bytes(data[:-4])
+        self.assertIsNone(Catalog(self.catalog.path).load_search_index())
+
+        self.catalog.path.write_text('', encoding='utf-8')  # changed file
+        self.assertEqual(Catalog(self.catalog.path).search('Kyiv'), [])
+
+
+class TestTrigramIndex(unittest.TestCase):
+    """ Test fuzzy search of names """
+
+    def test_normalize(self):
+        """ Test spellings of providers are made the same """
+
+        self.assertEqual(normalize('Київ'), normalize('Kyiv'))
+        self.assertEqual(normalize('Харків'), normalize('KHARKIV'))
+        self.assertEqual(normalize('Kraków'), 'krakov')
+        self.assertEqual(normalize("Кам'янець-Подільський"),
+                         'kamianets podilskii')
+
+    def test_search(self):
+        """ Test ranking misspelled names and beginnings of names """
+
+        names = ['Одеса', 'Львів', 'Луцьк', 'Львівка']
+        index = TrigramIndex(names)
+
+        self.assertEqual([names[number] for score, number
+                          in index.search('Lviv')], ['Львів', 'Львівка'])
+        self.assertEqual(names[index.search('Odessa')[0][1]], 'Одеса')
+        self.assertEqual(names[index.search('Лу')[0][1]], 'Луцьк')
+        self.assertEqual(index.search('Tokyo'), [])
+
+        loaded = TrigramIndex.from_dump(index.dump())
+        self.assertEqual(loaded.search('Lviv'), index.search('Lviv'))
+        self.assertEqual(loaded.search('Lviv', within=range(3, 4)),
+                         index.search('Lviv', within=range(3, 4)))
+        self.assertEqual([number for score, number
+                          in loaded.search('Lviv', within=range(3, 4))], [3])
+
+
+class TestBuildCatalog(unittest.TestCase):
+    """ Test BuildCatalog command """
+
+    def setUp(self):
+        self.app = App()
+        self.app.stdout = io.StringIO()
+        self.app.remaining_args = ['RP5']
+        self.app.providers.add('RP5', CatalogProvider)
+        self.directory = tempfile.TemporaryDirectory()
+        self.catalog = Catalog(pathlib.Path(self.directory.name) /
+                               'catalog.tsv')
+        self.previous_catalog = set_catalog(self.catalog)
+
+    def tearDown(self):
+        CatalogProvider.down = set()
+        set_catalog(self.previous_catalog)
+        self.directory.cleanup()
+
+    def test_run(self):
+        """ Test crawling locations and continuing after errors """
+
+        CatalogProvider.down = {'http://weather.test/pl'}
+        BuildCatalog(self.app).run()
+
+        self.assertEqual(self.catalog.get('Київ', 'RP5'),
+                         'http://weather.test/kyiv')
+        self.assertIsNone(self.catalog.get('Краків', 'RP5'))
+        self.assertIn('1 pages failed', self.app.stdout.getvalue())
+
+        # next run loads failed page only
+        CatalogProvider.down = {'http://weather.test/',
+                                'http://weather.test/ua'}
+        BuildCatalog(self.app).run()
+
+        self.assertEqual([location.name for location in
+                          self.catalog.find('', 'RP5')],
+                         ['Варшава', 'Київ', 'Краків', 'Кривий Ріг'])
+        self.assertEqual(self.catalog.find('київ')[0].path, 'Україна')
+        self.assertFalse(pathlib.Path(
+            BuildCatalog.get_checkpoint_path(self.catalog)).exists())
+
+
+class TestBrowseLocation(unittest.TestCase):
+    """ Test loading locations while user browses them """
+
+    def setUp(self):
+        self.app = App()
+        self.app.stdout = io.StringIO()
+        self.directory = tempfile.TemporaryDirectory()
+        self.previous_catalog = set_catalog(Catalog(
+            pathlib.Path(self.directory.name) / 'catalog.tsv'))
+        use_app_options(self)  # options are restored after test
+        CatalogProvider.loaded = []
+
+    def tearDown(self):
+        set_catalog(self.previous_catalog)
+        self.directory.cleanup()
+
+    def test_prefetch(self):
+        """ Test next list is taken from locations loaded in background """
+
+        provider = CatalogProvider(self.app)
+        with mock.patch('builtins.input', side_effect=['Польща', 'Краків']):
+            location_set = provider.browse_location()
+
+        self.assertEqual(location_set, {'URL': 'http://weather.test/krakow',
+                                        'Location': 'Краків'})
+        self.assertEqual(sorted(CatalogProvider.loaded),
+                         ['http://weather.test/', 'http://weather.test/pl',
+                          'http://weather.test/ua'])
+
+    def test_prefetch_ancestry(self):
+        """ Test country of current location is loaded first """
+
+        self.app.remaining_args = ['RP5']
+        self.app.providers.add('RP5', CatalogProvider)
+        BuildCatalog(self.app).run()
+        use_app_options(self, Browse_prefetch=1)
+        CatalogProvider.loaded = []
+        provider = CatalogProvider(self.app)
+        provider.Location = 'Кривий Ріг'
+
+        with mock.patch('builtins.input', side_effect=['Україна', 'Київ']):
+            provider.browse_location()
+
+        self.assertEqual(CatalogProvider.loaded,
+                         ['http://weather.test/', 'http://weather.test/ua'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -28,7 +28,7 @@ class CommandManagerTest (unittest.TestCase):
         for item in [AnyCommand, SecondaryCommand]:
             self.command_manager.commands[item.name] = item
 
-        self.assertEqual(len(self.command_manager.commands), 4)
+        self.assertEqual(len(self.command_manager.commands), 10)
         self.assertTrue(
             'SecondaryCommand' in self.command_manager.commands.keys())
         self.assertFalse(
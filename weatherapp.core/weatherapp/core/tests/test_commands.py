@@ -0,0 +1,72 @@
+import io
+import sys
+
+import unittest
+
+from abstract.commands import Prefetch
+from config import config
+from app import App
+from helpers import StubProvider, FakeTransport, use_temporary_cache, \
+    use_transport
+
+sys.path.insert(0, '..')
+
+
+class PrefetchProvider(StubProvider):
+    """ Test provider with separate page for next hours """
+
+    URL_hourly = 'http://weather.test/hourly'
+    end_markers = {'get_info': [('div', 'now')],
+                   'get_hourly': [('div', 'hourly')]}
+
+
+class TestPrefetch(unittest.TestCase):
+    """ Test Prefetch command """
+
+    def setUp(self):
+        self.app = App()
+        self.app.stdout = io.StringIO()
+        self.app.remaining_args = ['Accuweather']
+        self.app.providers.add('Accuweather', PrefetchProvider)
+        self.providers_conf = config.PROVIDERS_CONF['Accuweather']
+        config.PROVIDERS_CONF['Accuweather'] = \
+            {'Show': True, 'Next_day': False, 'Next_hours': True}
+        use_temporary_cache(self)
+        self.transport = use_transport(self, FakeTransport({'ETag': '"1"'}))
+
+    def tearDown(self):
+        config.PROVIDERS_CONF['Accuweather'] = self.providers_conf
+
+    def test_run(self):
+        """ Test loading pages the next run needs """
+
+        Prefetch(self.app).run()
+
+        self.assertEqual(self.transport.requested,
+                         [PrefetchProvider.URL, PrefetchProvider.URL_hourly])
+        output = self.app.stdout.getvalue()
+        self.assertIn(PrefetchProvider.URL_hourly, output)
+        self.assertIn('Всього', output)
+
+        # next run takes results from cache
+        provider = PrefetchProvider(self.app)
+        provider.get_cli_args(['-f'])
+        self.assertEqual(provider.scrape(PrefetchProvider.URL, 'get_info'),
+                         {"Info": "Parsed"})
+        self.assertEqual(len(self.transport.requested), 2)
+
+    def test_revalidate(self):
+        """ Test cached pages are revalidated and loaded whole """
+
+        self.app.args.stream = True
+
+        Prefetch(self.app).run()
+        Prefetch(self.app).run()
+
+        self.assertEqual(self.transport.end_markers, [None] * 4)
+        self.assertEqual(self.transport.request_headers[2:],
+                         [{'If-None-Match': '"1"'}] * 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
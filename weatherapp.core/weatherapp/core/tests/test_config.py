@@ -0,0 +1,115 @@
+import os
+import sys
+import json
+import tempfile
+
+import unittest
+
+from config import config
+
+sys.path.insert(0, '..')
+
+
+class TestConfig(unittest.TestCase):
+    """ Test lazy loading and saving of configuration """
+
+    def setUp(self):
+        self.backend = config.MemoryBackend()
+        self.previous = config.set_backend(self.backend)
+
+    def tearDown(self):
+        config.set_backend(self.previous)
+
+    def test_lazy(self):
+        """ Test files are read on first access only """
+
+        self.assertNotIn('WEATHER_PROVIDERS', vars(config))
+
+        self.assertEqual(config.WEATHER_PROVIDERS['App']['Workers'],
+                         config.DEFAULT_WEATHER_PROVIDERS['App']['Workers'])
+        self.assertIn('WEATHER_PROVIDERS', vars(config))
+
+    def test_missing_files(self):
+        """ Test defaults are saved once if there are no files """
+
+        config.load()
+        self.assertTrue(config.is_dirty())
+        config.save()
+        config.save()
+
+        self.assertEqual(self.backend.writes, 2)
+        self.assertEqual(json.loads(self.backend.files['providers_conf.json']),
+                         config.DEFAULT_PROVIDERS_CONF)
+
+    def test_save_changed(self):
+        """ Test only changed file is written """
+
+        config.load()
+        config.save()
+        self.backend = config.MemoryBackend(self.backend.files)
+        config.set_backend(self.backend)
+
+        self.assertFalse(config.is_dirty())
+        config.save()
+        self.assertEqual(self.backend.writes, 0)
+
+        config.WEATHER_PROVIDERS['App']['Workers'] = 7
+        self.assertTrue(config.is_dirty())
+        config.save()
+
+        self.assertEqual(self.backend.writes, 1)
+        self.assertIn('Workers = 7', self.backend.files['weather_config.ini'])
+
+        config.reload_config()
+        self.assertEqual(config.WEATHER_PROVIDERS['App']['Workers'], 7)
+
+    def test_not_loaded(self):
+        """ Test nothing is written if config was not used """
+
+        config.save()
+
+        self.assertEqual(self.backend.writes, 0)
+
+    def test_file_backend(self):
+        """ Test file is replaced without temporary files left """
+
+        backend = config.FileBackend()
+        with tempfile.TemporaryDirectory() as path:
+            file_path = os.path.join(path, 'weather_config.ini')
+            self.assertIsNone(backend.read(file_path))
+
+            backend.write(file_path, 'first')
+            backend.write(file_path, 'second')
+
+            self.assertEqual(backend.read(file_path), 'second')
+            self.assertEqual(os.listdir(path), ['weather_config.ini'])
+
+    def test_locale_encoding(self):
+        """ Test config saved in Windows encoding by older versions """
+
+        text = '[RP5]\nLocation = Рим\nCaching_time = 60\n'
+        backend = config.FileBackend()
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as path:
+            os.chdir(path)
+            try:
+                with open('weather_config.ini', 'wb') as f:
+                    f.write(text.encode('cp1251'))
+                config.set_backend(backend)
+
+                self.assertEqual(config.WEATHER_PROVIDERS['RP5']['Location'],
+                                 'Рим')
+                config.WEATHER_PROVIDERS['RP5']['Caching_time'] = 30
+                config.save()
+
+                with open('weather_config.ini', 'rb') as f:
+                    saved = f.read().decode('cp1251')
+            finally:
+                os.chdir(cwd)
+
+        self.assertIn('Location = Рим', saved)
+        self.assertIn('Caching_time = 30', saved)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import io
+import os
+import sys
+import pathlib
+import tempfile
+import threading
+import argparse
+
+import unittest
+
+from managers import daemon
+from config import config
+
+sys.path.insert(0, '..')
+
+
+class FakeApp:
+    """ Application printing its arguments """
+
+    runs = 0
+    cwd = None  # directory of the last caller
+
+    def __init__(self, argv, cwd=None):
+        self.argv = argv
+        FakeApp.cwd = cwd
+        self.stdout = sys.stdout
+        self.args = argparse.Namespace(
+            command=argv[0] if argv else None,
+            clear_cache='--clear-cache' in argv)
+
+    def main(self):
+        FakeApp.runs += 1
+        self.stdout.write(f"run {FakeApp.runs}: {' '.join(self.argv)}\n")
+        if 'fail' in self.argv:
+            sys.exit(2)
+        if 'error' in self.argv:
+            raise ValueError('Page is not parsed')
+
+
+@unittest.skipUnless(hasattr(daemon.socket, 'AF_UNIX'), 'Unix sockets only')
+class TestDaemon(unittest.TestCase):
+    """ Test forwarding runs to daemon """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name) / 'test.sock'
+        self.environ = os.environ.get('WFAPP_SOCKET')
+        os.environ['WFAPP_SOCKET'] = str(self.path)
+        FakeApp.runs = 0
+
+    def tearDown(self):
+        if self.environ is None:
+            del os.environ['WFAPP_SOCKET']
+        else:
+            os.environ['WFAPP_SOCKET'] = self.environ
+        self.directory.cleanup()
+
+    def start(self):
+        """ Starts daemon in thread """
+
+        server = daemon.DaemonServer(FakeApp)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(thread.join)
+        return server, thread
+
+    def test_forward(self):
+        """ Test runs are done by daemon one process keeps """
+
+        self.start()
+        output = io.StringIO()
+
+        self.assertEqual(daemon.forward(['RP5', '-f'], output), 0)
+        self.assertEqual(daemon.forward(['fail'], output), 2)
+        self.assertEqual(output.getvalue(), 'run 1: RP5 -f\nrun 2: fail\n')
+        self.assertIsNone(daemon.forward(['Configure'], output))
+        self.assertEqual(FakeApp.cwd, os.getcwd())
+
+        daemon.request({'stop': True})
+
+    def test_run_state(self):
+        """ Test run does not see info of previous run and fails on errors """
+
+        server = daemon.DaemonServer(FakeApp)
+        self.addCleanup(server.server_close)
+        config.ACTUAL_WEATHER_INFO['RP5'] = {'Температура': '20'}
+        config.ACTUAL_PRINTABLE_INFO['RP5'] = 'RP5: 20'
+
+        self.assertEqual(server.run_app(['RP5'], '/client'),
+                         ('run 1: RP5\n', 0))
+        self.assertEqual(FakeApp.cwd, '/client')
+        self.assertEqual(config.ACTUAL_WEATHER_INFO, {})
+        self.assertEqual(config.ACTUAL_PRINTABLE_INFO, {})
+
+        output, code = server.run_app(['error'])
+        self.assertEqual(code, 1)
+        self.assertIn('Page is not parsed', output)
+
+    def test_interactive_options(self):
+        """ Test daemon leaves runs asking user to caller """
+
+        self.start()
+        output = io.StringIO()
+
+        self.assertIsNone(daemon.forward(['RP5', '--clear-cache'], output))
+        self.assertEqual(FakeApp.runs, 0)
+        self.assertEqual(output.getvalue(), '')
+
+        daemon.request({'stop': True})
+
+    def test_not_running(self):
+        """ Test caller runs application if daemon is stopped """
+
+        self.assertIsNone(daemon.forward(['RP5']))
+
+        server, thread = self.start()
+        daemon.request({'stop': True})
+        thread.join()
+        server.server_close()
+
+        self.assertIsNone(daemon.forward(['RP5']))
+        self.assertEqual(FakeApp.runs, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -46,6 +46,14 @@ class ProviderManagerTest (unittest.TestCase):
             provider = self.provider_manager._providers.get(item, None)
             self.assertFalse(provider, None)
 
+    def test_get_lazy(self):
+        """ Test importing registered provider on first use """
+
+        self.assertIsInstance(self.provider_manager._providers['RP5'], tuple)
+        self.assertIs(self.provider_manager.get('RP5'), RP5_Provider)
+        self.assertIs(self.provider_manager._providers['RP5'], RP5_Provider)
+        self.assertIsNone(self.provider_manager.get('Unknown'))
+
     def get_list(self):
         """ Test getting a list of providers """
 
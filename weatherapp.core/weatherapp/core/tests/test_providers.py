@@ -1,10 +1,16 @@
 import sys
 sys.path.insert(0, '..')
 
+import pathlib
+import tempfile
 import unittest
+from urllib.error import HTTPError
 
 from abstract.providers import AccuProvider, RP5_Provider, SinoptikProvider
+from managers.transport import Response
+from managers.catalog import Catalog, set_catalog
 from app import App
+from helpers import FakeTransport, use_temporary_cache, use_transport
 
 
 class TestAccuProvider(unittest.TestCase):
@@ -156,6 +162,129 @@ class TestRP5_Provider(unittest.TestCase):
         self.assertTrue(type(weather_info['Next_day_condition']) is str)
 
 
+SINOPTIK_PAGE = """<html><body>
+<div class="header"><a href="/">Sinoptik</a></div>
+<div class="lSide">
+<div class="img">
+<img alt="Хмарно"/></div>
+<p class="today-temp">+5°C</p></div>
+<div class="rSide"><table>
+<tr class="temperatureSens"><td class="p1">+3°</td></tr>
+</table></div>
+<div class="footer">Footer</div>
+</body></html>"""
+
+
+class WrongBlockProvider(SinoptikProvider):
+    """ Sinoptik with wrong block declared for get_info """
+
+    parse_only = {'get_info': ('div', {'class': 'footer'})}
+
+
+class StreamingTransport():
+    """ Transport cutting page before 'rSide' block when streaming """
+
+    def __init__(self):
+        self.end_markers = []
+
+    def request(self, URL, headers=None, data=None, end_markers=None):
+        self.end_markers.append(end_markers)
+        page = SINOPTIK_PAGE.encode('utf-8')
+        if end_markers:
+            return Response(URL, 200, {}, page[:page.index(b'rSide')],
+                            truncated=True)
+        return Response(URL, 200, {}, page)
+
+
+class MisspeltTransport(FakeTransport):
+    """ Transport without pages of misspelt locations """
+
+    def request(self, URL, headers=None, data=None, end_markers=None):
+        if 'xyz' in URL:
+            raise HTTPError(URL, 404, 'Not Found', {}, None)
+        return super().request(URL, headers, data, end_markers)
+
+
+class TestSinoptikLocation(unittest.TestCase):
+    """ Test finding Sinoptik page of location by its name """
+
+    def setUp(self):
+        self.app = App()
+        use_temporary_cache(self)
+        use_transport(self, MisspeltTransport())
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(set_catalog, set_catalog(
+            Catalog(pathlib.Path(directory.name) / 'catalog.tsv')))
+
+    def test_resolve_location(self):
+        """ Test location is resolved only if its page exists """
+
+        provider = SinoptikProvider(self.app)
+
+        self.assertEqual(provider.resolve_location('Кривий Ріг')['URL'],
+                         'https://ua.sinoptik.ua/%D0%BF%D0%BE%D0%B3%D0%BE'
+                         '%D0%B4%D0%B0-%D0%BA%D1%80%D0%B8%D0%B2%D0%B8%D0%B9'
+                         '-%D1%80%D1%96%D0%B3')
+        self.assertIsNone(provider.resolve_location('Kyivxyz'))
+
+
+class TestPartialParsing(unittest.TestCase):
+    """ Test parsing only blocks declared by provider """
+
+    def setUp(self):
+        self.app = App()
+
+    def test_partial_parsing(self):
+        """ Test scraping from declared block only """
+
+        provider = SinoptikProvider(self.app)
+        provider.raw_page = SINOPTIK_PAGE
+
+        weather_info = provider.get_info()
+
+        self.assertEqual(weather_info, {'Condition': 'Хмарно',
+                                        'Temperature': 5, 'RealFeel': 3})
+        # only declared block was parsed
+        soup = list(provider.soups.values())[0]
+        self.assertIsNone(soup.find('div', class_='footer'))
+
+    def test_full_parse_fallback(self):
+        """ Test parsing full page if declared block is not enough """
+
+        provider = WrongBlockProvider(self.app)
+        provider.raw_page = SINOPTIK_PAGE
+
+        weather_info = provider.get_info()
+
+        self.assertEqual(weather_info['Temperature'], 5)
+        self.assertEqual(len(provider.soups), 2)  # block and full page
+        self.assertFalse(provider.full_parse)
+
+
+class TestStreaming(unittest.TestCase):
+    """ Test loading pages up to needed blocks """
+
+    def setUp(self):
+        self.app = App()
+        self.app.args.stream = True
+        use_temporary_cache(self)
+
+    def test_scrape_cut_page(self):
+        """ Test loading full page if cut one is not enough """
+
+        transport = use_transport(self, StreamingTransport())
+        provider = SinoptikProvider(self.app)
+        weather_info = provider.scrape('http://weather.test/cut', 'get_info',
+                                       True)
+
+        self.assertEqual(weather_info['RealFeel'], 3)
+        # first request was streamed with get_info markers, second was not
+        self.assertEqual(transport.end_markers,
+                         [SinoptikProvider.end_markers['get_info'], None])
+        self.assertFalse(provider.truncated)
+
+
 class TestSinoptikProvider(unittest.TestCase):
     """ Tests for SinoptikProvider """
 
@@ -0,0 +1,95 @@
+import io
+import sys
+import time
+import threading
+
+import unittest
+
+from managers.scheduler import Scheduler, Task
+from managers.transport import get_priority, PRIORITY_BACKGROUND
+from app import App
+from helpers import StubProvider, FakeTransport, use_temporary_cache, \
+    use_transport
+
+sys.path.insert(0, '..')
+
+
+class ScheduledProvider(StubProvider):
+    """ Test provider with current weather page only """
+
+    Caching_time = 10
+
+
+class PriorityTransport(FakeTransport):
+    """ Transport recording priority of requests """
+
+    def __init__(self):
+        super().__init__({'ETag': '"1"'})
+        self.priorities = []
+
+    def request(self, URL, headers=None, data=None, end_markers=None):
+        self.priorities.append(get_priority())
+        return super().request(URL, headers, data, end_markers)
+
+
+class TestScheduler(unittest.TestCase):
+    """ Test background refresh scheduler """
+
+    def setUp(self):
+        self.app = App()
+        self.app.stdout = io.StringIO()
+        self.app.providers.add('Accuweather', ScheduledProvider)
+        use_temporary_cache(self)
+        self.transport = use_transport(self, PriorityTransport())
+
+    def test_run(self):
+        """ Test refreshing page and scheduling it at caching time """
+
+        scheduler = Scheduler(self.app, jitter=0.1)
+        refreshed = []
+
+        def on_refresh(task, error):
+            refreshed.append((task.URL, error))
+            scheduler.stop()
+
+        self.assertEqual(scheduler.add('Accuweather', []), 1)
+        thread = threading.Thread(target=scheduler.run, args=(on_refresh,))
+        thread.start()
+        thread.join(5)
+
+        self.assertEqual(refreshed, [(ScheduledProvider.URL, None)])
+        self.assertEqual(self.transport.priorities, [PRIORITY_BACKGROUND])
+
+        # next refresh is in 10 minutes moved by jitter
+        refresh_time, number, task = scheduler.queue[0]
+        self.assertAlmostEqual(refresh_time - time.time(), 600, delta=61)
+
+    def test_revalidate(self):
+        """ Test cached page is refreshed by conditional request """
+
+        provider = ScheduledProvider(self.app)
+        provider.get_raw_page(ScheduledProvider.URL, True)
+        scheduler = Scheduler(self.app)
+
+        scheduler.refresh(Task('Accuweather', [], None,
+                               ScheduledProvider.URL, ['get_info']))
+
+        self.assertEqual(self.transport.request_headers[-1],
+                         {'If-None-Match': '"1"'})
+        self.assertEqual(len(scheduler.queue), 1)
+
+    def test_add_cached(self):
+        """ Test cached page is refreshed when it expires """
+
+        provider = ScheduledProvider(self.app)
+        provider.get_raw_page(ScheduledProvider.URL, True)
+
+        scheduler = Scheduler(self.app)
+        scheduler.add('Accuweather', [])
+
+        self.assertAlmostEqual(scheduler.queue[0][0] - time.time(), 600,
+                               delta=5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import io
+import sys
+import json
+import time
+import threading
+import urllib.request
+from urllib.error import HTTPError
+
+import unittest
+
+from managers.service import WeatherService, ResponseCache
+from config import config
+from app import App
+from helpers import StubProvider
+
+sys.path.insert(0, '..')
+
+
+class ServiceProvider(StubProvider):
+    """ Test provider counting its runs """
+
+    runs = 0
+    delay = 0  # seconds run takes
+
+    def run(self, argv=None):
+        ServiceProvider.runs += 1
+        time.sleep(self.delay)
+        self.get_cli_args(argv)
+        return {'Температура': '20', 'next': self.args.next}, self.title
+
+    def set_location(self, location_set):
+        self.Location = location_set['Location']
+
+
+class TestWeatherService(unittest.TestCase):
+    """ Test HTTP JSON service """
+
+    def setUp(self):
+        self.app = App()
+        self.app.stdout = io.StringIO()
+        self.app.providers.add('Accuweather', ServiceProvider)
+        ServiceProvider.runs = 0
+        self.server = WeatherService(self.app, ('127.0.0.1', 0), 60)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.URL = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def get(self, path, headers=None):
+        """ Sends GET request to service
+            :return: status, headers and JSON data
+        """
+
+        request = urllib.request.Request(self.URL + path,
+                                         headers=headers or {})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.headers, \
+                    json.loads(response.read().decode('utf-8'))
+        except HTTPError as err:
+            body = err.read()
+            return err.code, err.headers, \
+                json.loads(body.decode('utf-8')) if body else None
+
+    def test_weather(self):
+        """ Test weather of provider and 304 answer to poller """
+
+        status, headers, data = self.get('/weather/Accuweather?next=1')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(data['info'], {'Температура': '20', 'next': True})
+        self.assertEqual(data['location'], 'Test Location')
+
+        status, headers, data = self.get(
+            '/weather/Accuweather?next=1',
+            {'If-None-Match': headers['ETag']})
+
+        self.assertEqual(status, 304)
+        self.assertEqual(ServiceProvider.runs, 1)  # answer is in memory
+
+    def test_location(self):
+        """ Test weather of location from shown providers """
+
+        providers_conf = config.PROVIDERS_CONF
+        config.PROVIDERS_CONF = {title: dict(options, Show=False)
+                                 for title, options in providers_conf.items()}
+        config.PROVIDERS_CONF['Accuweather']['Show'] = True
+        try:
+            status, headers, data = self.get(
+                '/weather?location=Test%20Location')
+        finally:
+            config.PROVIDERS_CONF = providers_conf
+
+        self.assertEqual(status, 200)
+        self.assertEqual([item['provider'] for item in data['providers']],
+                         ['Accuweather'])
+
+    def test_single_flight(self):
+        """ Test provider runs once for requests of the same answer """
+
+        ServiceProvider.delay = 0.1
+        self.addCleanup(setattr, ServiceProvider, 'delay', 0)
+        statuses = []
+        threads = [threading.Thread(target=lambda: statuses.append(
+            self.get('/weather/Accuweather')[0])) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(statuses, [200] * 5)
+        self.assertEqual(ServiceProvider.runs, 1)
+
+    def test_not_found(self):
+        """ Test unknown path and location """
+
+        self.assertEqual(self.get('/weather/Unknown')[0], 404)
+        self.assertEqual(
+            self.get('/weather/Accuweather?location=Nowhere')[0], 404)
+        self.assertEqual(self.get('/weather?location=')[0], 400)
+        self.assertEqual(
+            self.get('/weather/Accuweather?location=%20')[0], 400)
+        status, headers, data = self.get('/providers')
+        self.assertEqual(status, 200)
+        self.assertIn('Accuweather', [item['title'] for item in data])
+
+
+class TestResponseCache(unittest.TestCase):
+    """ Test answers kept in memory """
+
+    def test_limits(self):
+        """ Test expired and oldest answers are removed """
+
+        responses = ResponseCache(60, max_entries=2)
+        for number in range(3):
+            responses.put(f'/weather?location={number}', b'{}')
+
+        self.assertEqual(list(responses.responses),
+                         ['/weather?location=1', '/weather?location=2'])
+
+        responses.cache_time = -1  # next answers expire at once
+        responses.responses.clear()
+        responses.put('/weather?location=1', b'{}')
+        responses.put('/weather?location=2', b'{}')
+
+        self.assertEqual(list(responses.responses), ['/weather?location=2'])
+
+
+if __name__ == "__main__":
+    unittest.main()
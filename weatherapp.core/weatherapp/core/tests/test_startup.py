@@ -0,0 +1,54 @@
+import os
+import sys
+import subprocess
+import tempfile
+
+import unittest
+
+import app
+
+sys.path.insert(0, '..')
+
+IMPORT_BUDGET = 0.5  # seconds to import app and create App, slow CI included
+SCRAPING_MODULES = ('bs4', 'lxml', 'abstract.providers')
+
+
+class TestStartup(unittest.TestCase):
+    """ Test startup does not load what commands may not need """
+
+    def get_imports(self):
+        """ Imports app in new interpreter with -X importtime
+            :return: cumulative import time of each module, microseconds
+            :rtype: dict
+        """
+
+        environ = dict(os.environ, PYTHONPATH=os.path.dirname(app.__file__))
+        with tempfile.TemporaryDirectory() as directory:  # config files
+            result = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c',
+                 'import app; app.App([])'],
+                cwd=directory, env=environ, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+        imports = {}
+        for line in result.stderr.splitlines():
+            if line.startswith('import time:') and '|' in line:
+                self_time, cumulative, module = line[12:].split('|')
+                if cumulative.strip().isdigit():
+                    imports[module.strip()] = int(cumulative)
+
+        return imports
+
+    def test_import_budget(self):
+        """ Test scraping stack is not imported and startup is fast """
+
+        imports = self.get_imports()
+
+        self.assertIn('app', imports)
+        for module in SCRAPING_MODULES:
+            self.assertNotIn(module, imports)
+        self.assertLess(imports['app'] / 10 ** 6, IMPORT_BUDGET)
+
+
+if __name__ == "__main__":
+    unittest.main()
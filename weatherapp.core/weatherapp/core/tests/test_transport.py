@@ -0,0 +1,310 @@
+import sys
+import threading
+import time
+import unittest
+import zlib
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.error import HTTPError, URLError
+
+from managers.transport import HTTPTransport, BlockMarker, get_transport, \
+    set_transport, TokenBucket, background, get_priority
+
+sys.path.insert(0, '..')
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """ Local stand-in for weather sites """
+
+    protocol_version = 'HTTP/1.1'  # keep connections alive
+
+    def do_GET(self):
+        self.server.clients.add(self.client_address)
+
+        if self.path.startswith('http://'):  # asked as proxy
+            self.server.proxied.append(
+                (self.path, self.headers.get('Proxy-Authorization')))
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path == '/moved':
+            self.send_response(301)
+            self.send_header('Location', '/page')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path == '/gzip':
+            packer = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+            body = packer.compress(b'Pogoda ' * 100) + packer.flush()
+            self.send_response(200)
+            self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path in ('/deflate', '/broken'):
+            packer = zlib.compressobj(wbits=-zlib.MAX_WBITS)  # no header
+            body = packer.compress(b'Pogoda ' * 100) + packer.flush()
+            if self.path == '/broken':
+                body = body[:10] + b'x' * 10
+            self.send_response(200)
+            self.send_header('Content-Encoding',
+                             'deflate' if self.path == '/deflate' else 'gzip')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == '/long':
+            body = b'<div id="weather"><div>+5</div></div>' + \
+                b'<p>footer</p>' * 100000
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == '/slow':
+            with self.server.lock:
+                self.server.active += 1
+                self.server.max_active = max(self.server.max_active,
+                                             self.server.active)
+            time.sleep(0.1)
+            with self.server.lock:
+                self.server.active -= 1
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path == '/page':
+            body = 'Погода'.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_error(404)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHTTPTransport(unittest.TestCase):
+    """ Test transport against local stand-in server """
+
+    def setUp(self):
+        self.server = ThreadingServer(('127.0.0.1', 0), StandInHandler)
+        self.server.clients = set()
+        self.server.proxied = []
+        self.server.lock = threading.Lock()
+        self.server.active = 0  # requests handled now
+        self.server.max_active = 0
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.URL = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.transport = HTTPTransport()
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_request(self):
+        """ Test loading a page """
+
+        response = self.transport.request(self.URL + '/page')
+
+        self.assertEqual(response.status, 200)
+        self.assertEqual(str(response.body, encoding='utf-8'), 'Погода')
+
+    def test_compressed(self):
+        """ Test loading gzip encoded page """
+
+        response = self.transport.request(self.URL + '/gzip')
+
+        self.assertEqual(response.body, b'Pogoda ' * 100)
+        self.assertLess(response.wire_size, len(response.body))
+        self.assertEqual(self.transport.stats,
+                         {'Received': response.wire_size, 'Pages': 700})
+
+    def test_raw_deflate(self):
+        """ Test loading deflate page without zlib header """
+
+        for end_markers in (None, [('div', 'id="weather"')]):
+            response = self.transport.request(self.URL + '/deflate',
+                                              end_markers=end_markers)
+
+            self.assertEqual(response.body, b'Pogoda ' * 100)
+
+    def test_broken_page(self):
+        """ Test broken compressed page is loading error """
+
+        for end_markers in (None, [('div', 'id="weather"')]):
+            with self.assertRaises(URLError):
+                self.transport.request(self.URL + '/broken',
+                                       end_markers=end_markers)
+
+    def test_end_markers(self):
+        """ Test stopping page loading after marked block """
+
+        response = self.transport.request(
+            self.URL + '/long', end_markers=[('div', 'id="weather"')])
+
+        self.assertTrue(response.truncated)
+        self.assertTrue(response.body.startswith(
+            b'<div id="weather"><div>+5</div></div>'))
+        self.assertLess(response.wire_size, 1400000)
+
+        # cut connection is not reused
+        self.transport.request(self.URL + '/page')
+        self.assertEqual(len(self.server.clients), 2)
+
+    def test_keep_alive(self):
+        """ Test reusing connection for next requests """
+
+        for i in range(3):
+            self.transport.request(self.URL + '/page')
+
+        # all requests came from the same client socket
+        self.assertEqual(len(self.server.clients), 1)
+
+    def test_redirect(self):
+        """ Test following redirects """
+
+        response = self.transport.request(self.URL + '/moved')
+
+        self.assertEqual(response.URL, self.URL + '/page')
+        self.assertEqual(str(response.body, encoding='utf-8'), 'Погода')
+
+    def test_http_error(self):
+        """ Test raising error on missing page """
+
+        with self.assertRaises(HTTPError):
+            self.transport.request(self.URL + '/missing')
+
+    def test_hosts(self):
+        """ Test connecting to stand-in server instead of real host """
+
+        self.transport.hosts['www.weather.test'] = '127.0.0.1'
+        port = self.server.server_address[1]
+
+        response = self.transport.request(
+            f"http://www.weather.test:{port}/page")
+
+        self.assertEqual(response.status, 200)
+
+    def test_host_connections(self):
+        """ Test limiting requests to one host at the same time """
+
+        self.transport.host_connections = 2
+        threads = [threading.Thread(target=self.transport.request,
+                                    args=(self.URL + '/slow',))
+                   for i in range(5)]
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.server.max_active, 2)
+
+    def test_host_rate(self):
+        """ Test limiting rate of requests to one host """
+
+        self.transport.host_rate = 600  # 10 a second
+        self.transport.host_burst = 2
+        start_time = time.monotonic()
+
+        for i in range(4):
+            self.transport.request(self.URL + '/page')
+
+        # two requests at once, then two more a tenth of second apart
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.19)
+
+    def test_proxy(self):
+        """ Test loading page through HTTP proxy """
+
+        transport = HTTPTransport(proxies={
+            'http': 'http://user:secret@' + self.URL[len('http://'):],
+            'no': 'localhost'})
+
+        transport.request('http://www.weather.test/page?city=1')
+        transport.close()
+
+        self.assertEqual(self.server.proxied,
+                         [('http://www.weather.test/page?city=1',
+                           'Basic dXNlcjpzZWNyZXQ=')])
+
+    def test_no_proxy(self):
+        """ Test connecting hosts listed in no_proxy directly """
+
+        transport = HTTPTransport(proxies={'http': 'http://127.0.0.1:9',
+                                           'no': '127.0.0.1'})
+
+        response = transport.request(self.URL + '/page')
+        transport.close()
+
+        self.assertEqual(response.status, 200)
+        self.assertEqual(self.server.proxied, [])
+        self.assertEqual(self.transport.get_proxy('ftp', 'weather.test'),
+                         None)
+
+    def test_set_transport(self):
+        """ Test replacing shared transport """
+
+        previous = set_transport(self.transport)
+        try:
+            self.assertIs(get_transport(), self.transport)
+        finally:
+            set_transport(previous)
+
+
+class TestTokenBucket(unittest.TestCase):
+    """ Test rate limit of requests """
+
+    def test_priority(self):
+        """ Test waiting user request goes before background one """
+
+        bucket = TokenBucket(rate=10, burst=1)
+        bucket.acquire()  # bucket is empty now
+        order = []
+
+        def acquire(name):
+            if name == 'background':
+                with background():
+                    bucket.acquire(get_priority())
+            else:
+                bucket.acquire(get_priority())
+            order.append(name)
+
+        threads = [threading.Thread(target=acquire, args=(name,))
+                   for name in ['background', 'user']]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.02)
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(order, ['user', 'background'])
+
+
+class TestBlockMarker(unittest.TestCase):
+    """ Test finding end of page block """
+
+    def test_search(self):
+        """ Test searching block loaded by parts """
+
+        page = b'<div class="top"></div><div id="temp"><div>+5</div>' + \
+            b'<div>+7</div></div><div>footer</div>'
+        marker = BlockMarker('div', 'id="temp"')
+
+        # feed page by small parts, block ends at the first closing tag
+        # of the same depth, nested tags are skipped
+        for end in range(1, len(page)):
+            if marker.search(page[:end]):
+                break
+
+        self.assertEqual(page[:end], page[:page.index(b'<div>footer')])
+
+
+if __name__ == "__main__":
+    unittest.main()